@@ -7,6 +7,19 @@ class Settings(BaseSettings):
     # DB mặc định: bạn có thể override bằng biến môi trường DB_URL hoặc file .env
     DB_URL: str = "mysql+pymysql://root:@localhost:3306/Admission_Management_System?charset=utf8mb4"
 
+    # Connection pool (bỏ qua với SQLite :memory:). Nên để pool_size + max_overflow
+    # >= số thread đồng thời (anyio threadpool mặc định 40) để request không phải chờ.
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0      # giây chờ lấy connection trước khi lỗi
+    DB_POOL_RECYCLE: int = 3600
+    DB_POOL_USE_LIFO: bool = True      # LIFO: connection dư tự nhàn rỗi và bị recycle
+
+    # Read replica (để trống = tắt). Request GET (kể cả export / in hàng loạt) đọc
+    # từ replica; replica không trả lời SELECT 1 thì tự quay về primary.
+    DB_REPLICA_URL: str = ""
+    DB_REPLICA_HEALTH_SEC: float = 5.0  # chu kỳ kiểm tra replica
+
     # Đường dẫn font Times New Roman (có thể override bằng ENV)
     FONT_PATH: str = "assets/TimesNewRoman.ttf"
     FONT_PATH_BOLD: str = "assets/TimesNewRoman-Bold.ttf"
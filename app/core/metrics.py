@@ -0,0 +1,404 @@
+# app/core/metrics.py
+"""
+Số liệu dạng Prometheus (text format 0.0.4) cho GET /metrics — không cần
+prometheus_client.
+
+- Counter / Gauge / Histogram giữ trong RAM của process; mỗi lần ghi chỉ 1 lần
+  lấy lock + cộng số (histogram: bisect tìm bucket).
+- Số liệu "trạng thái" (pool DB, cache, hàng đợi) không ghi liên tục mà lấy
+  lúc scrape qua collector đăng ký bằng register_collector().
+- MetricsMiddleware (ngoài cùng): đếm request + latency theo route template
+  (/api/applicants/{ma_so_hv}, không theo path thật) và status, số request
+  đang xử lý.
+
+Chạy nhiều worker uvicorn: đặt METRICS_MULTIPROC_DIR (thư mục dùng chung, mỗi
+lần deploy nên dọn). Mỗi worker ghi snapshot của mình ra metrics_<pid>.json mỗi
+METRICS_FLUSH_SEC giây (ghi file tạm rồi os.replace); worker nhận scrape gộp tất
+cả: counter/histogram cộng lại, gauge cộng hoặc lấy max tuỳ loại (chỉ tính worker
+còn ghi file trong 3 chu kỳ flush). File của worker đã chết quá METRICS_STALE_SEC
+bị xoá (counter của nó biến mất -> Prometheus coi như reset, rate() vẫn đúng).
+"""
+from __future__ import annotations
+
+import bisect
+import functools
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from starlette.routing import Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+log = logging.getLogger("metrics")
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # rỗng = không cần Bearer token
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+METRICS_FLUSH_SEC = float(os.getenv("METRICS_FLUSH_SEC", "5"))
+METRICS_STALE_SEC = float(os.getenv("METRICS_STALE_SEC", "3600"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+RENDER_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6, 256e6)
+BCRYPT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+# ---------------- kiểu số liệu ----------------
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), agg: str = "sum"):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.agg = agg  # gộp gauge giữa các worker: sum | max
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def samples(self) -> List[list]:
+        with self._lock:
+            return [[list(k), v] for k, v in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, n: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + n
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def inc(self, *labels: str, n: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + n
+
+    def dec(self, *labels: str, n: float = 1.0) -> None:
+        self.inc(*labels, n=-n)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            ent = self._values.get(labels)
+            if ent is None:
+                # [đếm theo bucket (không cộng dồn, phần tử cuối = +Inf), sum, count]
+                ent = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            ent[0][i] += 1
+            ent[1] += value
+            ent[2] += 1
+
+    def samples(self) -> List[list]:
+        with self._lock:
+            return [[list(k), [list(v[0]), v[1], v[2]]] for k, v in self._values.items()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[_Metric, Sequence[str], float]]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Trùng tên metric {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=(), agg="sum") -> Gauge:
+        return self.register(Gauge(name, help, labelnames, agg))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def register_collector(self, fn: Callable[[], Iterable[Tuple[_Metric, Sequence[str], float]]]) -> None:
+        """fn() trả [(metric, labels, value)] — chạy lúc scrape/flush, gán đè giá trị."""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def _run_collectors(self) -> None:
+        for fn in list(self._collectors):
+            try:
+                for metric, labels, value in fn():
+                    with metric._lock:
+                        metric._values[tuple(str(x) for x in labels)] = float(value)
+            except Exception:
+                log.exception("Collector metric lỗi: %r", fn)
+
+    def snapshot(self) -> dict:
+        self._run_collectors()
+        out = {}
+        for m in list(self._metrics.values()):
+            d = {"kind": m.kind, "help": m.help, "labels": list(m.labelnames), "samples": m.samples()}
+            if m.kind == "gauge":
+                d["agg"] = m.agg
+            if m.kind == "histogram":
+                d["buckets"] = list(m.buckets)
+            out[m.name] = d
+        return out
+
+
+REGISTRY = Registry()
+register_collector = REGISTRY.register_collector
+
+# ---------------- metric dùng chung ----------------
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "Số request HTTP theo method, route template, status", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Thời gian xử lý request (tới khi gửi xong body)", ("method", "route", "status"))
+HTTP_IN_PROGRESS = REGISTRY.gauge("http_requests_in_progress", "Số request đang xử lý")
+
+RENDER_SECONDS = REGISTRY.histogram(
+    "export_render_seconds", "Thời gian dựng file export/in (pdf, xlsx, csv...)", ("format",), RENDER_BUCKETS)
+RENDER_BYTES = REGISTRY.histogram(
+    "export_render_bytes", "Kích thước file export/in", ("format",), SIZE_BUCKETS)
+
+BCRYPT_SECONDS = REGISTRY.histogram(
+    "bcrypt_duration_seconds", "Thời gian chạy bcrypt trên pool băm", ("op",), BCRYPT_BUCKETS)
+BCRYPT_WAIT = REGISTRY.histogram(
+    "bcrypt_queue_wait_seconds", "Thời gian chờ trong hàng đợi pool băm", ("op",), BCRYPT_BUCKETS)
+LOGINS = REGISTRY.counter("login_attempts_total", "Số lần đăng nhập theo kết quả", ("result",))
+AUDIT_RECORDS = REGISTRY.counter("audit_records_total", "Số dòng audit đã ghi", ("status",))
+
+
+def observe_render(fmt: str, seconds: float, data) -> None:
+    RENDER_SECONDS.observe(seconds, fmt)
+    if isinstance(data, (bytes, bytearray)):
+        RENDER_BYTES.observe(len(data), fmt)
+
+
+def observed_render(fmt: str):
+    """Decorator cho hàm render trả bytes: ghi thời gian + kích thước."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            data = fn(*args, **kwargs)
+            observe_render(fmt, time.perf_counter() - t0, data)
+            return data
+        return wrapper
+    return deco
+
+
+# ---------------- xuất text ----------------
+def _esc(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_esc(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def render_text(snap: dict) -> str:
+    lines: List[str] = []
+    for name in sorted(snap):
+        m = snap[name]
+        if not m["samples"]:
+            continue
+        lines.append(f"# HELP {name} {m['help']}")
+        lines.append(f"# TYPE {name} {m['kind']}")
+        names = m["labels"]
+        for labels, value in sorted(m["samples"], key=lambda s: s[0]):
+            if m["kind"] != "histogram":
+                lines.append(f"{name}{_labels(names, labels)} {_num(value)}")
+                continue
+            counts, total, count = value
+            acc = 0
+            for le, c in zip(list(m["buckets"]) + [float("inf")], counts):
+                acc += c
+                le_label = 'le="%s"' % _num(le)
+                lines.append(f"{name}_bucket{_labels(names, labels, le_label)} {acc}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {_num(total)}")
+            lines.append(f"{name}_count{_labels(names, labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------- nhiều worker ----------------
+def _merge(snaps: Iterable[Tuple[dict, bool]]) -> dict:
+    """snaps: [(snapshot, còn sống)]; gauge của worker không còn ghi file thì bỏ."""
+    out: Dict[str, dict] = {}
+    for snap, alive in snaps:
+        for name, m in snap.items():
+            if m["kind"] == "gauge" and not alive:
+                continue
+            cur = out.get(name)
+            if cur is None:
+                out[name] = cur = dict(m, samples={})
+            for labels, value in m["samples"]:
+                key = tuple(labels)
+                old = cur["samples"].get(key)
+                if old is None:
+                    cur["samples"][key] = value
+                elif m["kind"] == "histogram":
+                    if len(old[0]) == len(value[0]):
+                        cur["samples"][key] = [[a + b for a, b in zip(old[0], value[0])], old[1] + value[1], old[2] + value[2]]
+                elif m.get("agg") == "max":
+                    cur["samples"][key] = max(old, value)
+                else:
+                    cur["samples"][key] = old + value
+    for m in out.values():
+        m["samples"] = [[list(k), v] for k, v in m["samples"].items()]
+    return out
+
+
+class MultiprocessStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.pid = os.getpid()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"metrics_{os.getpid()}.json")
+
+    def flush(self) -> None:
+        path = self.path
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(REGISTRY.snapshot(), f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def collect(self) -> dict:
+        self.flush()
+        now = time.time()
+        snaps = []
+        for p in glob.glob(os.path.join(self.directory, "metrics_*.json")):
+            try:
+                age = now - os.path.getmtime(p)
+                if age > METRICS_STALE_SEC:
+                    os.remove(p)  # worker đã chết từ lâu
+                    continue
+                with open(p, encoding="utf-8") as f:
+                    snaps.append((json.load(f), age <= 3 * METRICS_FLUSH_SEC))
+            except (OSError, ValueError):
+                continue  # file đang bị thay / vừa bị xoá
+        return _merge(snaps)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+
+        def _loop():
+            while not self._stop.wait(METRICS_FLUSH_SEC):
+                try:
+                    self.flush()
+                except Exception:
+                    log.exception("Không ghi được snapshot metrics")
+
+        self._thread = threading.Thread(target=_loop, name="metrics-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+
+_store = MultiprocessStore(METRICS_MULTIPROC_DIR) if METRICS_MULTIPROC_DIR else None
+
+
+def start() -> None:
+    if _store is not None:
+        _store.start()
+
+
+def stop() -> None:
+    if _store is not None:
+        _store.stop()
+
+
+def generate_latest() -> str:
+    """Nội dung /metrics: của process này, hoặc gộp mọi worker (multiprocess)."""
+    snap = _store.collect() if _store is not None else REGISTRY.snapshot()
+    return render_text(snap)
+
+
+# ---------------- middleware ----------------
+def _route_label(scope: Scope) -> str:
+    """
+    Route template đầy đủ, vd /api/applicants/{ma_so_hv}. Router include có
+    prefix (/api hay alias không prefix) thì route chỉ biết phần path của nó ->
+    dựng lại phần đó từ path_params, phần còn lại đầu path thật là prefix.
+    """
+    route = scope.get("route")
+    path = scope.get("path", "")
+    if route is None or isinstance(route, Mount):
+        # web/ mount ở "/" -> gộp 1 nhãn, tránh bùng nhãn theo từng file
+        return "static" if "." in path.rsplit("/", 1)[-1] else "unmatched"
+    tpl = getattr(route, "path", None)
+    if not tpl:
+        return "unmatched"
+    params = scope.get("path_params") or {}
+    try:
+        local = tpl.format(**params) if params else tpl
+    except (KeyError, IndexError, ValueError):
+        return tpl
+    if path.endswith(local):
+        return path[: len(path) - len(local)] + tpl
+    return tpl
+
+
+class MetricsMiddleware:
+    """Ngoài cùng: latency tính cả mọi middleware bên trong + thời gian gửi body."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        t0 = time.perf_counter()
+        HTTP_IN_PROGRESS.inc()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            labels = (scope.get("method", ""), _route_label(scope), str(status))
+            HTTP_REQUESTS.inc(*labels)
+            HTTP_LATENCY.observe(time.perf_counter() - t0, *labels)
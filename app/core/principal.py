@@ -0,0 +1,130 @@
+# app/core/principal.py
+"""
+Principal: bản ghi nhẹ của user đăng nhập (id, role, is_active, tên...) dùng cho
+phân quyền, thay cho việc load ORM `User` ở mọi request.
+
+Mỗi worker giữ một cache TTL ngắn theo uid. Admin sửa/khoá/reset user thì gọi
+`principal_cache.invalidate(uid)` để worker hiện tại thấy ngay; các worker
+khác tự cập nhật khi entry hết hạn (PRINCIPAL_CACHE_TTL_SEC).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.db.session import SessionLocal
+from app.models.user import User
+
+PRINCIPAL_CACHE_TTL_SEC = float(os.getenv("PRINCIPAL_CACHE_TTL_SEC", "30"))
+PRINCIPAL_CACHE_MAX = int(os.getenv("PRINCIPAL_CACHE_MAX", "2000"))
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    username: Optional[str]
+    email: Optional[str]
+    full_name: Optional[str]
+    role: str
+    is_active: bool
+    must_change_password: bool
+
+    @property
+    def display_name(self) -> Optional[str]:
+        return self.full_name or self.username or self.email
+
+
+_COLUMNS = (
+    User.id, User.username, User.email, User.full_name,
+    User.role, User.is_active, User.must_change_password,
+)
+
+
+def load_principal(uid: int) -> Optional[Principal]:
+    """1 câu SELECT theo PK, chỉ các cột cần cho phân quyền."""
+    db = SessionLocal()
+    try:
+        r = db.query(*_COLUMNS).filter(User.id == uid).first()
+    finally:
+        db.close()
+    if r is None:
+        return None
+    return Principal(
+        id=r.id,
+        username=r.username,
+        email=r.email,
+        full_name=r.full_name,
+        role=r.role,
+        is_active=bool(r.is_active),
+        must_change_password=bool(r.must_change_password),
+    )
+
+
+class PrincipalCache:
+    def __init__(self, ttl_sec: float = PRINCIPAL_CACHE_TTL_SEC, max_entries: int = PRINCIPAL_CACHE_MAX):
+        self.ttl_sec = ttl_sec
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[int, tuple]" = OrderedDict()  # uid -> (hết hạn, Principal|None)
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, uid: int):
+        """(có trong cache?, Principal) — không chạm DB."""
+        now = time.monotonic()
+        with self._lock:
+            ent = self._data.get(uid)
+            if ent and ent[0] > now:
+                self._data.move_to_end(uid)
+                self.hits += 1
+                return True, ent[1]
+        return False, None
+
+    def get(self, uid: int) -> Optional[Principal]:
+        uid = int(uid)
+        hit, p = self._lookup(uid)
+        return p if hit else self._load(uid)
+
+    async def aget(self, uid: int) -> Optional[Principal]:
+        """Như get() cho code async: cache hit trả ngay trên event loop, miss mới sang threadpool."""
+        uid = int(uid)
+        hit, p = self._lookup(uid)
+        return p if hit else await run_in_threadpool(self._load, uid)
+
+    def _load(self, uid: int) -> Optional[Principal]:
+        with self._lock:
+            self.misses += 1
+        p = load_principal(uid)
+        if self.ttl_sec > 0:
+            with self._lock:
+                self._data[uid] = (time.monotonic() + self.ttl_sec, p)
+                self._data.move_to_end(uid)
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+        return p
+
+    def invalidate(self, uid: int) -> None:
+        with self._lock:
+            self._data.pop(int(uid), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "ttl_sec": self.ttl_sec,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+principal_cache = PrincipalCache()
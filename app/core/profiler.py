@@ -0,0 +1,404 @@
+# app/core/profiler.py
+"""
+Profile theo yêu cầu cho 1 request, chỉ dành cho Admin.
+
+Bật bằng header `X-Profile: 1` hoặc query `?__profile=1` (session phải là Admin
+đang active — kiểm tra qua principal cache, không tin role lưu trong cookie).
+Request chạy bình thường, kèm một sampling profiler: thread nền mỗi
+PROFILE_INTERVAL_MS lấy stack (sys._current_frames) của các thread đang làm việc
+cho request:
+  - thread event loop (route async, middleware)
+  - thread threadpool đã chạy SQL cho request (route sync) — ghi nhận từ hook
+    SQL của query_stats
+Mẫu đang chờ (selector/Condition.wait/queue) bị bỏ, chỉ đếm số lượng. Vì lấy mẫu
+theo thread nên nếu cùng lúc thread đó phục vụ request khác thì mẫu của request
+kia cũng lẫn vào — profile lúc ít tải cho sạch.
+
+Báo cáo (top hàm theo self/total, cây gọi đã tỉa, danh sách SQL) lưu JSON ở
+PROFILE_DIR (dùng chung giữa các worker), xem ở GET /admin/profiles/{correlation_id}.
+Giữ tối đa PROFILE_KEEP báo cáo / PROFILE_TTL_SEC giây. Tối đa
+PROFILE_MAX_CONCURRENT request được profile cùng lúc; vượt thì request chạy
+bình thường và response có `X-Profile: busy`.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+log = logging.getLogger("profiler")
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "1") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, ".cache", "profiles"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+PROFILE_MAX_SEC = float(os.getenv("PROFILE_MAX_SEC", "120"))  # quá thì ngừng lấy mẫu
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_TTL_SEC = float(os.getenv("PROFILE_TTL_SEC", str(7 * 24 * 3600)))
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "40"))
+PROFILE_TREE_MIN_PCT = float(os.getenv("PROFILE_TREE_MIN_PCT", "1"))
+PROFILE_MAX_SQL = int(os.getenv("PROFILE_MAX_SQL", "500"))
+PROFILE_MAX_DEPTH = 128
+
+_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+_LIB_RE = re.compile(r".*[/\\](?:site-packages|lib[/\\]python[\d.]+)[/\\]")
+# đỉnh stack "đang chờ": thread rảnh / event loop đang select hoặc đọc self-pipe
+_IDLE_FILES = ("selectors.py", "threading.py", "queue.py")
+_IDLE_FUNCS = ("_read_from_self",)
+
+Frame = Tuple[str, str, int]  # (file, hàm, dòng bắt đầu hàm)
+
+
+def safe_profile_id(cid: Optional[str]) -> str:
+    """Correlation id từ client có thể là chuỗi bất kỳ -> chỉ dùng làm tên file khi hợp lệ."""
+    return cid if cid and _ID_RE.match(cid) else uuid.uuid4().hex
+
+
+def _short_path(path: str) -> str:
+    """app/... cho code dự án, phần sau site-packages / lib/pythonX.Y cho thư viện."""
+    if path.startswith(BASE_DIR + os.sep):
+        return os.path.relpath(path, BASE_DIR)
+    m = _LIB_RE.search(path)
+    return path[m.end():] if m else path
+
+
+def _fmt_frame(f: Frame) -> str:
+    return f"{_short_path(f[0])}:{f[2]}({f[1]})"
+
+
+# ---------------- phiên profile ----------------
+class ProfileSession:
+    def __init__(self, profile_id: str, scope: Scope, stats, loop_thread: int):
+        self.id = profile_id
+        self.method = scope.get("method")
+        self.path = scope.get("path")
+        self.query = (scope.get("query_string") or b"").decode("latin-1")
+        self.started_at = datetime.utcnow()
+        self.t0 = time.perf_counter()
+        self.loop_thread = loop_thread
+        self.stats = stats  # RequestQueryStats (None nếu không có QueryStatsMiddleware)
+        self.samples: Counter = Counter()  # tuple(stack root->leaf) -> số mẫu
+        self.idle = 0
+        self.ticks = 0
+        self.ended: Optional[float] = None
+        self.status: Optional[int] = None
+        self.user: Optional[str] = None
+
+    def threads(self) -> set:
+        out = {self.loop_thread}
+        extra = self.stats.threads if self.stats is not None else None
+        if extra:
+            try:
+                out.update(extra)
+            except RuntimeError:  # hook SQL vừa thêm thread mới; lần sau lấy
+                pass
+        return out
+
+    def take(self, frames: Dict[int, object]) -> None:
+        self.ticks += 1
+        for tid in self.threads():
+            frame = frames.get(tid)
+            if frame is None:
+                continue
+            stack: List[Frame] = []
+            while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_name, code.co_firstlineno))
+                frame = frame.f_back
+            if not stack or stack[0][0].endswith(_IDLE_FILES) or stack[0][1] in _IDLE_FUNCS:
+                self.idle += 1
+                continue
+            stack.reverse()
+            self.samples[tuple(stack)] += 1
+
+    # ---------- báo cáo ----------
+    def report(self) -> dict:
+        total = sum(self.samples.values())
+        duration_ms = ((self.ended or time.perf_counter()) - self.t0) * 1000
+        # mỗi tick lấy 1 mẫu / thread -> 1 mẫu ~ thời gian thật giữa 2 tick
+        sampled_ms = min(duration_ms, PROFILE_MAX_SEC * 1000)
+        ms_per = sampled_ms / self.ticks if self.ticks else PROFILE_INTERVAL_MS
+        self_cnt: Counter = Counter()
+        cum_cnt: Counter = Counter()
+        tree: dict = {"n": 0, "c": {}}
+        for stack, n in self.samples.items():
+            self_cnt[stack[-1]] += n
+            for f in set(stack):  # đệ quy chỉ tính 1 lần
+                cum_cnt[f] += n
+            node = tree
+            node["n"] += n
+            for f in stack:
+                node = node["c"].setdefault(f, {"n": 0, "c": {}})
+                node["n"] += n
+
+        def _top(cnt: Counter) -> list:
+            return [
+                {
+                    "function": _fmt_frame(f),
+                    "self_ms": round(self_cnt[f] * ms_per, 1),
+                    "total_ms": round(cum_cnt[f] * ms_per, 1),
+                    "self_pct": round(100.0 * self_cnt[f] / total, 1) if total else 0.0,
+                    "total_pct": round(100.0 * cum_cnt[f] / total, 1) if total else 0.0,
+                }
+                for f, _ in cnt.most_common(PROFILE_TOP_N)
+            ]
+
+        min_n = total * PROFILE_TREE_MIN_PCT / 100.0
+
+        def _prune(node: dict) -> list:
+            out = []
+            for f, child in sorted(node["c"].items(), key=lambda kv: -kv[1]["n"]):
+                if child["n"] < min_n:
+                    continue
+                out.append({
+                    "function": _fmt_frame(f),
+                    "ms": round(child["n"] * ms_per, 1),
+                    "pct": round(100.0 * child["n"] / total, 1),
+                    "children": _prune(child),
+                })
+            return out
+
+        stats = self.stats
+        sql = list(stats.statements or []) if stats is not None else []
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "status": self.status,
+            "user": self.user,
+            "started_at": self.started_at.isoformat() + "Z",
+            "duration_ms": round(duration_ms, 1),
+            "profiler": {"mode": "sampling", "interval_ms": PROFILE_INTERVAL_MS, "ms_per_sample": round(ms_per, 3)},
+            "samples": total,
+            "idle_samples": self.idle,
+            "db": stats.as_dict() if stats is not None else None,
+            "top_self": _top(self_cnt),
+            "top_total": _top(cum_cnt),
+            "call_tree": _prune(tree),
+            "sql": [{"sql": s, "ms": round(ms, 2)} for s, ms in sql[:PROFILE_MAX_SQL]],
+            "sql_truncated": max(0, len(sql) - PROFILE_MAX_SQL),
+        }
+
+
+class Sampler:
+    """1 thread nền dùng chung cho mọi phiên; tự dừng khi không còn phiên nào."""
+
+    def __init__(self, max_concurrent: int = PROFILE_MAX_CONCURRENT):
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self._sessions: List[ProfileSession] = []
+        self._thread: Optional[threading.Thread] = None
+        self.rejected = 0
+
+    def start(self, session: ProfileSession) -> bool:
+        with self._lock:
+            if len(self._sessions) >= self.max_concurrent:
+                self.rejected += 1
+                return False
+            self._sessions.append(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="profiler", daemon=True)
+                self._thread.start()
+        return True
+
+    def stop(self, session: ProfileSession) -> None:
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+
+    def active(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def _loop(self) -> None:
+        interval = PROFILE_INTERVAL_MS / 1000.0
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                sessions = list(self._sessions)
+                if not sessions:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            frames.pop(me, None)
+            now = time.perf_counter()
+            for s in sessions:
+                if now - s.t0 <= PROFILE_MAX_SEC:
+                    s.take(frames)
+            del frames
+            time.sleep(interval)
+
+
+sampler = Sampler()
+
+
+# ---------------- lưu trữ ----------------
+class ProfileStore:
+    def __init__(self, directory: str, keep: int = PROFILE_KEEP, ttl_sec: float = PROFILE_TTL_SEC):
+        self.directory = directory
+        self.keep = keep
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+
+    def _path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.json")
+
+    def save(self, report: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(report["id"])
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self.prune()
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        if not _ID_RE.match(profile_id or ""):
+            return None
+        try:
+            with open(self._path(profile_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _files(self) -> List[Tuple[float, str]]:
+        out = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return out
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            p = os.path.join(self.directory, name)
+            try:
+                out.append((os.path.getmtime(p), p))
+            except OSError:
+                continue
+        out.sort(reverse=True)
+        return out
+
+    def list(self) -> List[dict]:
+        out = []
+        for mtime, p in self._files():
+            try:
+                with open(p, encoding="utf-8") as f:
+                    r = json.load(f)
+            except (OSError, ValueError):
+                continue
+            out.append({k: r.get(k) for k in ("id", "method", "path", "status", "user", "started_at", "duration_ms", "samples")})
+        return out
+
+    def prune(self) -> int:
+        removed = 0
+        with self._lock:
+            now = time.time()
+            for i, (mtime, p) in enumerate(self._files()):
+                if i >= self.keep or now - mtime > self.ttl_sec:
+                    try:
+                        os.remove(p)
+                        removed += 1
+                    except OSError:
+                        pass
+        return removed
+
+
+profile_store = ProfileStore(PROFILE_DIR)
+
+
+# ---------------- middleware ----------------
+def _wants_profile(scope: Scope) -> bool:
+    for k, v in scope.get("headers") or ():
+        if k == b"x-profile":
+            return v.strip() == b"1"
+    qs = scope.get("query_string") or b""
+    return b"__profile=1" in qs.split(b"&")
+
+
+class ProfilerMiddleware:
+    """
+    Đặt BÊN TRONG session middleware (cần scope["session"]) và QueryStatsMiddleware
+    (cần request.state.query_stats để lấy SQL); bên ngoài RequestPolicyMiddleware.
+    """
+
+    def __init__(self, app: ASGIApp, load_principal=None) -> None:
+        self.app = app
+        self.load_principal = load_principal  # async (uid) -> Principal | None
+
+    async def _admin_name(self, scope: Scope) -> Optional[str]:
+        uid = (scope.get("session") or {}).get("uid")
+        if not uid or self.load_principal is None:
+            return None
+        try:
+            p = await self.load_principal(uid)
+        except Exception:
+            return None
+        if p is None or not p.is_active or p.role != "Admin":
+            return None
+        return p.username or str(p.id)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not PROFILE_ENABLED or not _wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        user = await self._admin_name(scope)
+        if user is None:
+            await self.app(scope, receive, send)  # không phải Admin: bỏ qua lặng lẽ
+            return
+
+        state = scope.setdefault("state", {})
+        stats = state.get("query_stats")
+        session = ProfileSession("", scope, stats, threading.get_ident())
+        session.user = user
+        if not sampler.start(session):
+            async def send_busy(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    MutableHeaders(scope=message)["X-Profile"] = "busy"
+                await send(message)
+
+            await self.app(scope, receive, send_busy)
+            return
+
+        if stats is not None:
+            stats.statements = []
+            stats.threads = set()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                session.status = message["status"]
+                # correlation id do RequestPolicyMiddleware (bên trong) gắn vào scope
+                session.id = safe_profile_id(state.get("correlation_id"))
+                h = MutableHeaders(scope=message)
+                h["X-Profile"] = session.id
+                h["X-Profile-Url"] = f"/admin/profiles/{session.id}"
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop(session)
+            session.ended = time.perf_counter()
+            if not session.id:
+                session.id = safe_profile_id(state.get("correlation_id"))
+            try:
+                await run_in_threadpool(lambda: profile_store.save(session.report()))
+            except Exception:
+                log.exception("Không lưu được profile %s", session.id)
+            if stats is not None:
+                stats.statements = None
+                stats.threads = None
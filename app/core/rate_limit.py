@@ -0,0 +1,124 @@
+# app/core/rate_limit.py
+"""
+Giới hạn tần suất bằng token bucket, giữ trong RAM của process.
+
+Mỗi key (username / IP) có một "xô" tối đa `burst` token, hồi `per_min` token
+mỗi phút; mỗi lần thử tốn 1 token, hết token -> từ chối kèm số giây cần chờ.
+Xô đã hồi đầy thì không khác gì chưa từng có -> định kỳ dọn (compaction) để
+bảng key không phình theo số IP lạ.
+"""
+from __future__ import annotations
+
+import heapq
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+from fastapi import HTTPException, Request
+
+# Theo username: 5 lần liên tiếp, sau đó 5 lần/phút
+LOGIN_USER_BURST = int(os.getenv("LOGIN_USER_BURST", "5"))
+LOGIN_USER_PER_MIN = float(os.getenv("LOGIN_USER_PER_MIN", "5"))
+# Theo IP (cả văn phòng có thể chung 1 IP NAT -> rộng hơn)
+LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", "30"))
+LOGIN_IP_PER_MIN = float(os.getenv("LOGIN_IP_PER_MIN", "30"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "50000"))
+RATE_LIMIT_COMPACT_SEC = int(os.getenv("RATE_LIMIT_COMPACT_SEC", "60"))
+# Vượt RATE_LIMIT_MAX_KEYS thì cắt bảng xuống tỉ lệ này (90%)
+RATE_LIMIT_LOW_WATER = float(os.getenv("RATE_LIMIT_LOW_WATER", "0.9"))
+
+
+class TokenBucketLimiter:
+    def __init__(self, name: str, burst: int, per_min: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.name = name
+        self.burst = max(1, burst)
+        self.rate = max(per_min, 0.001) / 60.0  # token / giây
+        self.max_keys = max(1, max_keys)
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, thời điểm cập nhật)
+        self._next_compact = time.monotonic() + RATE_LIMIT_COMPACT_SEC
+        self.allowed = 0
+        self.throttled = 0
+
+    def _compact_locked(self, now: float) -> None:
+        full_after = self.burst / self.rate
+        for k in [k for k, (_, ts) in self._buckets.items() if now - ts >= full_after]:
+            del self._buckets[k]
+        if len(self._buckets) > self.max_keys:
+            # vẫn quá nhiều (đang bị quét) -> cắt xuống mức thấp để lần sau còn
+            # chỗ trống, không phải dọn lại ở mỗi key mới. Bỏ các xô gần đầy
+            # trước: xô đang cạn (key đang bị chặn) bị bỏ cuối cùng, nên kẻ quét
+            # không thể làm "hồi" xô của nạn nhân bằng cách đẩy nhiều key lạ.
+            low_water = max(1, int(self.max_keys * RATE_LIMIT_LOW_WATER))
+            evict = heapq.nlargest(
+                len(self._buckets) - low_water,
+                self._buckets.items(),
+                key=lambda kv: kv[1][0] + (now - kv[1][1]) * self.rate,
+            )
+            for k, _ in evict:
+                del self._buckets[k]
+        self._next_compact = now + RATE_LIMIT_COMPACT_SEC
+
+    def hit(self, key: str) -> Tuple[bool, int]:
+        """Tốn 1 token. Trả (được phép?, số giây nên chờ nếu bị chặn)."""
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_compact or len(self._buckets) > self.max_keys:
+                self._compact_locked(now)
+            tokens, ts = self._buckets.get(key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - ts) * self.rate)
+            if tokens >= 1.0:
+                self._buckets[key] = (tokens - 1.0, now)
+                self.allowed += 1
+                return True, 0
+            self._buckets[key] = (tokens, now)
+            self.throttled += 1
+            return False, max(1, int((1.0 - tokens) / self.rate + 0.999))
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "burst": self.burst,
+                "per_min": round(self.rate * 60, 3),
+                "keys": len(self._buckets),
+                "allowed": self.allowed,
+                "throttled": self.throttled,
+            }
+
+
+login_user_limiter = TokenBucketLimiter("login_user", LOGIN_USER_BURST, LOGIN_USER_PER_MIN)
+login_ip_limiter = TokenBucketLimiter("login_ip", LOGIN_IP_BURST, LOGIN_IP_PER_MIN)
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+def check_login_rate(request: Request, username: str) -> None:
+    """Gọi trước mọi bước verify mật khẩu; vượt ngưỡng -> 429 + Retry-After."""
+    ok, wait = login_ip_limiter.hit(client_ip(request))
+    if ok:
+        ok, wait = login_user_limiter.hit((username or "").strip().lower())
+    if not ok:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Đăng nhập sai quá nhiều lần, vui lòng thử lại sau {wait} giây.",
+            headers={"Retry-After": str(wait)},
+        )
+
+
+def reset_login_rate(username: str) -> None:
+    """Đăng nhập thành công -> xoá xô của username (không phạt lần sau)."""
+    login_user_limiter.reset((username or "").strip().lower())
+
+
+def rate_limit_stats() -> dict:
+    return {
+        "login_user": login_user_limiter.stats(),
+        "login_ip": login_ip_limiter.stats(),
+    }
@@ -0,0 +1,174 @@
+# app/core/request_policy.py
+"""
+Một middleware ASGI thuần gộp 3 chính sách trước đây là 3 `@app.middleware("http")`:
+  1) Correlation-ID: nhận từ header X-Correlation-ID hoặc sinh mới, gắn vào
+     request.state và header response
+  2) Idle timeout : phiên quá IDLE_TIMEOUT_SEC (hoặc session server-side đã bị
+     sweeper xoá) -> API 401 + X-Session-Expired, web redirect /login?expired=1
+  3) Ép đổi mật khẩu lần đầu: must_change_password -> API 403, web /account?first=1
+
+Đường dẫn được phân loại 1 lần (PathClassifier: set tiền tố theo độ dài + cache),
+không còn mỗi middleware tự startswith/endswith lại. Phải đặt BÊN TRONG
+session middleware (add_middleware trước) để scope["session"] đã có.
+"""
+from __future__ import annotations
+
+import uuid
+from functools import lru_cache
+from time import time as _now
+from typing import Dict, Iterable, Set, Tuple
+from urllib.parse import quote
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse, RedirectResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+IDLE_EXEMPT = 1      # bỏ qua kiểm tra idle timeout
+CHANGE_EXEMPT = 2    # bỏ qua ép đổi mật khẩu
+
+
+class PathClassifier:
+    """
+    Khớp tiền tố bằng set theo từng độ dài: path[:n] in prefixes[n] — số phép
+    thử bằng số độ dài khác nhau, không phải số tiền tố. Kết quả cache theo path.
+    """
+
+    def __init__(self, rules: Iterable[Tuple[int, Iterable[str]]], static_exts: Iterable[str], flag_static: int):
+        self._by_len: Dict[int, Dict[str, int]] = {}
+        for flag, prefixes in rules:
+            for p in prefixes:
+                bucket = self._by_len.setdefault(len(p), {})
+                bucket[p] = bucket.get(p, 0) | flag
+        self._lens = sorted(self._by_len)
+        self._exts: Set[str] = {e.lower() for e in static_exts}
+        self._flag_static = flag_static
+        self.classify = lru_cache(maxsize=4096)(self._classify)
+
+    def _classify(self, path: str) -> int:
+        flags = 0
+        for n in self._lens:
+            if n > len(path):
+                break
+            flags |= self._by_len[n].get(path[:n], 0)
+        dot = path.rfind(".")
+        if dot > path.rfind("/") and path[dot:].lower() in self._exts:
+            flags |= self._flag_static
+        return flags
+
+
+class RequestPolicyMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        idle_timeout: int,
+        idle_whitelist: Iterable[str],
+        change_whitelist: Iterable[str],
+        static_exts: Iterable[str],
+        touch_last_seen=None,
+        load_must_change=None,
+    ) -> None:
+        self.app = app
+        self.idle_timeout = idle_timeout
+        self.classifier = PathClassifier(
+            [(IDLE_EXEMPT, idle_whitelist), (CHANGE_EXEMPT, change_whitelist)],
+            static_exts,
+            IDLE_EXEMPT | CHANGE_EXEMPT,
+        )
+        self.touch_last_seen = touch_last_seen
+        # load_must_change(uid) -> bool: chạy ở threadpool khi session chưa có cờ
+        self.load_must_change = load_must_change
+
+    # ---------- responses ----------
+    @staticmethod
+    def _expired_response(scope: Scope, path: str):
+        if path.startswith("/api"):
+            # API: 401 + header để FE biết bật thông báo
+            return JSONResponse(
+                {"detail": "Phiên đăng nhập đã hết hạn, vui lòng đăng nhập lại!"},
+                status_code=401,
+                headers={"X-Session-Expired": "1"},
+            )
+        # Web: đặt cookie cờ + redirect về login?expired=1
+        qs = scope.get("query_string", b"").decode("latin-1")
+        next_q = quote(path + (("?" + qs) if qs else ""))
+        resp = RedirectResponse(url=f"/login?expired=1&next={next_q}", status_code=302)
+        # Cookie *không* httponly để JS đọc và show toast; sống 30 giây
+        resp.set_cookie(
+            key="__session_expired",
+            value="1",
+            max_age=30,
+            path="/",
+            secure=False,
+            httponly=False,
+            samesite="lax",
+        )
+        return resp
+
+    @staticmethod
+    def _force_change_response(path: str):
+        if path.startswith("/api"):
+            return JSONResponse(
+                {"detail": "Vui lòng đổi mật khẩu trước khi tiếp tục.", "force_change": True},
+                status_code=403,
+            )
+        return RedirectResponse(url="/account?first=1", status_code=302)
+
+    # ---------- ASGI ----------
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # 1) Correlation-ID
+        cid = None
+        for k, v in scope.get("headers") or ():
+            if k == b"x-correlation-id":
+                cid = v.decode("latin-1")
+                break
+        cid = cid or str(uuid.uuid4())
+        scope.setdefault("state", {})["correlation_id"] = cid
+
+        async def send_with_cid(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Correlation-ID"] = cid
+            await send(message)
+
+        path = scope.get("path", "")
+        flags = self.classifier.classify(path)
+        sess = scope.get("session")
+        if sess is None or flags == (IDLE_EXEMPT | CHANGE_EXEMPT):
+            await self.app(scope, receive, send_with_cid)
+            return
+
+        uid = sess.get("uid")
+
+        # 2) Idle timeout
+        if not flags & IDLE_EXEMPT:
+            # session phía server đã bị sweeper xoá / thu hồi -> cũng là hết hạn
+            server_expired = bool(scope.get("session_expired"))
+            if uid or server_expired:
+                now = int(_now())
+                last = int(sess.get("_last_seen") or 0)
+                if server_expired or (last and now - last > self.idle_timeout):
+                    sess.clear()
+                    await self._expired_response(scope, path)(scope, receive, send_with_cid)
+                    return
+                if self.touch_last_seen is not None:
+                    self.touch_last_seen(sess, now)
+
+        # 3) Ép đổi mật khẩu lần đầu
+        if uid and not flags & CHANGE_EXEMPT:
+            must_change = sess.get("must_change_password")
+            if must_change is None:
+                # nạp 1 lần rồi cache vào session
+                try:
+                    must_change = bool(await run_in_threadpool(self.load_must_change, uid)) if self.load_must_change else False
+                except Exception:
+                    must_change = False
+                sess["must_change_password"] = must_change
+            if must_change:
+                await self._force_change_response(path)(scope, receive, send_with_cid)
+                return
+
+        await self.app(scope, receive, send_with_cid)
@@ -1,8 +1,17 @@
 # app/core/security.py
 import os
-from typing import Optional
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
 from passlib.context import CryptContext
 
+from app.core.metrics import BCRYPT_SECONDS, BCRYPT_WAIT
+
+log = logging.getLogger("security")
+
 # cấu hình rounds có thể chỉnh qua ENV
 BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
 _pwd = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
@@ -40,3 +49,115 @@ def try_rehash_on_success(plain_password: str, password_hash: str) -> Optional[s
     if needs_rehash(password_hash):
         return hash_password(plain_password)
     return None
+
+
+# ---------------- Executor riêng cho bcrypt ----------------
+# bcrypt ~ vài trăm ms CPU mỗi lần; chạy trong threadpool chung của Starlette thì
+# đầu ca đăng nhập dồn dập sẽ chiếm hết thread của API thường. Dùng pool riêng,
+# giới hạn số việc chờ: vượt ngưỡng -> HashPoolBusy (router trả 503) thay vì xếp hàng mãi.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "32"))  # đang chạy + đang chờ
+
+_hash_executor = ThreadPoolExecutor(max_workers=max(1, HASH_WORKERS), thread_name_prefix="bcrypt")
+_hash_lock = threading.Lock()
+_hash_pending = 0
+_hash_stats = {"completed": 0, "rejected": 0, "rehash_done": 0, "rehash_skipped": 0}
+
+
+class HashPoolBusy(Exception):
+    """Pool băm mật khẩu đã đầy (HASH_MAX_PENDING)."""
+
+
+def _acquire_slot(fail_fast: bool = True) -> bool:
+    global _hash_pending
+    with _hash_lock:
+        if _hash_pending >= HASH_MAX_PENDING:
+            _hash_stats["rejected"] += 1
+            if fail_fast:
+                raise HashPoolBusy()
+            return False
+        _hash_pending += 1
+        return True
+
+
+def _release_slot():
+    global _hash_pending
+    with _hash_lock:
+        _hash_pending -= 1
+        _hash_stats["completed"] += 1
+
+
+def _timed_run(op: str, fn, *args):
+    """Bọc việc chạy trên pool: đo thời gian chờ hàng đợi + thời gian bcrypt."""
+    t_submit = time.perf_counter()
+
+    def _run():
+        t0 = time.perf_counter()
+        BCRYPT_WAIT.observe(t0 - t_submit, op)
+        try:
+            return fn(*args)
+        finally:
+            BCRYPT_SECONDS.observe(time.perf_counter() - t0, op)
+    return _run
+
+
+def _submit(fn, *args):
+    _acquire_slot()
+    op = "verify" if fn is verify_password else "hash"
+    fut = _hash_executor.submit(_timed_run(op, fn, *args))
+    fut.add_done_callback(lambda _: _release_slot())
+    return fut
+
+
+async def verify_password_async(plain_password: str, password_hash: str) -> bool:
+    """verify_password chạy trên pool bcrypt; đầy -> HashPoolBusy."""
+    if not password_hash:
+        return False
+    return await asyncio.wrap_future(_submit(verify_password, plain_password, password_hash))
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password chạy trên pool bcrypt; đầy -> HashPoolBusy."""
+    return await asyncio.wrap_future(_submit(hash_password, password))
+
+
+def hash_password_pooled(password: str) -> str:
+    """Bản đồng bộ cho handler sync: vẫn đi qua pool bcrypt (giới hạn + fast-fail)."""
+    return _submit(hash_password, password).result()
+
+
+def schedule_rehash(plain_password: str, password_hash: str, save: Callable[[str], None]) -> bool:
+    """
+    Nâng cấp hash (đổi cost/scheme) chạy nền sau khi đăng nhập đã verify OK.
+    `save(new_hash)` được gọi trên thread của pool. Pool đầy thì bỏ qua —
+    lần đăng nhập sau sẽ thử lại. Trả True nếu đã lên lịch.
+    """
+    if not needs_rehash(password_hash):
+        return False
+    if not _acquire_slot(fail_fast=False):
+        with _hash_lock:
+            _hash_stats["rehash_skipped"] += 1
+        return False
+
+    def _run():
+        try:
+            save(hash_password(plain_password))
+            with _hash_lock:
+                _hash_stats["rehash_done"] += 1
+        except Exception:
+            log.exception("Rehash mật khẩu thất bại")
+
+    fut = _hash_executor.submit(_timed_run("rehash", _run))
+    fut.add_done_callback(lambda _: _release_slot())
+    return True
+
+
+def hash_pool_stats() -> dict:
+    with _hash_lock:
+        return {
+            "workers": max(1, HASH_WORKERS),
+            "max_pending": HASH_MAX_PENDING,
+            "pending": _hash_pending,
+            "queued": max(0, _hash_pending - max(1, HASH_WORKERS)),
+            **_hash_stats,
+        }
@@ -0,0 +1,427 @@
+# app/core/session.py
+"""
+Session cookie ký bằng itsdangerous — cùng định dạng với SessionMiddleware của
+Starlette (cookie cũ vẫn đọc được), nhưng chỉ ký lại + gửi Set-Cookie khi nội
+dung session thực sự đổi.
+
+Cách làm: lưu bản JSON chuẩn hoá của session lúc đọc cookie, cuối request
+serialize lại và so sánh; giống nhau -> không ký, không Set-Cookie. Gán lại
+cùng giá trị (vd. require_roles bơm lại role/full_name) không còn tốn gì.
+
+SESSION_BACKEND=memory|db: session lưu phía server (ServerSessionMiddleware),
+cookie chỉ giữ id ngẫu nhiên đã ký. Hết hạn idle do sweeper chạy nền xoá,
+Admin khoá / reset user thì `revoke_user_sessions(uid)` xoá ngay.
+  - memory: LRU trong RAM, chỉ dùng khi chạy 1 worker
+  - db    : bảng web_sessions (1 câu SELECT theo PK), cache ngắn mỗi worker
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import itsdangerous
+from itsdangerous.exc import BadSignature
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+log = logging.getLogger("session")
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "cookie").strip().lower()  # cookie | memory | db
+SESSION_MEMORY_MAX = int(os.getenv("SESSION_MEMORY_MAX", "10000"))
+SESSION_CACHE_TTL_SEC = float(os.getenv("SESSION_CACHE_TTL_SEC", "5"))  # cache mỗi worker (db)
+SESSION_SWEEP_SEC = int(os.getenv("SESSION_SWEEP_SEC", "60"))
+SESSION_BACKENDS = ("cookie", "memory", "db")
+
+
+def _canon(data: dict) -> str:
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def set_if_changed(sess, key: str, value) -> None:
+    """Chỉ gán khi giá trị khác (tránh đánh dấu modified với session của Starlette)."""
+    if sess.get(key) != value:
+        sess[key] = value
+
+
+class DirtySessionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        secret_key: str,
+        session_cookie: str = "session",
+        max_age: Optional[int] = 14 * 24 * 60 * 60,
+        path: str = "/",
+        same_site: str = "lax",
+        https_only: bool = False,
+    ) -> None:
+        self.app = app
+        self.signer = itsdangerous.TimestampSigner(str(secret_key))
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.path = path
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:
+            self.security_flags += "; secure"
+
+    def _load(self, scope: Scope) -> Optional[dict]:
+        raw = HTTPConnection(scope).cookies.get(self.session_cookie)
+        if not raw:
+            return None
+        try:
+            data = self.signer.unsign(raw.encode("utf-8"), max_age=self.max_age)
+            out = json.loads(b64decode(data))
+            return out if isinstance(out, dict) else None
+        except (BadSignature, ValueError):
+            return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        initial = self._load(scope)
+        scope["session"] = dict(initial or {})
+        initial_canon = _canon(initial) if initial else None
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                session = scope["session"]
+                headers = MutableHeaders(scope=message)
+                if initial is not None or session:
+                    headers.add_vary_header("Cookie")
+                if session:
+                    canon = _canon(session)
+                    if canon != initial_canon:
+                        data = self.signer.sign(b64encode(canon.encode("utf-8"))).decode("utf-8")
+                        max_age = f"Max-Age={self.max_age}; " if self.max_age is not None else ""
+                        headers.append(
+                            "Set-Cookie",
+                            f"{self.session_cookie}={data}; path={self.path}; {max_age}{self.security_flags}",
+                        )
+                elif initial is not None:
+                    # session bị xoá (logout / hết hạn)
+                    headers.append(
+                        "Set-Cookie",
+                        f"{self.session_cookie}=null; path={self.path}; "
+                        f"expires=Thu, 01 Jan 1970 00:00:00 GMT; {self.security_flags}",
+                    )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+# ---------------- Server-side session ----------------
+class ServerSession(dict):
+    """Dict session phía server; thời điểm hoạt động do store giữ (không cần _last_seen)."""
+    server_side = True
+
+
+class MemorySessionStore:
+    def __init__(self, max_entries: int = SESSION_MEMORY_MAX):
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, list]" = OrderedDict()  # sid -> [data, last_seen, user_id]
+
+    def get(self, sid: str) -> Optional[Tuple[dict, int]]:
+        with self._lock:
+            ent = self._data.get(sid)
+            if ent is None:
+                return None
+            self._data.move_to_end(sid)
+            return dict(ent[0]), ent[1]
+
+    def save(self, sid: str, data: dict, now: int) -> None:
+        with self._lock:
+            self._data[sid] = [dict(data), now, data.get("uid")]
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def touch(self, sid: str, now: int) -> None:
+        with self._lock:
+            ent = self._data.get(sid)
+            if ent is not None:
+                ent[1] = now
+
+    def delete(self, sid: str) -> None:
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def delete_user(self, uid: int) -> int:
+        with self._lock:
+            sids = [k for k, v in self._data.items() if v[2] == uid]
+            for k in sids:
+                del self._data[k]
+            return len(sids)
+
+    def sweep(self, older_than: int) -> int:
+        with self._lock:
+            sids = [k for k, v in self._data.items() if v[1] < older_than]
+            for k in sids:
+                del self._data[k]
+            return len(sids)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "memory", "sessions": len(self._data)}
+
+
+class DbSessionStore:
+    """Bảng web_sessions; get() cache SESSION_CACHE_TTL_SEC giây trong worker."""
+
+    def __init__(self, cache_ttl: float = SESSION_CACHE_TTL_SEC):
+        from app.db.session import SessionLocal
+        from app.models.web_session import WebSession
+        self._SessionLocal = SessionLocal
+        self._model = WebSession
+        self.cache_ttl = cache_ttl
+        self._lock = threading.Lock()
+        self._cache: Dict[str, tuple] = {}  # sid -> (hết hạn, data, last_seen)
+
+    def _cache_put(self, sid: str, data: dict, last_seen: int) -> None:
+        if self.cache_ttl <= 0:
+            return
+        with self._lock:
+            if len(self._cache) > SESSION_MEMORY_MAX:
+                self._cache.clear()
+            self._cache[sid] = (time.monotonic() + self.cache_ttl, dict(data), last_seen)
+
+    def _cache_drop(self, sid: Optional[str] = None) -> None:
+        with self._lock:
+            if sid is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(sid, None)
+
+    def get(self, sid: str) -> Optional[Tuple[dict, int]]:
+        with self._lock:
+            ent = self._cache.get(sid)
+        if ent and ent[0] > time.monotonic():
+            return dict(ent[1]), ent[2]
+        db = self._SessionLocal()
+        try:
+            row = db.get(self._model, sid)
+            out = (json.loads(row.data), int(row.last_seen)) if row else None
+        finally:
+            db.close()
+        if out is None:
+            self._cache_drop(sid)
+            return None
+        self._cache_put(sid, *out)
+        return dict(out[0]), out[1]
+
+    def save(self, sid: str, data: dict, now: int) -> None:
+        M = self._model
+        db = self._SessionLocal()
+        try:
+            payload = {"data": _canon(data), "user_id": data.get("uid"), "last_seen": now}
+            if not db.query(M).filter(M.id == sid).update(payload, synchronize_session=False):
+                db.add(M(id=sid, created_at=now, **payload))
+            db.commit()
+        finally:
+            db.close()
+        self._cache_put(sid, data, now)
+
+    def touch(self, sid: str, now: int) -> None:
+        M = self._model
+        db = self._SessionLocal()
+        try:
+            db.query(M).filter(M.id == sid).update({"last_seen": now}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        with self._lock:
+            ent = self._cache.get(sid)
+            if ent:
+                self._cache[sid] = (ent[0], ent[1], now)
+
+    def _delete_where(self, *cond) -> int:
+        db = self._SessionLocal()
+        try:
+            n = db.query(self._model).filter(*cond).delete(synchronize_session=False)
+            db.commit()
+            return n
+        finally:
+            db.close()
+
+    def delete(self, sid: str) -> None:
+        self._delete_where(self._model.id == sid)
+        self._cache_drop(sid)
+
+    def delete_user(self, uid: int) -> int:
+        n = self._delete_where(self._model.user_id == uid)
+        self._cache_drop()  # worker khác tự hết hạn cache sau cache_ttl
+        return n
+
+    def sweep(self, older_than: int) -> int:
+        return self._delete_where(self._model.last_seen < older_than)
+
+    def stats(self) -> dict:
+        db = self._SessionLocal()
+        try:
+            n = db.query(self._model).count()
+        finally:
+            db.close()
+        with self._lock:
+            cached = len(self._cache)
+        return {"backend": "db", "sessions": n, "cached": cached, "cache_ttl_sec": self.cache_ttl}
+
+
+_store = None
+
+
+def get_session_store():
+    """Store đang dùng; None khi SESSION_BACKEND=cookie."""
+    return _store
+
+
+def revoke_user_sessions(uid: int) -> int:
+    """Xoá mọi session của user (chỉ có tác dụng với backend server-side)."""
+    if _store is None:
+        return 0
+    try:
+        return _store.delete_user(int(uid))
+    except Exception:
+        log.exception("Không thu hồi được session của user %s", uid)
+        return 0
+
+
+def _start_sweeper(store, idle_timeout: int) -> None:
+    def _loop():
+        while True:
+            time.sleep(max(1, SESSION_SWEEP_SEC))
+            try:
+                n = store.sweep(int(time.time()) - idle_timeout)
+                if n:
+                    log.info("Session sweeper: xoá %d session hết hạn", n)
+            except Exception:
+                log.exception("Session sweeper lỗi")
+
+    threading.Thread(target=_loop, name="session-sweeper", daemon=True).start()
+
+
+def build_session_store(backend: str = SESSION_BACKEND):
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "db":
+        return DbSessionStore()
+    raise ValueError(f"SESSION_BACKEND phải là một trong: {', '.join(SESSION_BACKENDS)}")
+
+
+class ServerSessionMiddleware:
+    """
+    Cookie = id ngẫu nhiên đã ký. Mỗi request: 1 lần get() từ store (có cache),
+    ghi lại data chỉ khi đổi, cập nhật last_seen theo độ mịn `touch_sec`.
+    id không còn trong store (sweeper đã xoá / bị thu hồi) -> scope["session_expired"].
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        secret_key: str,
+        store=None,
+        idle_timeout: int = 3600,
+        touch_sec: int = 60,
+        session_cookie: str = "session",
+        max_age: Optional[int] = 14 * 24 * 60 * 60,
+        path: str = "/",
+        same_site: str = "lax",
+        https_only: bool = False,
+    ) -> None:
+        global _store
+        self.app = app
+        self.store = store or build_session_store()
+        _store = self.store
+        self.idle_timeout = idle_timeout
+        self.touch_sec = touch_sec
+        self.signer = itsdangerous.Signer(str(secret_key), salt="sid")
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.path = path
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:
+            self.security_flags += "; secure"
+        _start_sweeper(self.store, idle_timeout)
+
+    def _cookie_sid(self, scope: Scope) -> Optional[str]:
+        raw = HTTPConnection(scope).cookies.get(self.session_cookie)
+        if not raw:
+            return None
+        try:
+            return self.signer.unsign(raw.encode("utf-8")).decode("utf-8")
+        except BadSignature:
+            return ""  # cookie cũ (dạng ký JSON) / bị sửa -> coi như hết phiên
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        now = int(time.time())
+        sid = self._cookie_sid(scope)
+        initial, last_seen = None, 0
+        if sid:
+            found = await run_in_threadpool(self.store.get, sid)
+            if found is not None:
+                initial, last_seen = found
+                if now - last_seen > self.idle_timeout:  # sweeper chưa kịp xoá
+                    await run_in_threadpool(self.store.delete, sid)
+                    initial = None
+        if sid is not None and initial is None:
+            scope["session_expired"] = True
+        scope["session"] = ServerSession(initial or {})
+        initial_canon = _canon(initial) if initial else None
+        pending: Dict[str, object] = {}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                session = scope["session"]
+                headers = MutableHeaders(scope=message)
+                if sid is not None or session:
+                    headers.add_vary_header("Cookie")
+                cookie_sid = sid if initial is not None else None
+                if session:
+                    canon = _canon(session)
+                    if canon != initial_canon:
+                        # đổi user (đăng nhập) -> cấp id mới, chống session fixation
+                        if cookie_sid and (initial or {}).get("uid") != session.get("uid"):
+                            pending["drop"] = cookie_sid
+                            cookie_sid = None
+                        new_sid = cookie_sid or secrets.token_urlsafe(32)
+                        pending["save"] = (new_sid, dict(session))
+                        if new_sid != cookie_sid:
+                            data = self.signer.sign(new_sid.encode("utf-8")).decode("utf-8")
+                            max_age = f"Max-Age={self.max_age}; " if self.max_age is not None else ""
+                            headers.append(
+                                "Set-Cookie",
+                                f"{self.session_cookie}={data}; path={self.path}; {max_age}{self.security_flags}",
+                            )
+                    elif now - last_seen >= self.touch_sec:
+                        pending["touch"] = cookie_sid
+                if not session and sid is not None:
+                    if cookie_sid:
+                        pending["drop"] = cookie_sid
+                    headers.append(
+                        "Set-Cookie",
+                        f"{self.session_cookie}=null; path={self.path}; "
+                        f"expires=Thu, 01 Jan 1970 00:00:00 GMT; {self.security_flags}",
+                    )
+                # ghi store trước khi gửi header để request kế tiếp thấy ngay
+                if "drop" in pending:
+                    await run_in_threadpool(self.store.delete, pending["drop"])
+                if "save" in pending:
+                    await run_in_threadpool(self.store.save, *pending["save"], now)
+                if pending.get("touch"):
+                    await run_in_threadpool(self.store.touch, pending["touch"], now)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,165 @@
+# app/core/timing.py
+"""
+Đo thời gian từng phase của request và trả về header `Server-Timing` chuẩn
+(DevTools > Network > Timing hiển thị sẵn), vd:
+
+    Server-Timing: db;dur=12.3;desc="5 q", pdf;dur=410.2, json;dur=1.1, app;dur=430.8
+
+API:
+    with span("xlsx"): ...          # context manager
+    @timed("pdf")                    # decorator (sync hoặc async)
+    record("cache", ms)              # tự cộng số đo
+
+SERVER_TIMING_SAMPLE: tỉ lệ request được đo (0 = tắt hẳn, 1 = mọi request).
+Khi request không được chọn (hoặc tắt) span() chỉ tốn 1 lần ContextVar.get và
+trả về context no-op dùng chung. Span cùng tên cộng dồn (desc="3x" nếu > 1 lần).
+Phần chạy sau khi header đã gửi (body StreamingResponse, vd ZIP) không lên header.
+"""
+from __future__ import annotations
+
+import functools
+import inspect
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+SERVER_TIMING_SAMPLE = float(os.getenv("SERVER_TIMING_SAMPLE", "0"))
+SERVER_TIMING_MAX_SPANS = int(os.getenv("SERVER_TIMING_MAX_SPANS", "20"))
+
+
+class Timings:
+    __slots__ = ("spans", "_lock")
+
+    def __init__(self):
+        self.spans: Dict[str, List[float]] = {}  # tên -> [tổng ms, số lần]
+        self._lock = threading.Lock()
+
+    def add(self, name: str, ms: float) -> None:
+        with self._lock:
+            ent = self.spans.get(name)
+            if ent is None:
+                if len(self.spans) >= SERVER_TIMING_MAX_SPANS:
+                    return
+                self.spans[name] = [ms, 1]
+            else:
+                ent[0] += ms
+                ent[1] += 1
+
+
+_current: ContextVar[Optional[Timings]] = ContextVar("server_timing", default=None)
+
+
+class _Span:
+    __slots__ = ("timings", "name", "t0")
+
+    def __init__(self, timings: Timings, name: str):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.add(self.name, (time.perf_counter() - self.t0) * 1000)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str):
+    t = _current.get()
+    return _NOOP if t is None else _Span(t, name)
+
+
+def record(name: str, ms: float) -> None:
+    t = _current.get()
+    if t is not None:
+        t.add(name, ms)
+
+
+def timed(name: str):
+    def deco(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                t = _current.get()
+                if t is None:
+                    return await fn(*args, **kwargs)
+                with _Span(t, name):
+                    return await fn(*args, **kwargs)
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t = _current.get()
+            if t is None:
+                return fn(*args, **kwargs)
+            with _Span(t, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse mặc định của app; đo bước encode JSON (span "json")."""
+
+    def render(self, content) -> bytes:
+        with span("json"):
+            return super().render(content)
+
+
+def _header_value(timings: Timings, scope: Scope, total_ms: float) -> str:
+    parts = []
+    stats = scope.get("state", {}).get("query_stats")  # từ QueryStatsMiddleware
+    if stats is not None and stats.queries:
+        parts.append(f'db;dur={stats.db_ms:.1f};desc="{stats.queries} q"')
+    for name, (ms, n) in timings.spans.items():
+        parts.append(f'{name};dur={ms:.1f}' + (f';desc="{n}x"' if n > 1 else ""))
+    parts.append(f"app;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+class ServerTimingMiddleware:
+    def __init__(self, app: ASGIApp, sample: float = SERVER_TIMING_SAMPLE) -> None:
+        self.app = app
+        self.sample = sample
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self.sample <= 0 or (self.sample < 1 and random.random() >= self.sample):
+            await self.app(scope, receive, send)
+            return
+
+        timings = Timings()
+        token = _current.set(timings)
+        t0 = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(
+                    "Server-Timing", _header_value(timings, scope, (time.perf_counter() - t0) * 1000)
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
@@ -0,0 +1,107 @@
+# app/db/async_session.py
+"""
+Đường DB async cho các endpoint đọc "nóng" (search, tra cứu hồ sơ, checklist,
+nhật ký, /me): chạy thẳng trên event loop, không chiếm slot threadpool như
+endpoint sync.
+
+URL suy ra từ engine sync hiện tại (kể cả khi init_db đã fallback sang SQLite):
+  mysql+pymysql -> mysql+aiomysql,  sqlite -> sqlite+aiosqlite
+Engine tạo lười ở lần dùng đầu tiên; pool dùng chung cấu hình DB_POOL_*.
+Có DB_REPLICA_URL thì định tuyến đọc/ghi y như session sync (RoutingSession,
+dùng chung trạng thái health của replica).
+"""
+from __future__ import annotations
+
+from typing import AsyncIterator, Optional
+
+from fastapi import Request
+from sqlalchemy.engine.url import URL
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from . import session as _sync
+from .pool_watch import attach_leak_detector
+from .query_stats import attach_query_stats
+from ..core.config import settings
+
+_ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mariadb": "mariadb+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+_async_engine: Optional[AsyncEngine] = None
+_async_replica: Optional[AsyncEngine] = None
+AsyncSessionLocal = async_sessionmaker(
+    class_=AsyncSession,
+    sync_session_class=_sync.RoutingSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+def async_url(url: URL) -> URL:
+    backend = url.get_backend_name()
+    driver = _ASYNC_DRIVERS.get(backend)
+    if driver is None:
+        raise RuntimeError(f"Chưa hỗ trợ DB async cho backend '{backend}'")
+    return url.set(drivername=driver)
+
+
+def _make_async_engine(url: URL) -> AsyncEngine:
+    connect_args = {}
+    if url.get_backend_name().startswith("mysql"):
+        connect_args["charset"] = "utf8mb4"
+
+    pool_args = {}
+    if (url.database or ":memory:") != ":memory:":
+        pool_args = dict(
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_use_lifo=settings.DB_POOL_USE_LIFO,
+        )
+
+    eng = create_async_engine(
+        async_url(url),
+        connect_args=connect_args,
+        pool_pre_ping=True,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        **pool_args,
+    )
+    attach_leak_detector(eng.sync_engine)
+    attach_query_stats(eng.sync_engine)
+    return eng
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine, _async_replica
+    if _async_engine is None:
+        _async_engine = _make_async_engine(_sync.engine.url)
+        info = {}
+        if _sync.replica_health is not None:
+            _async_replica = _make_async_engine(_sync.replica_engine.url)
+            info = {_sync.REPLICA_KEY: (_sync.replica_health, _async_replica.sync_engine)}
+        AsyncSessionLocal.configure(bind=_async_engine, info=info)
+    return _async_engine
+
+
+def async_pool_status() -> Optional[str]:
+    return _async_engine.pool.status() if _async_engine is not None else None
+
+
+async def dispose_async_engine() -> None:
+    global _async_engine, _async_replica
+    for eng in (_async_engine, _async_replica):
+        if eng is not None:
+            await eng.dispose()
+    _async_engine = _async_replica = None
+
+
+async def get_async_db(request: Request) -> AsyncIterator[AsyncSession]:
+    get_async_engine()
+    info = {_sync.READ_ONLY: True} if _sync.is_read_only_method(request.method) else {}
+    async with AsyncSessionLocal(info=info) as db:
+        yield db
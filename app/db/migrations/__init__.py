@@ -0,0 +1,278 @@
+# app/db/migrations/__init__.py
+"""
+Migration có đánh số phiên bản (nhẹ, không cần Alembic).
+
+- Mỗi migration là 1 file versions/mNNNN_<tên>.py có `DESCRIPTION` và
+  `upgrade(ops)`; NNNN là số phiên bản, tăng dần.
+- Bảng `schema_migrations` lưu các phiên bản đã chạy (version, mô tả, thời điểm,
+  thời gian chạy). "Head" = phiên bản lớn nhất trong thư mục versions.
+- Startup chỉ gọi `ensure_at_head()`: 1 câu SELECT MAX(version); đã ở head thì
+  xong, không còn create_all mỗi lần khởi động. Còn thiếu: DB_AUTO_MIGRATE=1
+  (mặc định, giữ thói quen "chạy server là có bảng") thì tự nâng cấp, =0 thì
+  dừng và báo chạy CLI:
+
+    python -m app.db.migrations status
+    python -m app.db.migrations upgrade [--to N]
+    python -m app.db.migrations stamp N     # DB cũ đã có sẵn bảng/index
+
+Các thao tác trong `Ops` đều idempotent (bỏ qua nếu đã có) nên chạy lại an toàn
+và baseline (create_all) không đụng độ với index do migration sau thêm.
+Trên MySQL, index được tạo online: ALGORITHM=INPLACE, LOCK=NONE (bảng vẫn đọc/ghi
+được trong lúc build); nhiều worker cùng nâng cấp thì GET_LOCK để chỉ 1 worker chạy.
+"""
+from __future__ import annotations
+
+import importlib
+import logging
+import os
+import pkgutil
+import re
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+log = logging.getLogger("db.migrate")
+
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1") == "1"
+MIGRATE_LOCK_NAME = "ams_schema_migrate"
+MIGRATE_LOCK_TIMEOUT_SEC = int(os.getenv("MIGRATE_LOCK_TIMEOUT_SEC", "300"))
+
+_VERSION_RE = re.compile(r"^m(\d{4})_(\w+)$")
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _meta,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("description", String(255), nullable=True),
+    Column("applied_at", DateTime, nullable=False),
+    Column("duration_ms", Integer, nullable=True),
+)
+
+
+class SchemaNotAtHead(RuntimeError):
+    pass
+
+
+class Migration:
+    __slots__ = ("version", "name", "description", "module")
+
+    def __init__(self, version: int, name: str, module):
+        self.version = version
+        self.name = name
+        self.module = module
+        self.description = getattr(module, "DESCRIPTION", name)
+
+    def __repr__(self) -> str:
+        return f"<Migration {self.version:04d} {self.name}>"
+
+
+def discover() -> List[Migration]:
+    from . import versions
+
+    out: Dict[int, Migration] = {}
+    for mod in pkgutil.iter_modules(versions.__path__):
+        m = _VERSION_RE.match(mod.name)
+        if not m:
+            continue
+        ver = int(m.group(1))
+        if ver in out:
+            raise RuntimeError(f"Trùng số phiên bản migration {ver:04d}")
+        out[ver] = Migration(ver, m.group(2), importlib.import_module(f"{versions.__name__}.{mod.name}"))
+    return [out[v] for v in sorted(out)]
+
+
+def head_version() -> int:
+    migs = discover()
+    return migs[-1].version if migs else 0
+
+
+# ---------------- thao tác schema ----------------
+class Ops:
+    """Thao tác schema dùng trong upgrade(); tất cả bỏ qua nếu đối tượng đã tồn tại."""
+
+    def __init__(self, conn: Connection):
+        self.conn = conn
+        self.dialect = conn.dialect.name
+
+    def _insp(self):
+        return inspect(self.conn)
+
+    def has_table(self, table: str) -> bool:
+        return self._insp().has_table(table)
+
+    def has_column(self, table: str, column: str) -> bool:
+        return any(c["name"] == column for c in self._insp().get_columns(table))
+
+    def has_index(self, table: str, name: str) -> bool:
+        return any(ix["name"] == name for ix in self._insp().get_indexes(table))
+
+    def create_all(self, metadata) -> None:
+        metadata.create_all(bind=self.conn, checkfirst=True)
+
+    def create_index(self, table: str, name: str, columns: Sequence[str], unique: bool = False) -> bool:
+        if self.has_index(table, name):
+            return False
+        prep = self.conn.dialect.identifier_preparer
+        cols = ", ".join(prep.quote(c) for c in columns)
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        if self.dialect in ("mysql", "mariadb"):
+            # online: không khoá bảng trong lúc build index
+            sql = f"ALTER TABLE {prep.quote(table)} ADD {kind} {prep.quote(name)} ({cols}), ALGORITHM=INPLACE, LOCK=NONE"
+        else:
+            sql = f"CREATE {kind} {prep.quote(name)} ON {prep.quote(table)} ({cols})"
+        t0 = time.perf_counter()
+        self.conn.execute(text(sql))
+        log.info("Tạo index %s trên %s(%s) trong %.0f ms", name, table, cols, (time.perf_counter() - t0) * 1000)
+        return True
+
+    def create_model_indexes(self, model, names: Optional[Sequence[str]] = None) -> int:
+        """Tạo các Index khai báo trong model (lọc theo tên nếu có) còn thiếu trong DB."""
+        table = model.__table__
+        n = 0
+        for ix in sorted(table.indexes, key=lambda i: i.name):
+            if names is not None and ix.name not in names:
+                continue
+            n += self.create_index(table.name, ix.name, [c.name for c in ix.columns], unique=ix.unique)
+        return n
+
+    def add_column(self, table: str, column_ddl: str, name: str) -> bool:
+        """column_ddl: phần định nghĩa sau tên cột, vd 'VARCHAR(32) NULL'."""
+        if self.has_column(table, name):
+            return False
+        prep = self.conn.dialect.identifier_preparer
+        self.conn.execute(text(f"ALTER TABLE {prep.quote(table)} ADD COLUMN {prep.quote(name)} {column_ddl}"))
+        return True
+
+    def execute(self, sql: str, **params) -> None:
+        self.conn.execute(text(sql), params)
+
+
+# ---------------- trạng thái ----------------
+def current_version(engine: Engine) -> int:
+    """Phiên bản đang ở DB (0 = chưa có bảng schema_migrations). 1 câu SELECT."""
+    try:
+        with engine.connect() as conn:
+            v = conn.execute(select(schema_migrations.c.version).order_by(schema_migrations.c.version.desc()).limit(1)).scalar()
+    except (OperationalError, ProgrammingError):
+        return 0
+    return int(v or 0)
+
+
+def applied(engine: Engine) -> List[dict]:
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(select(schema_migrations).order_by(schema_migrations.c.version)).mappings().all()
+    except (OperationalError, ProgrammingError):
+        return []
+    return [dict(r) for r in rows]
+
+
+def status(engine: Engine) -> dict:
+    done = {r["version"]: r for r in applied(engine)}
+    migs = discover()
+    return {
+        "current": max(done) if done else 0,
+        "head": migs[-1].version if migs else 0,
+        "migrations": [
+            {
+                "version": m.version,
+                "name": m.name,
+                "description": m.description,
+                "applied_at": done[m.version]["applied_at"] if m.version in done else None,
+                "duration_ms": done[m.version]["duration_ms"] if m.version in done else None,
+            }
+            for m in migs
+        ],
+    }
+
+
+# ---------------- chạy ----------------
+class _migrate_lock:
+    """Khoá mức DB (MySQL GET_LOCK) để nhiều worker khởi động cùng lúc không chạy trùng."""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.conn = None
+
+    def __enter__(self):
+        if self.engine.dialect.name in ("mysql", "mariadb"):
+            self.conn = self.engine.connect()
+            got = self.conn.execute(
+                text("SELECT GET_LOCK(:n, :t)"), {"n": MIGRATE_LOCK_NAME, "t": MIGRATE_LOCK_TIMEOUT_SEC}
+            ).scalar()
+            if got != 1:
+                self.conn.close()
+                raise RuntimeError("Không lấy được khoá migration (worker khác đang nâng cấp?)")
+        return self
+
+    def __exit__(self, *exc):
+        if self.conn is not None:
+            try:
+                self.conn.execute(text("SELECT RELEASE_LOCK(:n)"), {"n": MIGRATE_LOCK_NAME})
+            finally:
+                self.conn.close()
+        return False
+
+
+def _record(conn: Connection, m: Migration, duration_ms: Optional[int]) -> None:
+    conn.execute(schema_migrations.insert().values(
+        version=m.version, description=m.description[:255],
+        applied_at=datetime.utcnow(), duration_ms=duration_ms,
+    ))
+
+
+def upgrade(engine: Engine, target: Optional[int] = None) -> List[Tuple[int, str, int]]:
+    """Chạy các migration còn thiếu tới `target` (mặc định head). Trả [(version, tên, ms)]."""
+    migs = discover()
+    target = migs[-1].version if (target is None and migs) else (target or 0)
+    ran: List[Tuple[int, str, int]] = []
+    with _migrate_lock(engine):
+        _meta.create_all(bind=engine, checkfirst=True)
+        done = {r["version"] for r in applied(engine)}
+        for m in migs:
+            if m.version in done or m.version > target:
+                continue
+            log.info("Migration %04d %s: %s", m.version, m.name, m.description)
+            t0 = time.perf_counter()
+            # DDL của MySQL tự commit -> mỗi migration 1 transaction riêng, ghi version ngay sau đó
+            with engine.begin() as conn:
+                m.module.upgrade(Ops(conn))
+                ms = int((time.perf_counter() - t0) * 1000)
+                _record(conn, m, ms)
+            ran.append((m.version, m.name, ms))
+    return ran
+
+
+def stamp(engine: Engine, version: int) -> List[int]:
+    """Đánh dấu đã chạy tới `version` mà không thực thi (DB cũ đã có schema tương ứng)."""
+    stamped = []
+    with _migrate_lock(engine):
+        _meta.create_all(bind=engine, checkfirst=True)
+        done = {r["version"] for r in applied(engine)}
+        with engine.begin() as conn:
+            for m in discover():
+                if m.version <= version and m.version not in done:
+                    _record(conn, m, None)
+                    stamped.append(m.version)
+    return stamped
+
+
+def ensure_at_head(engine: Engine, auto: bool = DB_AUTO_MIGRATE) -> int:
+    """Gọi lúc startup: nhanh nếu đã ở head; còn thiếu thì tự nâng cấp (auto) hoặc báo lỗi."""
+    head = head_version()
+    cur = current_version(engine)
+    if cur >= head:
+        return cur
+    if not auto:
+        raise SchemaNotAtHead(
+            f"Schema DB đang ở phiên bản {cur}, cần {head}. "
+            f"Chạy: python -m app.db.migrations upgrade"
+        )
+    for v, name, ms in upgrade(engine, head):
+        log.warning("Đã áp dụng migration %04d %s (%d ms)", v, name, ms)
+    return head
@@ -0,0 +1,45 @@
+# app/db/migrations/__main__.py
+"""
+CLI migration (chạy online, app vẫn phục vụ trong lúc nâng cấp):
+
+    python -m app.db.migrations status
+    python -m app.db.migrations upgrade [--to N]
+    python -m app.db.migrations stamp N
+"""
+import argparse
+import logging
+
+from app.db.session import engine
+from . import head_version, stamp, status, upgrade
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="python -m app.db.migrations")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status", help="phiên bản hiện tại / head + danh sách migration")
+    up = sub.add_parser("upgrade", help="chạy các migration còn thiếu")
+    up.add_argument("--to", type=int, default=None, help="dừng ở phiên bản N (mặc định head)")
+    st = sub.add_parser("stamp", help="đánh dấu đã chạy tới N mà không thực thi")
+    st.add_argument("version", type=int)
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    print(f"DB: {engine.url.render_as_string(hide_password=True)}")
+
+    if args.cmd == "status":
+        st = status(engine)
+        print(f"current={st['current']} head={st['head']}")
+        for m in st["migrations"]:
+            mark = f"applied {m['applied_at']} ({m['duration_ms']} ms)" if m["applied_at"] else "PENDING"
+            print(f"  {m['version']:04d} {m['name']:28s} {mark}")
+    elif args.cmd == "upgrade":
+        ran = upgrade(engine, args.to)
+        for v, name, ms in ran:
+            print(f"  {v:04d} {name}: {ms} ms")
+        print("Đã ở head." if not ran else f"Đã chạy {len(ran)} migration, head={head_version()}.")
+    elif args.cmd == "stamp":
+        print("Stamped:", stamp(engine, args.version) or "không có gì")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+# app/db/migrations/versions/__init__.py
+# Mỗi file mNNNN_<tên>.py: DESCRIPTION + upgrade(ops). Không sửa file đã phát hành,
+# thay đổi schema mới -> thêm file với số lớn hơn.
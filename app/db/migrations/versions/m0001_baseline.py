@@ -0,0 +1,13 @@
+# app/db/migrations/versions/m0001_baseline.py
+"""
+Baseline: toàn bộ bảng theo model (thay cho create_all lúc startup).
+DB đã có bảng từ trước thì không làm gì (checkfirst).
+"""
+DESCRIPTION = "Baseline: tạo các bảng theo model"
+
+
+def upgrade(ops):
+    import app.models  # noqa: F401  (đăng ký đủ model vào Base.metadata)
+    from app.db.base import Base
+
+    ops.create_all(Base.metadata)
@@ -0,0 +1,37 @@
+# app/db/migrations/versions/m0002_hot_path_indexes.py
+"""
+Index cho các cột lọc / sắp xếp thường xuyên (khai báo cùng tên trong model):
+
+  applicants  (ngay_nhan_hs, created_at, ma_so_hv)  export / in theo ngày
+              (created_at)                          search, danh sách mới nhất
+              (khoa, dot)                           sinh mã hồ sơ, lọc theo khoá/đợt
+              (status, created_at)                  lọc trạng thái + sắp xếp
+  users       (email)                               đăng nhập bằng email, check trùng
+  audit_logs  (occurred_at)                         /journal mặc định + khoảng ngày
+              (action, occurred_at)                 lọc action
+              (target_type, target_id, occurred_at) lọc đối tượng
+              (actor_name, occurred_at)             sắp theo người thao tác
+
+DB tạo từ baseline mới đã có sẵn (bỏ qua); DB cũ được thêm online trên MySQL.
+"""
+DESCRIPTION = "Index cho applicants / users / audit_logs theo truy vấn của router"
+
+
+def upgrade(ops):
+    from app.models.applicant import Applicant
+    from app.models.audit import AuditLog
+    from app.models.user import User
+
+    ops.create_model_indexes(Applicant, [
+        "ix_applicants_ngay_created_mssv",
+        "ix_applicants_created_at",
+        "ix_applicants_khoa_dot",
+        "ix_applicants_status_created",
+    ])
+    ops.create_model_indexes(User, ["ix_users_email"])
+    ops.create_model_indexes(AuditLog, [
+        "ix_audit_logs_occurred_at",
+        "ix_audit_logs_action_occurred",
+        "ix_audit_logs_target_occurred",
+        "ix_audit_logs_actor_occurred",
+    ])
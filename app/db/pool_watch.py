@@ -0,0 +1,214 @@
+# app/db/pool_watch.py
+"""
+Theo dõi connection pool.
+
+- InstrumentedQueuePool + PoolMetrics: số connection đang dùng / đỉnh, thời gian
+  chờ lấy connection, số lần timeout — để chỉnh DB_POOL_SIZE / DB_MAX_OVERFLOW
+  theo tải thật (GET /admin/stats/db-pool).
+- LeakDetector: mỗi lần checkout ghi lại thời điểm + stack nơi lấy connection;
+  checkin thì xoá. Thread nền định kỳ quét: connection nào bị giữ quá
+  DB_LEAK_THRESHOLD_SEC thì log WARNING kèm stack lúc lấy (1 lần / lần checkout).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import traceback
+from typing import Dict, List
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+log = logging.getLogger("db.pool")
+
+DB_LEAK_DETECT = os.getenv("DB_LEAK_DETECT", "1") == "1"
+DB_LEAK_THRESHOLD_SEC = float(os.getenv("DB_LEAK_THRESHOLD_SEC", "30"))
+DB_LEAK_STACK_DEPTH = int(os.getenv("DB_LEAK_STACK_DEPTH", "20"))
+
+
+# Chờ lâu hơn ngưỡng này (ms) mới tính là "phải đợi"
+DB_POOL_SLOW_WAIT_MS = float(os.getenv("DB_POOL_SLOW_WAIT_MS", "10"))
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.connects = 0
+            self.in_use = 0
+            self.peak_in_use = 0
+            self.timeouts = 0
+            self.slow_waits = 0
+            self.wait_total_ms = 0.0
+            self.wait_max_ms = 0.0
+
+    def on_wait(self, ms: float, timed_out: bool) -> None:
+        with self._lock:
+            self.wait_total_ms += ms
+            self.wait_max_ms = max(self.wait_max_ms, ms)
+            if ms >= DB_POOL_SLOW_WAIT_MS:
+                self.slow_waits += 1
+            if timed_out:
+                self.timeouts += 1
+
+    def on_connect(self, *_a) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self, *_a) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def on_checkin(self, *_a) -> None:
+        with self._lock:
+            self.checkins += 1
+            self.in_use = max(0, self.in_use - 1)
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            n = max(1, self.checkouts)
+            return {
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "timeouts": self.timeouts,
+                "slow_waits": self.slow_waits,
+                "slow_wait_ms": DB_POOL_SLOW_WAIT_MS,
+                "wait_avg_ms": round(self.wait_total_ms / n, 3),
+                "wait_max_ms": round(self.wait_max_ms, 3),
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool đo thời gian chờ lấy connection (gồm cả mở connection mới) + timeout."""
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            timed_out = True
+            raise
+        finally:
+            pool_metrics.on_wait((time.perf_counter() - t0) * 1000, timed_out)
+
+
+def attach_pool_metrics(engine) -> None:
+    event.listen(engine, "connect", pool_metrics.on_connect)
+    event.listen(engine, "checkout", pool_metrics.on_checkout)
+    event.listen(engine, "checkin", pool_metrics.on_checkin)
+
+
+def pool_report(engine) -> Dict[str, object]:
+    pool = engine.pool
+    out: Dict[str, object] = {"pool_class": type(pool).__name__, "status": pool.status()}
+    if isinstance(pool, QueuePool):
+        out.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow,
+            "timeout_sec": pool.timeout(),
+        })
+    out["metrics"] = pool_metrics.snapshot()
+    out["leaks"] = leak_detector.report() if DB_LEAK_DETECT else None
+    return out
+
+
+class LeakDetector:
+    def __init__(self, threshold_sec: float = DB_LEAK_THRESHOLD_SEC):
+        self.threshold_sec = threshold_sec
+        self._lock = threading.Lock()
+        self._held: Dict[int, list] = {}  # id(connection_record) -> [t_checkout, stack, thread, reported]
+        self.leaks_reported = 0
+        self._thread = None
+
+    # ---------- pool events ----------
+    def on_checkout(self, dbapi_conn, record, proxy) -> None:
+        stack = traceback.extract_stack(limit=DB_LEAK_STACK_DEPTH)[:-1]
+        with self._lock:
+            self._held[id(record)] = [time.monotonic(), stack, threading.current_thread().name, False]
+
+    def on_checkin(self, dbapi_conn, record) -> None:
+        with self._lock:
+            self._held.pop(id(record), None)
+
+    # ---------- quét ----------
+    def scan(self) -> int:
+        now = time.monotonic()
+        found = []
+        with self._lock:
+            for ent in self._held.values():
+                if not ent[3] and now - ent[0] > self.threshold_sec:
+                    ent[3] = True
+                    found.append((now - ent[0], ent[1], ent[2]))
+        for held_for, stack, thread in found:
+            self.leaks_reported += 1
+            log.warning(
+                "Connection bị giữ %.1fs (> %.0fs) — có thể rò rỉ. Thread %s lấy tại:\n%s",
+                held_for, self.threshold_sec, thread,
+                "".join(traceback.format_list([f for f in stack if "sqlalchemy" not in f.filename])),
+            )
+        return len(found)
+
+    def _loop(self) -> None:
+        interval = max(1.0, self.threshold_sec / 2)
+        while True:
+            time.sleep(interval)
+            try:
+                self.scan()
+            except Exception:
+                log.exception("Leak scan lỗi")
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="db-leak-scan", daemon=True)
+            self._thread.start()
+
+    def report(self) -> Dict[str, object]:
+        now = time.monotonic()
+        with self._lock:
+            held: List[dict] = [
+                {"held_sec": round(now - e[0], 2), "thread": e[2], "where": _short(e[1])}
+                for e in self._held.values()
+            ]
+        held.sort(key=lambda x: -x["held_sec"])
+        return {"threshold_sec": self.threshold_sec, "checked_out": len(held),
+                "leaks_reported": self.leaks_reported, "held": held[:20]}
+
+
+def _short(stack) -> str:
+    """Frame gần nhất thuộc code của app (bỏ qua sqlalchemy/thư viện)."""
+    for fr in reversed(stack):
+        if "/app/" in fr.filename.replace("\\", "/"):
+            return f"{fr.filename}:{fr.lineno} {fr.name}"
+    fr = stack[-1] if stack else None
+    return f"{fr.filename}:{fr.lineno} {fr.name}" if fr else ""
+
+
+leak_detector = LeakDetector()
+
+
+def attach_leak_detector(engine) -> None:
+    if not DB_LEAK_DETECT:
+        return
+    event.listen(engine, "checkout", leak_detector.on_checkout)
+    event.listen(engine, "checkin", leak_detector.on_checkin)
+    leak_detector.start()
@@ -0,0 +1,194 @@
+# app/db/query_stats.py
+"""
+Đếm câu SQL + thời gian DB theo từng request, log câu chậm.
+
+- Hook before/after_cursor_execute trên mọi engine (primary, replica, async):
+  mỗi câu cộng vào RequestQueryStats của request hiện tại (ContextVar — đi theo
+  cả sang threadpool lẫn greenlet của AsyncSession).
+- Câu chạy >= DB_SLOW_QUERY_MS -> WARNING "db.slow" kèm correlation id, SQL và
+  tham số đã che giá trị (chỉ giữ kiểu + độ dài, không lộ dữ liệu học viên).
+- QueryStatsMiddleware (ngoài cùng) gắn số liệu vào request.state.query_stats
+  và ghi 1 dòng access log khi response xong:
+    GET /api/applicants/search 200 12.4ms db=3q/2.1ms commit=0 cid=...
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from sqlalchemy import event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+DB_SLOW_QUERY_MAX_SQL = int(os.getenv("DB_SLOW_QUERY_MAX_SQL", "2000"))
+ACCESS_LOG = os.getenv("ACCESS_LOG", "1") == "1"
+# Không log request file tĩnh không chạm DB (css/js/ảnh...)
+ACCESS_LOG_STATIC = os.getenv("ACCESS_LOG_STATIC", "0") == "1"
+
+slow_log = logging.getLogger("db.slow")
+access_log = logging.getLogger("access")
+if ACCESS_LOG and not access_log.handlers:
+    _h = logging.StreamHandler(sys.stdout)
+    _h.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    access_log.addHandler(_h)
+    access_log.setLevel(logging.INFO)
+    access_log.propagate = False
+
+_T0_KEY = "query_stats_t0"
+_WS_RE = re.compile(r"\s+")
+
+
+class RequestQueryStats:
+    __slots__ = ("scope", "queries", "db_ms", "commits", "slow", "statements", "threads", "_lock")
+
+    def __init__(self, scope: Optional[Scope] = None):
+        self.scope = scope
+        self.queries = 0
+        self.db_ms = 0.0
+        self.commits = 0
+        self.slow = 0
+        # Chỉ bật khi request đang được profile (app/core/profiler.py):
+        # danh sách (sql, ms) + các thread đã chạy SQL cho request
+        self.statements: Optional[list] = None
+        self.threads: Optional[set] = None
+        self._lock = threading.Lock()
+
+    @property
+    def correlation_id(self) -> Optional[str]:
+        # RequestPolicyMiddleware (bên trong) gắn cid vào scope["state"]
+        return (self.scope or {}).get("state", {}).get("correlation_id")
+
+    def add(self, ms: float, slow: bool, statement: Optional[str] = None) -> None:
+        with self._lock:
+            self.queries += 1
+            self.db_ms += ms
+            if slow:
+                self.slow += 1
+            if self.statements is not None and statement is not None:
+                self.statements.append((statement, ms))
+
+    def add_commit(self) -> None:
+        with self._lock:
+            self.commits += 1
+
+    def as_dict(self) -> dict:
+        return {"queries": self.queries, "db_ms": round(self.db_ms, 2), "commits": self.commits, "slow": self.slow}
+
+
+_current: ContextVar[Optional[RequestQueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_query_stats() -> Optional[RequestQueryStats]:
+    return _current.get()
+
+
+# ---------------- che tham số ----------------
+def _redact_value(v: Any) -> str:
+    if v is None:
+        return "NULL"
+    if isinstance(v, (str, bytes)):
+        return f"<{type(v).__name__}:{len(v)}>"
+    return f"<{type(v).__name__}>"
+
+
+def redact_params(params: Any) -> Any:
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: _redact_value(v) for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        if params and isinstance(params[0], (dict, list, tuple)):
+            # executemany: chỉ hiện dòng đầu + số dòng
+            return {"rows": len(params), "first": redact_params(params[0])}
+        return [_redact_value(v) for v in params]
+    return _redact_value(params)
+
+
+# ---------------- hook engine ----------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_T0_KEY, []).append(time.perf_counter())
+    stats = _current.get()
+    if stats is not None and stats.threads is not None:
+        stats.threads.add(threading.get_ident())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get(_T0_KEY)
+    if not stack:
+        return
+    ms = (time.perf_counter() - stack.pop()) * 1000
+    slow = ms >= DB_SLOW_QUERY_MS
+    stats = _current.get()
+    sql = None
+    if slow or (stats is not None and stats.statements is not None):
+        sql = _WS_RE.sub(" ", statement).strip()
+        if len(sql) > DB_SLOW_QUERY_MAX_SQL:
+            sql = sql[:DB_SLOW_QUERY_MAX_SQL] + "..."
+    if stats is not None:
+        stats.add(ms, slow, sql)
+    if slow:
+        slow_log.warning(
+            "Câu SQL chậm %.1f ms (>= %.0f) cid=%s db=%s sql=%s params=%s",
+            ms, DB_SLOW_QUERY_MS, stats.correlation_id if stats else None,
+            conn.engine.url.database, sql, redact_params(parameters),
+        )
+
+
+def _on_commit(conn):
+    stats = _current.get()
+    if stats is not None:
+        stats.add_commit()
+
+
+def attach_query_stats(engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "commit", _on_commit)
+
+
+# ---------------- middleware ----------------
+def _is_static(path: str) -> bool:
+    tail = path.rsplit("/", 1)[-1]
+    return "." in tail
+
+
+class QueryStatsMiddleware:
+    """Đặt ngoài cùng để tính cả câu SQL của middleware khác (session store, đóng Session)."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueryStats(scope)
+        scope.setdefault("state", {})["query_stats"] = stats
+        token = _current.set(stats)
+        status = 500
+        t0 = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if ACCESS_LOG and (stats.queries or ACCESS_LOG_STATIC or not _is_static(scope.get("path", ""))):
+                access_log.info(
+                    "%s %s %d %.1fms db=%dq/%.1fms commit=%d cid=%s",
+                    scope.get("method"), scope.get("path"), status,
+                    (time.perf_counter() - t0) * 1000,
+                    stats.queries, stats.db_ms, stats.commits, stats.correlation_id,
+                )
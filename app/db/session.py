@@ -1,12 +1,22 @@
 # app/db/session.py
 import os
 import logging
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.engine.url import make_url
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import Select
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.types import ASGIApp, Receive, Scope, Send
 
-from .base import Base
+from .pool_watch import InstrumentedQueuePool, attach_leak_detector, attach_pool_metrics
+from .query_stats import attach_query_stats
 from ..core.config import settings
 
 log = logging.getLogger("db")
@@ -14,7 +24,13 @@ log = logging.getLogger("db")
 # lấy URL từ cấu hình / .env, fallback SQLite nếu chưa đặt
 DB_URL = getattr(settings, "DB_URL", None) or os.getenv("DB_URL") or "sqlite:///./app.db"
 
-def _make_engine(url_str: str):
+def _sqlite_functions(dbapi_conn, _record) -> None:
+    # MySQL có sẵn CRC32(); SQLite thì đăng ký bản Python (checksum của cache export)
+    dbapi_conn.create_function(
+        "crc32", 1, lambda s: None if s is None else zlib.crc32(str(s).encode("utf-8")), deterministic=True
+    )
+
+def _make_engine(url_str: str, instrument: bool = True):
     url = make_url(url_str)
     connect_args = {}
     if url.get_backend_name().startswith("sqlite"):
@@ -24,24 +40,158 @@ def _make_engine(url_str: str):
         # nhưng để chắc ăn vẫn truyền xuống DBAPI connect()
         connect_args["charset"] = "utf8mb4"
 
-    return create_engine(
+    pool_args = {}
+    if (url.database or ":memory:") != ":memory:":
+        # SQLite :memory: dùng SingletonThreadPool, không nhận các tham số này
+        pool_args = dict(
+            poolclass=InstrumentedQueuePool if instrument else QueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_use_lifo=settings.DB_POOL_USE_LIFO,
+        )
+
+    eng = create_engine(
         url_str,
         connect_args=connect_args,
         pool_pre_ping=True,
-        pool_recycle=3600,
+        pool_recycle=settings.DB_POOL_RECYCLE,
         future=True,
+        **pool_args,
     )
+    if eng.dialect.name == "sqlite":
+        event.listen(eng, "connect", _sqlite_functions)
+    if instrument:
+        # số liệu pool (GET /admin/stats/db-pool) chỉ tính cho primary
+        attach_pool_metrics(eng)
+    attach_leak_detector(eng)
+    attach_query_stats(eng)
+    return eng
+
+# ---------------- Read replica ----------------
+# Session của request chỉ đọc (GET) được đánh dấu READ_ONLY: câu SELECT đi replica.
+# Câu đầu tiên không phải SELECT thuần (flush, INSERT/UPDATE/DELETE, FOR UPDATE,
+# text()) -> đánh dấu STICKY_PRIMARY, từ đó tới hết session mọi câu về primary
+# (đọc lại ngay dữ liệu vừa ghi không bị lệch do replica trễ).
+READ_ONLY = "route_read_only"
+STICKY_PRIMARY = "route_primary"
+REPLICA_KEY = "route_replica"  # (ReplicaHealth, bind replica)
+
+class ReplicaHealth:
+    """SELECT 1 định kỳ trên replica (thread nền); lỗi -> healthy=False, đọc về primary."""
+
+    def __init__(self, engine, interval_sec: float):
+        self.engine = engine
+        self.interval_sec = max(0.5, interval_sec)
+        self.healthy = True
+        self.last_error = None
+        self.checks = 0
+        self.failures = 0
+        self.routed = 0      # số câu SELECT đã đi replica
+        self.fallbacks = 0   # số câu lẽ ra đi replica nhưng replica đang lỗi
+        self._thread = None
+        event.listen(engine, "handle_error", self._on_error)
+
+    def _set(self, ok: bool, err=None) -> None:
+        if ok != self.healthy:
+            if ok:
+                log.warning("Replica hoạt động lại -> đọc từ replica")
+            else:
+                log.warning("Replica lỗi, chuyển đọc về primary: %s", err)
+        self.healthy = ok
+        if not ok:
+            self.last_error = str(err)[:300]
+
+    def _on_error(self, ctx) -> None:
+        if ctx.is_disconnect:
+            self._set(False, ctx.original_exception)
+
+    def check(self) -> bool:
+        self.checks += 1
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except Exception as e:
+            self.failures += 1
+            self._set(False, e)
+            return False
+        self._set(True)
+        return True
+
+    def _loop(self) -> None:
+        while True:
+            self.check()
+            time.sleep(self.interval_sec)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="db-replica-health", daemon=True)
+            self._thread.start()
+
+    def report(self) -> dict:
+        return {
+            "url": self.engine.url.render_as_string(hide_password=True),
+            "healthy": self.healthy,
+            "last_error": self.last_error,
+            "checks": self.checks,
+            "failures": self.failures,
+            "routed": self.routed,
+            "fallbacks": self.fallbacks,
+            "pool": self.engine.pool.status(),
+        }
+
+def _is_plain_select(clause) -> bool:
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+class RoutingSession(Session):
+    """Session chọn engine theo từng câu lệnh (primary / replica), xem READ_ONLY ở trên."""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        info = self.info
+        route = info.get(REPLICA_KEY)
+        if route is None or not info.get(READ_ONLY) or info.get(STICKY_PRIMARY):
+            return super().get_bind(mapper=mapper, clause=clause, **kw)
+        if self._flushing or not _is_plain_select(clause):
+            info[STICKY_PRIMARY] = True
+            return super().get_bind(mapper=mapper, clause=clause, **kw)
+        health, bind = route
+        if not health.healthy:
+            health.fallbacks += 1
+            return super().get_bind(mapper=mapper, clause=clause, **kw)
+        health.routed += 1
+        return bind
+
+def use_primary(db) -> None:
+    """Ép phần còn lại của session đọc/ghi primary (cần dữ liệu mới nhất)."""
+    db.info[STICKY_PRIMARY] = True
+
+def is_read_only_method(method: str) -> bool:
+    return method in ("GET", "HEAD")
 
 # engine ban đầu theo cấu hình
 engine = _make_engine(DB_URL)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+REPLICA_URL = settings.DB_REPLICA_URL
+replica_engine = _make_engine(REPLICA_URL, instrument=False) if REPLICA_URL else None
+replica_health = ReplicaHealth(replica_engine, settings.DB_REPLICA_HEALTH_SEC) if replica_engine is not None else None
+if replica_health is not None:
+    replica_health.start()
+
+SessionLocal = sessionmaker(
+    bind=engine,
+    class_=RoutingSession,
+    autoflush=False,
+    autocommit=False,
+    info={REPLICA_KEY: (replica_health, replica_engine)} if replica_health is not None else {},
+)
 
 def init_db():
-    """Tạo bảng; nếu MySQL không kết nối được và cho phép fallback thì rơi sang SQLite."""
-    global engine, SessionLocal
+    """Chạy migration tới head; nếu MySQL không kết nối được và cho phép fallback thì rơi sang SQLite."""
+    global engine
+    from .migrations import upgrade
 
     try:
-        Base.metadata.create_all(bind=engine)
+        upgrade(engine)
         log.info("DB init OK with %s", DB_URL)
         return
     except OperationalError as e:
@@ -55,13 +205,72 @@ def init_db():
             log.warning("Falling back to SQLite: %s", fallback_url)
             engine = _make_engine(fallback_url)
             SessionLocal.configure(bind=engine)
-            Base.metadata.create_all(bind=engine)
+            upgrade(engine)
         else:
             # không fallback -> ném lỗi để app báo fail
             raise
 
-def get_db():
-    db = SessionLocal()
+# ---------------- Session theo request ----------------
+# Mỗi request tối đa 1 Session, tạo lười khi có chỗ cần dùng; middleware, các
+# dependency get_db trong cùng request dùng chung và luôn được đóng khi response
+# kết thúc (kể cả khi lỗi / StreamingResponse).
+REQUEST_DB_KEY = "app.db_session"
+
+class _LazySession:
+    __slots__ = ("db", "read_only")
+
+    def __init__(self, read_only: bool = False):
+        self.db = None
+        self.read_only = read_only
+
+    def get(self):
+        if self.db is None:
+            self.db = SessionLocal(info={READ_ONLY: True}) if self.read_only else SessionLocal()
+        return self.db
+
+    def close(self):
+        db, self.db = self.db, None
+        if db is not None:
+            db.close()
+
+class RequestDbSessionMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        holder = _LazySession(read_only=is_read_only_method(scope.get("method", "")))
+        scope[REQUEST_DB_KEY] = holder
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if holder.db is not None:
+                await run_in_threadpool(holder.close)
+
+@contextmanager
+def session_scope(read_only: bool = False):
+    """Session dùng ngoài request (job nền, exception handler...) — luôn đóng.
+    read_only=True: job chỉ đọc (báo cáo, export) được đọc từ replica."""
+    db = SessionLocal(info={READ_ONLY: True}) if read_only else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def request_db(request: Request):
+    """Session của request hiện tại (tạo nếu chưa có); None nếu không có middleware."""
+    holder = request.scope.get(REQUEST_DB_KEY)
+    return holder.get() if holder is not None else None
+
+def get_db(request: Request):
+    holder = request.scope.get(REQUEST_DB_KEY)
+    if holder is not None:
+        # đóng bởi RequestDbSessionMiddleware khi response xong
+        yield holder.get()
+        return
+    db = SessionLocal(info={READ_ONLY: True}) if is_read_only_method(request.method) else SessionLocal()
     try:
         yield db
     finally:
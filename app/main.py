@@ -1,24 +1,35 @@
 # app/main.py
 import os
-import uuid
-from time import time as _now
 
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
-from starlette.middleware.sessions import SessionMiddleware
+from app.core.session import (
+    SESSION_BACKEND,
+    DirtySessionMiddleware,
+    ServerSessionMiddleware,
+    build_session_store,
+)
+from app.core.request_policy import RequestPolicyMiddleware
 from starlette.responses import JSONResponse, RedirectResponse
 
-from app.db.base import Base
-from app.db.session import engine, get_db
+from app.db.session import engine, session_scope, RequestDbSessionMiddleware
+from app.db.async_session import dispose_async_engine
+from app.db.migrations import ensure_at_head
+from app.db.query_stats import QueryStatsMiddleware
+from app.core.timing import SERVER_TIMING_SAMPLE, ServerTimingMiddleware, TimedJSONResponse
+from app.core import metrics
+from app.core.profiler import ProfilerMiddleware
+from starlette.concurrency import run_in_threadpool
+from app.core.principal import principal_cache
 
 # Routers
 from app.routers import health, applicants, checklist, export, batch
 from app.routers import auth, admin, journal
 from app.routers import account  #trang thông tin tài khoản
-from urllib.parse import quote
+from app.routers import metrics as metrics_router
 
 # Dùng chung hằng số timeout với auth.py để không lệch
-from app.routers.auth import IDLE_TIMEOUT_SEC as AUTH_IDLE_TIMEOUT_SEC
+from app.routers.auth import IDLE_TIMEOUT_SEC as AUTH_IDLE_TIMEOUT_SEC, SESSION_TOUCH_SEC, touch_last_seen
 
 # (tuỳ) audit
 try:
@@ -26,26 +37,10 @@ try:
 except Exception:
     write_audit = None  # fallback an toàn
 
-app = FastAPI()
-
-# ---------------- Session cookie ----------------
-app.add_middleware(
-    SessionMiddleware,
-    secret_key=os.getenv("SESSION_SECRET", "change-me-please"),
-    max_age=60 * 60 * 24 * 7,  # 7 ngày
-    same_site="lax",
-)
-
-# ---------------- Correlation-ID ----------------
-@app.middleware("http")
-async def add_correlation_id(request: Request, call_next):
-    cid = request.headers.get("X-Correlation-ID") or str(uuid.uuid4())
-    request.state.correlation_id = cid
-    resp = await call_next(request)
-    resp.headers["X-Correlation-ID"] = cid
-    return resp
+# JSONResponse có đo bước encode (span "json" của Server-Timing)
+app = FastAPI(default_response_class=TimedJSONResponse)
 
-# ---------------- Idle timeout ----------------
+# ---------------- Idle timeout / ép đổi mật khẩu: đường được bỏ qua ----------------
 MAX_IDLE_SECONDS = AUTH_IDLE_TIMEOUT_SEC  # 1h từ auth.py
 
 WHITELIST_PREFIXES = (
@@ -53,7 +48,7 @@ WHITELIST_PREFIXES = (
     "/ams_home.html",
     "/login", "/api/login",
     "/logout", "/api/logout",
-    "/health", "/api/health",
+    "/health", "/api/health", "/metrics",
     "/auth_login.html",
     "/hutech.png", "/favicon",
     "/static", "/assets",
@@ -66,123 +61,108 @@ STATIC_EXTS = (
     ".ico", ".map", ".woff", ".woff2", ".ttf", ".html"
 )
 
-@app.middleware("http")
-async def idle_timeout_middleware(request: Request, call_next):
-    path = request.url.path
-
-    # Cho phép truy cập các đường tĩnh / whitelist
-    if path.startswith(WHITELIST_PREFIXES) or path.lower().endswith(STATIC_EXTS):
-        return await call_next(request)
-
-    # Không có session -> tiếp tục bình thường
-    if "session" not in request.scope:
-        return await call_next(request)
-
-    sess = request.session
-    uid = sess.get("uid")
-
-    if uid:
-        now = int(_now())
-        last = int(sess.get("_last_seen") or 0)
-        if last and now - last > MAX_IDLE_SECONDS:
-            # Hết hạn phiên
-            request.session.clear()
-
-            if path.startswith("/api"):
-                # API: 401 + header để FE biết bật thông báo
-                return JSONResponse(
-                    {"detail": "Phiên đăng nhập đã hết hạn, vui lòng đăng nhập lại!"},
-                    status_code=401,
-                    headers={"X-Session-Expired": "1"}
-                )
-
-            # Web: đặt cookie cờ + redirect về login?expired=1
-            next_q = quote(str(request.url.path) + (("?" + request.url.query) if request.url.query else ""))
-            resp = RedirectResponse(url=f"/login?expired=1&next={next_q}", status_code=302)
-            # Cookie *không* httponly để JS đọc và show toast; sống 30 giây
-            resp.set_cookie(
-                key="__session_expired",
-                value="1",
-                max_age=30,
-                path="/",
-                secure=False,      # Nếu anh chạy HTTPS có thể đặt True
-                httponly=False,    # cho phép JS đọc
-                samesite="lax",
-            )
-            return resp
-
-        # Còn hạn → cập nhật dấu vết
-        sess["_last_seen"] = now
-
-    return await call_next(request)
-
-# ---------------- Ép đổi mật khẩu lần đầu ----------------
 ENFORCE_CHANGE_WHITELIST = (
     "/account", "/account/change-password", "/api/account/change-password",  # cho phép trang + API đổi pass
     "/login", "/api/login", "/logout", "/api/logout",
-    "/health", "/api/health",
+    "/health", "/api/health", "/metrics",
     "/auth_login.html",
     "/hutech.png", "/favicon",
     "/static", "/assets",
     "/journal.html",
 )
 
-from starlette.status import HTTP_403_FORBIDDEN
-
-@app.middleware("http")
-async def enforce_first_change_password(request: Request, call_next):
-    path = request.url.path
-
-    # file tĩnh & đường cho phép
-    if path.startswith(ENFORCE_CHANGE_WHITELIST) or path.lower().endswith(STATIC_EXTS):
-        return await call_next(request)
+def _load_must_change(uid) -> bool:
+    p = principal_cache.get(uid)
+    return bool(p.must_change_password) if p else False
 
-    # chưa đăng nhập thì thôi
-    sess = request.session if "session" in request.scope else None
-    uid = sess.get("uid") if sess else None
-    if not uid:
-        return await call_next(request)
-
-    must_change = sess.get("must_change_password")
-    if must_change is None:
-        # nạp 1 lần rồi cache vào session
-        try:
-            db = next(get_db())
-            from app.models.user import User
-            u = db.get(User, uid)
-            must_change = bool(u.must_change_password) if u else False
-        except Exception:
-            must_change = False
-        sess["must_change_password"] = must_change
+# ---------------- Correlation-ID + idle timeout + ép đổi mật khẩu ----------------
+# Một middleware ASGI thuần (app/core/request_policy.py), thêm TRƯỚC session
+# middleware để nằm bên trong nó (đã có scope["session"]).
+app.add_middleware(
+    RequestPolicyMiddleware,
+    idle_timeout=MAX_IDLE_SECONDS,
+    idle_whitelist=WHITELIST_PREFIXES,
+    change_whitelist=ENFORCE_CHANGE_WHITELIST,
+    static_exts=STATIC_EXTS,
+    touch_last_seen=touch_last_seen,
+    load_must_change=_load_must_change,
+)
 
-    if must_change:
-        # API → trả JSON 403
-        if path.startswith("/api"):
-            return JSONResponse(
-                {"detail": "Vui lòng đổi mật khẩu trước khi tiếp tục.", "force_change": True},
-                status_code=HTTP_403_FORBIDDEN
-            )
-        # Web → ép về trang account
-        return RedirectResponse(url="/account?first=1", status_code=302)
+# ---------------- Profile theo yêu cầu (Admin, X-Profile: 1) ----------------
+# Bên trong session middleware (cần session để kiểm tra Admin), bên ngoài policy.
+app.add_middleware(ProfilerMiddleware, load_principal=principal_cache.aget)
 
-    return await call_next(request)
+# ---------------- Session cookie ----------------
+# SESSION_BACKEND=cookie: toàn bộ session trong cookie ký, chỉ ký lại khi đổi
+# SESSION_BACKEND=memory|db: session lưu phía server, cookie chỉ giữ id
+if SESSION_BACKEND == "cookie":
+    app.add_middleware(
+        DirtySessionMiddleware,
+        secret_key=os.getenv("SESSION_SECRET", "change-me-please"),
+        max_age=60 * 60 * 24 * 7,  # 7 ngày
+        same_site="lax",
+    )
+else:
+    app.add_middleware(
+        ServerSessionMiddleware,
+        secret_key=os.getenv("SESSION_SECRET", "change-me-please"),
+        store=build_session_store(SESSION_BACKEND),
+        idle_timeout=AUTH_IDLE_TIMEOUT_SEC,
+        touch_sec=SESSION_TOUCH_SEC,
+        max_age=60 * 60 * 24 * 7,
+        same_site="lax",
+    )
+
+# ---------------- Session DB theo request ----------------
+# Thêm sau cùng -> ngoài cùng: bao cả session/policy middleware, đóng Session
+# của request khi response kết thúc.
+app.add_middleware(RequestDbSessionMiddleware)
+
+# ---------------- Server-Timing (SERVER_TIMING_SAMPLE > 0 mới bật) ----------------
+# Bên trong QueryStatsMiddleware để lấy được thời gian DB của request.
+if SERVER_TIMING_SAMPLE > 0:
+    app.add_middleware(ServerTimingMiddleware, sample=SERVER_TIMING_SAMPLE)
+
+# ---------------- Đếm SQL / access log theo request ----------------
+# Bọc ngoài session/policy: tính cả SQL của session store và lúc đóng Session của request.
+app.add_middleware(QueryStatsMiddleware)
+
+# ---------------- Prometheus: đếm request / latency theo route ----------------
+# Thêm sau cùng -> ngoài cùng, latency gồm cả mọi middleware ở trên.
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+# ---------------- Pool bcrypt đầy -> 503 ----------------
+from app.core.security import HashPoolBusy
+
+@app.exception_handler(HashPoolBusy)
+async def hash_pool_busy_handler(request: Request, exc: HashPoolBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Hệ thống đang bận xử lý đăng nhập, vui lòng thử lại sau giây lát."},
+        headers={"Retry-After": "1"},
+    )
 
 # ---------------- Global exception handler ----------------
+def _audit_exception(request: Request, exc: Exception) -> None:
+    # chạy sau khi session của request đã đóng -> dùng session riêng, luôn đóng
+    with session_scope() as db:
+        write_audit(
+            db,
+            action="EXCEPTION",
+            target_type="System",
+            target_id=None,
+            status="FAILURE",
+            new_values={"path": request.url.path, "error": type(exc).__name__},
+            request=request,
+        )
+        db.commit()
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     try:
         if write_audit:
-            db = next(get_db())
-            write_audit(
-                db,
-                action="EXCEPTION",
-                target_type="System",
-                target_id=None,
-                status="FAILURE",
-                new_values={"path": request.url.path, "error": type(exc).__name__},
-                request=request,
-            )
-            db.commit()
+            await run_in_threadpool(_audit_exception, request, exc)
     except Exception:
         pass
     return JSONResponse(status_code=500, content={"detail": "Đã xảy ra lỗi không xác định. Vui lòng thử lại."})
@@ -191,6 +171,8 @@ async def global_exception_handler(request: Request, exc: Exception):
 app.include_router(auth.router,    tags=["Auth"])
 app.include_router(admin.router,   tags=["Admin"])
 app.include_router(account.router, tags=["Account"])
+if metrics.METRICS_ENABLED:
+    app.include_router(metrics_router.router, tags=["Metrics"])
 
 # API chuẩn
 app.include_router(health.router,     prefix="/api", tags=["Health"])
@@ -207,7 +189,16 @@ for r in (health.router, checklist.router, applicants.router, batch.router, expo
 # ---------------- Startup ----------------
 @app.on_event("startup")
 def startup():
-    Base.metadata.create_all(bind=engine)
+    # Chỉ kiểm tra schema đã ở head (1 câu SELECT); thiếu thì tự nâng cấp hoặc
+    # báo chạy `python -m app.db.migrations upgrade` (DB_AUTO_MIGRATE=0)
+    ensure_at_head(engine)
+    # METRICS_MULTIPROC_DIR: worker ghi snapshot định kỳ cho /metrics gộp
+    metrics.start()
+
+@app.on_event("shutdown")
+async def _close_async_db():
+    await dispose_async_engine()
+    metrics.stop()
 
 @app.on_event("startup")
 def _log_routes():
@@ -6,6 +6,8 @@ from .applicant import Applicant, ApplicantDoc
 from .checklist import ChecklistItem, ChecklistVersion
 from .user import User
 from .user_models import Student, Application
+from .web_session import WebSession
+from .audit import AuditLog, DeletionRequest
 
 __all__ = [
     "Base",
@@ -16,4 +18,7 @@ __all__ = [
     "User",
     "Student",
     "Application",
+    "WebSession",
+    "AuditLog",
+    "DeletionRequest",
 ]
@@ -1,6 +1,6 @@
 # app/models/applicant.py
 from sqlalchemy import (
-    Column, String, Date, Integer, Boolean, ForeignKey, Text, DateTime, text
+    Column, String, Date, Integer, Boolean, ForeignKey, Text, DateTime, Index, text
 )
 from sqlalchemy.orm import relationship
 from app.db.base import Base
@@ -53,6 +53,17 @@ class Applicant(Base):
         lazy="selectin",
     )
 
+    __table_args__ = (
+        # Export/in theo ngày: range trên ngay_nhan_hs + ORDER BY created_at, ma_so_hv
+        Index("ix_applicants_ngay_created_mssv", "ngay_nhan_hs", "created_at", "ma_so_hv"),
+        # Tìm kiếm / danh sách mới nhất: ORDER BY created_at DESC LIMIT
+        Index("ix_applicants_created_at", "created_at"),
+        # Sinh mã hồ sơ (_next_seq4): khoa = ? AND dot = ?; export/in theo khoá
+        Index("ix_applicants_khoa_dot", "khoa", "dot"),
+        # Lọc theo trạng thái (soft delete, đã in...) + sắp theo created_at
+        Index("ix_applicants_status_created", "status", "created_at"),
+    )
+
 # ================= ApplicantDoc =================
 class ApplicantDoc(Base):
     __tablename__ = "applicant_docs"
@@ -1,5 +1,5 @@
 # app/models/audit.py
-from sqlalchemy import Column, Integer, String, DateTime, JSON, Text, func, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Text, func, ForeignKey, Index
 from app.db.base import Base
 
 class AuditLog(Base):
@@ -26,6 +26,15 @@ class AuditLog(Base):
     prev_values = Column(JSON, nullable=True)
     new_values  = Column(JSON, nullable=True)
 
+    # Nhật ký (/journal): mặc định ORDER BY occurred_at DESC + lọc khoảng ngày,
+    # lọc bằng action / target, sắp theo actor_name
+    __table_args__ = (
+        Index("ix_audit_logs_occurred_at", "occurred_at"),
+        Index("ix_audit_logs_action_occurred", "action", "occurred_at"),
+        Index("ix_audit_logs_target_occurred", "target_type", "target_id", "occurred_at"),
+        Index("ix_audit_logs_actor_occurred", "actor_name", "occurred_at"),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, func, Date
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, func, Date, Index
 from app.db.base import Base
 
 class User(Base):
@@ -30,5 +30,10 @@ class User(Base):
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
+    __table_args__ = (
+        # Đăng nhập bằng email, kiểm tra trùng email khi tạo/sửa user
+        Index("ix_users_email", "email"),
+    )
+
     def __repr__(self) -> str:
         return f"<User(id={self.id}, username='{self.username}', role='{self.role}')>"
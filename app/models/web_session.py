@@ -0,0 +1,13 @@
+# app/models/web_session.py
+from sqlalchemy import Column, Integer, String, Text
+from app.db.base import Base
+
+class WebSession(Base):
+    """Session phía server (SESSION_BACKEND=db): cookie chỉ giữ id."""
+    __tablename__ = "web_sessions"
+
+    id = Column(String(64), primary_key=True)
+    user_id = Column(Integer, nullable=True, index=True)   # thu hồi theo user
+    data = Column(Text, nullable=False)                    # JSON
+    last_seen = Column(Integer, nullable=False, index=True)  # epoch giây, cho sweeper
+    created_at = Column(Integer, nullable=False)
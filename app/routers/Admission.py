@@ -1,7 +1,7 @@
 # app/routers/Admission.py
 import os
 import pandas as pd
-from fastapi import APIRouter, Request, Depends, UploadFile, File, HTTPException
+from fastapi import APIRouter, Request, Depends, UploadFile, File, HTTPException, Query
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
@@ -10,7 +10,9 @@ from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app.models import Student, Application, User
 from .auth import require_roles, get_current_user
+from app.core.principal import Principal
 from app.routers.checklist import _get_active
+from app.services.student_import import IMPORT_MODES, StudentImporter, missing_required, report_message
 
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
@@ -22,10 +24,15 @@ router = APIRouter(prefix="/Admission", tags=["Admission"])
 # Import học viên
 # =====================
 
+def _check_mode(mode: str):
+    if mode not in IMPORT_MODES:
+        raise HTTPException(status_code=400, detail=f"mode phải là một trong: {', '.join(IMPORT_MODES)}")
+
+
 @router.get("/import", response_class=HTMLResponse)
 def import_page(
     request: Request,
-    me: User = Depends(require_roles("Admin", "NhanVien")),   # quyền import: Admin + Nhân viên
+    me: Principal = Depends(require_roles("Admin", "NhanVien")),   # quyền import: Admin + Nhân viên
 ):
     return templates.TemplateResponse("import_students.html", {"request": request, "me": me, "msg": None})
 
@@ -34,9 +41,11 @@ def import_page(
 def import_students(
     request: Request,
     file: UploadFile = File(...),
-    me: User = Depends(require_roles("Admin", "NhanVien")),
+    mode: str = Query("insert", description="insert: bỏ qua mã đã có | upsert: cập nhật mã đã có"),
+    me: Principal = Depends(require_roles("Admin", "NhanVien")),
     db: Session = Depends(get_db),
 ):
+    _check_mode(mode)
     # Đọc file
     fname = file.filename.lower()
     try:
@@ -50,45 +59,18 @@ def import_students(
         raise HTTPException(status_code=400, detail=f"Lỗi đọc file: {e}")
 
     # Cột tối thiểu
-    required_cols = {"student_code", "full_name"}
-    missing = [c for c in required_cols if c not in df.columns]
+    missing = missing_required(df.columns)
     if missing:
         raise HTTPException(status_code=400, detail=f"Thiếu cột bắt buộc: {', '.join(missing)}")
 
-    created, skipped = 0, 0
-    for _, row in df.iterrows():
-        code = (row.get("student_code") or "").strip()
-        name = (row.get("full_name") or "").strip()
-        if not code or not name:
-            continue
-
-        # bỏ qua nếu đã có
-        if db.query(Student).filter(Student.student_code == code).first():
-            skipped += 1
-            continue
-
-        # ✅ thêm dân tộc nếu có trong file
-        dan_toc_val = (row.get("dan_toc") or row.get("Dân tộc") or "").strip()
-
-        s = Student(
-            student_code=code,
-            full_name=name,
-            dob=(row.get("dob") or "").strip(),
-            gender=(row.get("gender") or "").strip(),
-            phone=(row.get("phone") or "").strip(),
-            email=(row.get("email") or "").strip(),
-            id_number=(row.get("id_number") or "").strip(),
-            address=(row.get("address") or "").strip(),
-            dan_toc=dan_toc_val,
-            note=(row.get("note") or "").strip(),
-            created_by_user_id=me.id,
-        )
-        db.add(s)
-        created += 1
-
-    db.commit()
-    msg = f"Tạo {created} học viên mới, bỏ qua {skipped} (đã tồn tại)."
-    return templates.TemplateResponse("import_students.html", {"request": request, "me": me, "msg": msg})
+    # Chuẩn hoá theo cột, lọc trùng bằng pandas, kiểm tra tồn tại bằng IN, insert theo chunk
+    importer = StudentImporter(db, created_by_user_id=me.id, mode=mode, request=request)
+    importer.feed(df)
+    report = importer.report()
+    msg = report_message(report)
+    return templates.TemplateResponse(
+        "import_students.html", {"request": request, "me": me, "msg": msg, "report": report}
+    )
 
 # =====================
 # Danh sách học viên
@@ -97,7 +79,7 @@ def import_students(
 @router.get("/students", response_class=HTMLResponse)
 def students_list(
     request: Request,
-    me: User = Depends(require_roles("Admin", "NhanVien", "CongTacVien")),
+    me: Principal = Depends(require_roles("Admin", "NhanVien", "CongTacVien")),
     db: Session = Depends(get_db),
 ):
     students = db.query(Student).order_by(Student.created_at.desc()).all()
@@ -6,11 +6,13 @@ from fastapi import APIRouter, Depends, Request, Form
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from app.db.session import get_db
 from app.models.user import User
 from app.routers.auth import require_user as require_login
-from app.core.security import verify_password, hash_password
+from app.core.principal import principal_cache
+from app.core.security import HashPoolBusy, verify_password_async, hash_password_async
 
 router = APIRouter()
 
@@ -52,8 +54,15 @@ def account_view(
         },
     )
 
+def _save_new_password(db: Session, me: User, new_hash: str) -> None:
+    me.password_hash = new_hash
+    me.must_change_password = False
+    me.password_changed_at = datetime.now(timezone.utc)
+    # ❗ KHÔNG xóa reset_password_hash: tiếp tục cấm dùng lại mật khẩu reset cũ
+    db.commit()
+
 @router.post("/account/change-password")
-def account_change_password(
+async def account_change_password(
     request: Request,
     old_password: str = Form(...),
     new_password: str = Form(...),
@@ -61,7 +70,7 @@ def account_change_password(
     me: User = Depends(require_login),
     db: Session = Depends(get_db),
 ):
-    """Đổi mật khẩu tài khoản hiện tại"""
+    """Đổi mật khẩu tài khoản hiện tại (bcrypt chạy ở pool riêng, DB ở threadpool)"""
     # Validate cơ bản
     if len(new_password) < 6:
         _flash(request, "Mật khẩu mới tối thiểu 6 ký tự!", "error")
@@ -69,7 +78,7 @@ def account_change_password(
     if new_password != confirm_password:
         _flash(request, "Xác nhận mật khẩu không khớp!", "error")
         return RedirectResponse(url="/account", status_code=302)
-    if not verify_password(old_password, me.password_hash):
+    if not await verify_password_async(old_password, me.password_hash):
         _flash(request, "Mật khẩu hiện tại không đúng!", "error")
         return RedirectResponse(url="/account", status_code=302)
 
@@ -83,30 +92,31 @@ def account_change_password(
 
     if reset_hash:
         try:
-            if verify_password(new_password, reset_hash):
+            if await verify_password_async(new_password, reset_hash):
                 _flash(
                     request,
                     "Mật khẩu mới không được trùng với mật khẩu cũ!",
                     "error",
                 )
                 return RedirectResponse(url="/account", status_code=302)
+        except HashPoolBusy:
+            raise
         except Exception:
             pass  # hash rỗng/hỏng -> bỏ qua check thay vì crash
 
-    # Lưu DB
+    # Băm trước (pool đầy -> 503), rồi mới lưu DB
+    new_hash = await hash_password_async(new_password)
+    uid = me.id  # commit làm `me` hết hạn -> đọc lại me.id ở đây sẽ query DB trên event loop
     try:
-        me.password_hash = hash_password(new_password)
-        me.must_change_password = False
-        me.password_changed_at = datetime.now(timezone.utc)
-        # ❗ KHÔNG xóa reset_password_hash: tiếp tục cấm dùng lại mật khẩu reset cũ
-        db.commit()
+        await run_in_threadpool(_save_new_password, db, me, new_hash)
+        principal_cache.invalidate(uid)
 
         # Đồng bộ session
         request.session["must_change_password"] = False
 
         _flash(request, "Đổi mật khẩu thành công!", "success")
     except Exception:
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         _flash(request, "Không thể đổi mật khẩu. Vui lòng thử lại!", "error")
 
     return RedirectResponse(url="/account", status_code=302)
@@ -139,11 +149,13 @@ def account_update_profile(
             return RedirectResponse(url="/account", status_code=302)
 
     # Lưu DB
+    uid = me.id
     try:
         me.full_name = (full_name or "").strip() or None
         me.email = email_norm
         me.dob = dob_val
         db.commit()
+        principal_cache.invalidate(uid)  # full_name/email nằm trong Principal đã cache
         _flash(request, "Cập nhật thông tin tài khoản thành công!", "success")
     except Exception:
         db.rollback()
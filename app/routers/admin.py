@@ -10,9 +10,17 @@ from sqlalchemy.orm import Session
 from sqlalchemy import or_
 
 from app.db.session import get_db
+from app.db.async_session import async_pool_status
 from app.models.user import User
 from app.routers.auth import require_admin  # guard Admin
-from app.core.security import hash_password  # dùng context chung
+from app.core.principal import Principal, principal_cache
+from app.core.session import get_session_store, revoke_user_sessions
+from app.core.rate_limit import rate_limit_stats
+from app.core.config import settings
+from app.db import session as db_session
+from app.db.pool_watch import pool_report
+from app.core.security import hash_password, hash_password_pooled, hash_pool_stats  # dùng context chung
+from app.core.profiler import profile_store, sampler
 
 router = APIRouter()
 
@@ -25,7 +33,7 @@ VALID_ROLES = {"Admin", "NhanVien", "CongTacVien"}
 @router.get("/admin")
 def admin_index(
     request: Request,
-    me: User = Depends(require_admin),
+    me: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     users = db.query(User).order_by(User.id.desc()).all()
@@ -42,7 +50,7 @@ def admin_create_user(
     email: str = Form(""),
     role: str = Form("NhanVien"),
     dob: Optional[str] = Form(None),  # <-- thêm ngày sinh (YYYY-MM-DD)
-    me: User = Depends(require_admin),
+    me: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     username = (username or "").strip()
@@ -97,7 +105,7 @@ def admin_update_user(
     dob: Optional[str] = Form(None),
     role: str = Form(...),
     is_active: Optional[str] = Form(None),  # "on" hoặc None nếu dùng checkbox
-    me: User = Depends(require_admin),
+    me: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     u = db.get(User, user_id)
@@ -140,12 +148,15 @@ def admin_update_user(
     except Exception:
         db.rollback()
         raise HTTPException(500, "Không cập nhật được người dùng")
+    principal_cache.invalidate(u.id)
+    if not u.is_active:
+        revoke_user_sessions(u.id)
     return RedirectResponse(url="/admin", status_code=302)
 
 @router.post("/admin/users/toggle")
 def admin_toggle_user(
     user_id: int = Form(...),
-    me: User = Depends(require_admin),
+    me: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     u = db.get(User, user_id)
@@ -159,13 +170,16 @@ def admin_toggle_user(
     except Exception:
         db.rollback()
         raise HTTPException(500, "Không cập nhật được trạng thái người dùng.")
+    principal_cache.invalidate(u.id)
+    if not u.is_active:
+        revoke_user_sessions(u.id)  # khoá -> đăng xuất mọi phiên (backend server-side)
     return RedirectResponse(url="/admin", status_code=302)
 
 @router.post("/admin/users/reset-pass")
 def admin_reset_pass(
     user_id: int = Form(...),
     new_password: str = Form(...),
-    me: User = Depends(require_admin),
+    me: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     if len(new_password) < 6:
@@ -173,12 +187,63 @@ def admin_reset_pass(
     u = db.get(User, user_id)
     if not u:
         raise HTTPException(404, "User not found")
+    # băm trên pool bcrypt riêng (đầy -> 503), ngoài try để không thành 500
+    new_hash = hash_password_pooled(new_password)
     try:
-        u.password_hash = hash_password(new_password)
+        u.password_hash = new_hash
         u.must_change_password = True
         u.password_changed_at = None
         db.commit()
     except Exception:
         db.rollback()
         raise HTTPException(500, "Không đặt lại được mật khẩu.")
+    principal_cache.invalidate(u.id)
+    revoke_user_sessions(u.id)
     return RedirectResponse(url="/admin", status_code=302)
+
+@router.get("/admin/stats/hash-pool")
+def admin_hash_pool_stats(me: Principal = Depends(require_admin)):
+    """Số việc bcrypt đang chạy/chờ, số lần từ chối vì đầy."""
+    return hash_pool_stats()
+
+@router.get("/admin/stats/principal-cache")
+def admin_principal_cache_stats(me: Principal = Depends(require_admin)):
+    return principal_cache.stats()
+
+@router.get("/admin/stats/sessions")
+def admin_session_stats(me: Principal = Depends(require_admin)):
+    store = get_session_store()
+    return store.stats() if store is not None else {"backend": "cookie"}
+
+@router.get("/admin/stats/rate-limit")
+def admin_rate_limit_stats(me: Principal = Depends(require_admin)):
+    return rate_limit_stats()
+
+@router.get("/admin/stats/db-pool")
+async def admin_db_pool_stats(me: Principal = Depends(require_admin)):
+    """Pool DB hiện tại + số liệu chờ/timeout, so với số thread của threadpool."""
+    import anyio.to_thread
+    out = pool_report(db_session.engine)
+    out["settings"] = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_use_lifo": settings.DB_POOL_USE_LIFO,
+    }
+    out["threadpool_tokens"] = anyio.to_thread.current_default_thread_limiter().total_tokens
+    out["async_pool"] = async_pool_status()  # None nếu chưa route async nào chạy
+    out["replica"] = db_session.replica_health.report() if db_session.replica_health is not None else None
+    return out
+
+@router.get("/admin/profiles")
+def admin_profiles(me: Principal = Depends(require_admin)):
+    """Các báo cáo profile còn lưu (mới nhất trước). Tạo bằng header X-Profile: 1."""
+    return {"active": sampler.active(), "rejected": sampler.rejected, "items": profile_store.list()}
+
+@router.get("/admin/profiles/{correlation_id}")
+def admin_profile_detail(correlation_id: str, me: Principal = Depends(require_admin)):
+    report = profile_store.get(correlation_id)
+    if report is None:
+        raise HTTPException(404, "Không tìm thấy báo cáo profile (đã hết hạn hoặc sai mã)")
+    return report
@@ -5,17 +5,31 @@ import io, re, os, hmac, json, hashlib
 from datetime import datetime, date
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Body, status, Request, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, status, Request, Response, UploadFile, File, Form
 from fastapi.responses import StreamingResponse
-from sqlalchemy import or_, and_, func
+from sqlalchemy import or_, and_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
 from app.db.session import get_db
+from app.db.async_session import get_async_db
 from app.models.applicant import Applicant, ApplicantDoc
 from app.models.checklist import ChecklistItem, ChecklistVersion
 from app.routers.auth import require_roles
-from app.services.audit import write_audit
+from app.services.audit import audit_context, write_audit
+from app.services.applicant_fields import (
+    FIELD_DEFS,
+    MSG_BAD_MSSV,
+    MSSV_REGEX,
+    normalize_gender,
+    parse_date_flexible,
+    parse_ngay_sinh,
+)
+from app.services.applicant_import import BULK_MAX_ROWS, IMPORT_MODES, ApplicantImporter, bulk_create_applicants
+from app.services.applicant_validate import validate_file
+from app.services.import_jobs import cancel_job, get_job, save_upload, start_import_job
+from app.services.import_reader import FILE_READ_ERRORS, file_kind
 import re
 
 from app.utils.soft_delete import exclude_deleted
@@ -94,10 +108,6 @@ def _next_seq4(db: Session, khoa: Optional[str], dot: Optional[str]) -> str:
 
 
 # ================= Helpers =================
-DATE_DMY = re.compile(r"^(\d{1,2})[\/\-](\d{1,2})[\/\-](\d{4})$")
-DATE_YMD = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
-MSSV_REGEX = re.compile(r"^\d{10}$")
-
 DELETE_KEY_SECRET = os.getenv("DELETE_KEY_SECRET", "delete-dev")
 
 
@@ -111,35 +121,11 @@ def verify_delete_key(key: str) -> bool:
 
 def ensure_mssv(v: str):
     if not MSSV_REGEX.fullmatch(v or ""):
-        raise HTTPException(status_code=422, detail="MSSV phải gồm đúng 10 chữ số.")
-
-
-def _parse_date_flexible(v: Optional[object]) -> Optional[date]:
-    if v in (None, ""):
-        return None
-    if isinstance(v, date) and not isinstance(v, datetime):
-        return v
-    if isinstance(v, datetime):
-        return v.date()
-    s = str(v).strip()
-    if not s:
-        return None
-    m = DATE_DMY.match(s)
-    if m:
-        d, mth, y = map(int, m.groups())
-        return date(y, mth, d)
-    m = DATE_YMD.match(s)
-    if m:
-        y, mth, d = map(int, m.groups())
-        return date(y, mth, d)
-    try:
-        return datetime.fromisoformat(s).date()
-    except Exception:
-        return None
+        raise HTTPException(status_code=422, detail=MSG_BAD_MSSV)
 
 
 def _to_dmy(v: Optional[object]) -> Optional[str]:
-    d = _parse_date_flexible(v)
+    d = parse_date_flexible(v)
     return f"{d.day:02d}/{d.month:02d}/{d.year:04d}" if d else None
 
 
@@ -150,23 +136,10 @@ def _to_iso(v: Optional[object]) -> Optional[str]:
         return v.isoformat()
     if isinstance(v, date):
         return datetime.combine(v, datetime.min.time()).isoformat()
-    d = _parse_date_flexible(v)
+    d = parse_date_flexible(v)
     return datetime.combine(d, datetime.min.time()).isoformat() if d else None
 
 
-# 🆕 Chuẩn hóa giới tính
-def _normalize_gender(v):
-    if v is None:
-        return None
-    s = str(v).strip().lower()
-    if s in {"nam", "m", "male", "1", "true"}:
-        return "Nam"
-    if s in {"nữ", "nu", "f", "female", "0", "false"}:
-        return "Nữ"
-    # nếu FE gửi "Nam"/"Nữ"/khác đúng ý thì giữ nguyên
-    return v
-
-
 def snapshot_applicant(a: Applicant) -> dict:
     """Chụp nhanh bản ghi để ghi audit (prev/new)."""
     if not a:
@@ -218,10 +191,10 @@ def _docs_map(db: Session, mshv: str) -> dict[str, int]:
 
 # ================= GET by code =================
 @router.get("/by-code/{key}")
-def get_by_code(
+async def get_by_code(
     key: str,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     me=Depends(require_roles("Admin", "NhanVien", "CongTacVien")),
 ):
     k = (key or "").strip()
@@ -235,37 +208,37 @@ def get_by_code(
             new_values={"reason": "missing key"},
             request=request
         )
-        db.commit()
+        await db.commit()
         raise HTTPException(400, "Thiếu mã tra cứu")
 
-    a = (
-        db.query(Applicant)
-        .filter(func.lower(Applicant.ma_ho_so) == k.lower())
+    a = await db.scalar(
+        select(Applicant)
+        .where(func.lower(Applicant.ma_ho_so) == k.lower())
         .order_by(Applicant.created_at.desc())
-        .first()
+        .limit(1)
     )
     if not a and MSSV_REGEX.fullmatch(k):
-        a = db.query(Applicant).filter(Applicant.ma_so_hv == k).first()
+        a = await db.scalar(select(Applicant).where(Applicant.ma_so_hv == k).limit(1))
     if not a:
-        a = (
-            db.query(Applicant)
-            .filter(Applicant.ma_ho_so.ilike(f"%{k}%"))
+        a = await db.scalar(
+            select(Applicant)
+            .where(Applicant.ma_ho_so.ilike(f"%{k}%"))
             .order_by(Applicant.created_at.desc())
-            .first()
+            .limit(1)
         )
 
     if not a:
         write_audit(db, action="READ", target_type="Applicant", target_id=k, status="FAILURE", request=request)
-        db.commit()
+        await db.commit()
         raise HTTPException(404, "Not Found")
 
     # Chặn hồ sơ đã xoá mềm
     if hasattr(Applicant, "deleted_at") and getattr(a, "deleted_at", None):
         raise HTTPException(410, "Hồ sơ đã bị xoá tạm.")
 
-    docs = db.query(ApplicantDoc).filter(
-        ApplicantDoc.applicant_ma_so_hv == a.ma_so_hv
-    ).all()
+    docs = (await db.scalars(
+        select(ApplicantDoc).where(ApplicantDoc.applicant_ma_so_hv == a.ma_so_hv)
+    )).all()
 
     def pick(obj, *names):
         for n in names:
@@ -303,7 +276,7 @@ def get_by_code(
     }
 
     write_audit(db, action="READ", target_type="Applicant", target_id=a.ma_so_hv, status="SUCCESS", request=request)
-    db.commit()
+    await db.commit()
 
     return {
         "applicant": applicant_payload,
@@ -312,33 +285,33 @@ def get_by_code(
 
 
 @router.get("/by-mshv/{ma_so_hv}")
-def get_by_mshv(
+async def get_by_mshv(
     ma_so_hv: str,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user=Depends(require_roles("Admin", "NhanVien", "CongTacVien")),
 ):
     key = (ma_so_hv or "").strip()
     if not key:
         write_audit(db, action="READ", target_type="Applicant", target_id=None, status="FAILURE", request=request)
-        db.commit()
+        await db.commit()
         raise HTTPException(status_code=400, detail="Thiếu MSHV")
 
-    a = db.query(Applicant).filter(func.lower(Applicant.ma_so_hv) == key.lower()).first()
+    a = await db.scalar(select(Applicant).where(func.lower(Applicant.ma_so_hv) == key.lower()).limit(1))
     if not a:
-        a = db.query(Applicant).filter(Applicant.ma_so_hv.ilike(f"%{key}%")).first()
+        a = await db.scalar(select(Applicant).where(Applicant.ma_so_hv.ilike(f"%{key}%")).limit(1))
     if not a:
         write_audit(db, action="READ", target_type="Applicant", target_id=key, status="FAILURE", request=request)
-        db.commit()
+        await db.commit()
         raise HTTPException(status_code=404, detail="Not Found")
 
     # Chặn hồ sơ đã xoá mềm
     if hasattr(Applicant, "deleted_at") and getattr(a, "deleted_at", None):
         raise HTTPException(410, "Hồ sơ đã bị xoá tạm.")
 
-    docs = db.query(ApplicantDoc).filter(
-        ApplicantDoc.applicant_ma_so_hv == a.ma_so_hv
-    ).all()
+    docs = (await db.scalars(
+        select(ApplicantDoc).where(ApplicantDoc.applicant_ma_so_hv == a.ma_so_hv)
+    )).all()
 
     def pick(*names):
         for n in names:
@@ -401,7 +374,7 @@ def get_by_mshv(
     }
 
     write_audit(db, action="READ", target_type="Applicant", target_id=a.ma_so_hv, status="SUCCESS", request=request)
-    db.commit()
+    await db.commit()
 
     return {
         "applicant": applicant_payload,
@@ -444,13 +417,17 @@ def create_applicant(
     ma_ho_so = raw_ma_hs or None
 
     ho_ten = (payload.get("ho_ten") or "").strip()
-    ngay_nhan_hs = _parse_date_flexible(payload.get("ngay_nhan_hs"))
+    ngay_nhan_hs = parse_date_flexible(payload.get("ngay_nhan_hs"))
 
     # ❌ bỏ check bắt buộc Mã HS
     if not ho_ten:
         raise HTTPException(422, "Thiếu trường bắt buộc: Họ Và Tên")
     if not ngay_nhan_hs:
         raise HTTPException(422, "Thiếu trường bắt buộc: Ngày nhận hồ sơ (dd/MM/YYYY hoặc YYYY-MM-DD)")
+    try:
+        ngay_sinh = parse_ngay_sinh(payload.get("ngay_sinh"))
+    except ValueError as e:
+        raise HTTPException(422, str(e))
 
     existed_mssv = db.query(Applicant).filter(Applicant.ma_so_hv == ma_so_hv).first()
     if existed_mssv:
@@ -464,7 +441,7 @@ def create_applicant(
         ngay_nhan_hs=ngay_nhan_hs,
         ho_ten=ho_ten,
         email_hoc_vien=payload.get("email_hoc_vien"),
-        ngay_sinh=_parse_date_flexible(payload.get("ngay_sinh")),
+        ngay_sinh=ngay_sinh,
         so_dt=payload.get("so_dt"),
         dot=payload.get("dot"),
         khoa=payload.get("khoa"),
@@ -474,7 +451,7 @@ def create_applicant(
         checklist_version_id=v.id,
         status="saved",
         printed=False,
-        gioi_tinh=_normalize_gender(payload.get("gioi_tinh")),
+        gioi_tinh=normalize_gender(payload.get("gioi_tinh")),
         **({"dan_toc": payload.get("dan_toc")} if hasattr(Applicant, "dan_toc") else {}),
     )
     if hasattr(Applicant, "nganh_nhap_hoc"):
@@ -532,27 +509,184 @@ def create_applicant(
     }
 
 
+# ================= BULK CREATE (import file) =================
+@router.post("/bulk")
+def create_applicants_bulk(
+    request: Request,
+    payload: dict = Body(..., description='{"rows": [<payload như POST /applicants>, ...], "start_idx": 1, "mode": "insert|upsert"}'),
+    db: Session = Depends(get_db),
+    me=Depends(require_roles("Admin", "NhanVien", "CongTacVien")),
+):
+    """
+    Tạo nhiều hồ sơ trong 1 request (trang import gửi theo lô).
+    Validate cả lô, kiểm tra MSSV đã có bằng 1 câu IN, INSERT hàng loạt
+    applicants + docs + audit rồi commit 1 lần.
+    mode="upsert": MSSV đã có thì cập nhật (chỉ dòng thật sự đổi, audit ghi diff).
+    Trả kết quả từng dòng: {type: OK|ERR|SKIP, idx, data, msg}.
+    """
+    rows = payload.get("rows") if isinstance(payload, dict) else None
+    if not isinstance(rows, list):
+        raise HTTPException(422, "Thiếu danh sách 'rows'")
+    if len(rows) > BULK_MAX_ROWS:
+        raise HTTPException(413, f"Tối đa {BULK_MAX_ROWS} dòng mỗi lần gửi")
+    try:
+        start_idx = int(payload.get("start_idx") or 1)
+    except (TypeError, ValueError):
+        raise HTTPException(422, "start_idx không hợp lệ")
+    mode = payload.get("mode") or "insert"
+    if not isinstance(mode, str) or mode.strip() not in IMPORT_MODES:
+        raise HTTPException(422, f"mode phải là một trong: {', '.join(IMPORT_MODES)}")
+    mode = mode.strip()
+
+    receiver = getattr(me, "full_name", None) or getattr(me, "username", None)
+    return bulk_create_applicants(db, rows, start_idx=start_idx, receiver=receiver, request=request, mode=mode)
+
+
+# ================= CỘT FILE IMPORT =================
+@router.get("/import/fields")
+def import_fields(me=Depends(require_roles("Admin", "NhanVien", "CongTacVien"))):
+    """Danh sách cột của file import (trang import dựng bảng map cột + file mẫu từ đây)."""
+    return [{"key": k, "label": label, "aliases": aliases} for k, label, aliases in FIELD_DEFS]
+
+
+# ================= DRY-RUN VALIDATE (file import) =================
+@router.post("/import/validate")
+def validate_import_file(
+    file: UploadFile = File(...),
+    mapping: Optional[str] = Form(None, description='JSON {field: "tiêu đề cột"}; bỏ trống = tự đoán theo alias'),
+    ngay_nhan_hs: Optional[str] = Form(None, description="Ngày nhận mặc định khi file không có cột này"),
+    checklist_version_name: Optional[str] = Form(None),
+    mode: str = Form("insert"),
+    db: Session = Depends(get_db),
+    me=Depends(require_roles("Admin", "NhanVien", "CongTacVien")),
+):
+    """
+    Parse file phía server và kiểm tra cả file trong 1 lần gọi, KHÔNG ghi DB:
+    MSSV, ngày, giới tính, trùng trong file, trùng DB (1 câu IN), checklist version.
+    Trả ma trận lỗi {idx: {cột: thông báo}}.
+    """
+    kind = file_kind(file.filename)
+    if kind is None:
+        raise HTTPException(400, "Định dạng file không hỗ trợ. Hãy dùng .csv hoặc .xlsx")
+    if mode not in IMPORT_MODES:
+        raise HTTPException(422, f"mode phải là một trong: {', '.join(IMPORT_MODES)}")
+    try:
+        field_map = json.loads(mapping) if mapping else {}
+        if not isinstance(field_map, dict):
+            raise ValueError
+    except ValueError:
+        raise HTTPException(422, "mapping phải là JSON object")
+
+    path = save_upload(file.file, file.filename)
+    try:
+        return validate_file(
+            db, path, kind,
+            mapping=field_map,
+            default_ngay_nhan=ngay_nhan_hs,
+            version_name=checklist_version_name,
+            mode=mode,
+        )
+    except FILE_READ_ERRORS as e:
+        raise HTTPException(400, f"Lỗi đọc file: {e}")
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# ================= IMPORT FILE (job nền, poll tiến độ) =================
+@router.post("/import/jobs", status_code=202)
+def start_import_file_job(
+    request: Request,
+    file: UploadFile = File(...),
+    mapping: Optional[str] = Form(None, description='JSON {field: "tiêu đề cột"}; bỏ trống = tự đoán theo alias'),
+    ngay_nhan_hs: Optional[str] = Form(None, description="Ngày nhận mặc định khi file không có cột này"),
+    checklist_version_name: Optional[str] = Form(None),
+    mode: str = Form("insert"),
+    me=Depends(require_roles("Admin", "NhanVien", "CongTacVien")),
+):
+    """
+    Lưu file ra thư mục tạm rồi trả job_id ngay; worker đọc CSV/XLSX theo chunk
+    (bộ nhớ không đổi theo kích thước file) và nhập từng chunk như /applicants/bulk.
+    Poll: GET /applicants/import/jobs/{job_id}; dừng: DELETE cùng URL.
+    """
+    if file_kind(file.filename) is None:
+        raise HTTPException(400, "Định dạng file không hỗ trợ. Hãy dùng .csv hoặc .xlsx")
+    if mode not in IMPORT_MODES:
+        raise HTTPException(422, f"mode phải là một trong: {', '.join(IMPORT_MODES)}")
+    try:
+        field_map = json.loads(mapping) if mapping else {}
+        if not isinstance(field_map, dict):
+            raise ValueError
+    except ValueError:
+        raise HTTPException(422, "mapping phải là JSON object")
+
+    # Job chạy tiếp sau khi response xong: chụp sẵn người nhận + ngữ cảnh audit,
+    # không giữ `request` / `me`
+    receiver = getattr(me, "full_name", None) or getattr(me, "username", None)
+    audit_ctx = audit_context(request)
+    version_name = (checklist_version_name or "").strip() or "v1"
+
+    path = save_upload(file.file, file.filename)
+    job = start_import_job(
+        path,
+        file.filename,
+        me.id,
+        make_importer=lambda db: ApplicantImporter(
+            db,
+            mapping=field_map,
+            ngay_nhan_hs=ngay_nhan_hs,
+            version_name=version_name,
+            receiver=receiver,
+            mode=mode,
+            audit_ctx=audit_ctx,
+        ),
+        kind="applicants",
+    )
+    return {**job.to_dict(), "status_url": f"{request.url.path}/{job.id}"}
+
+
+def _own_job(job_id: str, me):
+    job = get_job(job_id)
+    if not job or job.kind != "applicants" or (job.owner_id != me.id and me.role != "Admin"):
+        raise HTTPException(404, "Không tìm thấy job import")
+    return job
+
+
+@router.get("/import/jobs/{job_id}")
+def import_file_job_status(job_id: str, me=Depends(require_roles("Admin", "NhanVien", "CongTacVien"))):
+    return _own_job(job_id, me).to_dict()
+
+
+@router.delete("/import/jobs/{job_id}")
+def cancel_import_file_job(job_id: str, me=Depends(require_roles("Admin", "NhanVien", "CongTacVien"))):
+    """Dừng job sau chunk đang chạy; các chunk đã nhập giữ nguyên."""
+    _own_job(job_id, me)
+    return cancel_job(job_id).to_dict()
+
+
 # ================= SEARCH =================
 @router.get("/search")
-def search_applicants(
+async def search_applicants(
     q: Optional[str] = Query(None, description="Để trống = lấy tất cả"),
     page: int = Query(1, ge=1),
     size: int = Query(20, ge=1, le=1000),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     me=Depends(require_roles("Admin", "NhanVien", "CongTacVien")),
 ):
     qn = (q or "").strip() or None
 
     # Bắt đầu query
-    query = db.query(Applicant)
+    stmt = select(Applicant)
 
     # Ẩn toàn bộ hồ sơ đã bị xoá mềm (tự động nhận diện cột)
-    query = exclude_deleted(Applicant, query)
+    stmt = exclude_deleted(Applicant, stmt)
 
     # Nếu có từ khoá tìm kiếm
     if qn:
         like = f"%{qn}%"
-        query = query.filter(
+        stmt = stmt.where(
             or_(
                 Applicant.ho_ten.ilike(like),
                 Applicant.ma_ho_so.ilike(like),
@@ -560,13 +694,12 @@ def search_applicants(
             )
         )
 
-    total = query.count()
-    rows = (
-        query.order_by(Applicant.created_at.desc())
+    total = await db.scalar(select(func.count()).select_from(stmt.subquery()))
+    rows = (await db.scalars(
+        stmt.order_by(Applicant.created_at.desc())
         .offset((page - 1) * size)
         .limit(size)
-        .all()
-    )
+    )).all()
 
     return {
         "items": [
@@ -710,9 +843,9 @@ def update_applicant(
 
     # Ngày: "" -> None, hỗ trợ nhiều định dạng
     if has("ngay_nhan_hs"):
-        a.ngay_nhan_hs = _parse_date_flexible(get("ngay_nhan_hs"))
+        a.ngay_nhan_hs = parse_date_flexible(get("ngay_nhan_hs"))
     if has("ngay_sinh"):
-        a.ngay_sinh = _parse_date_flexible(get("ngay_sinh"))
+        a.ngay_sinh = parse_date_flexible(get("ngay_sinh"))
 
     # Text fields: "" -> None (ngoại trừ ngành – xử riêng bên dưới)
     for f in ("ho_ten", "email_hoc_vien", "so_dt", "dot", "khoa", "da_tn_truoc_do", "ghi_chu"):
@@ -729,7 +862,7 @@ def update_applicant(
 
     # 🆕 cập nhật giới tính (normalize)
     if "gioi_tinh" in body:
-        a.gioi_tinh = _normalize_gender(body.get("gioi_tinh"))
+        a.gioi_tinh = normalize_gender(body.get("gioi_tinh"))
 
     # 🆕 cập nhật dân tộc
     if "dan_toc" in body and hasattr(Applicant, "dan_toc"):
@@ -1,24 +1,43 @@
 # app/routers/auth.py
+import os
 import time
 from typing import Optional
 from datetime import datetime, timezone
 
 from fastapi import APIRouter, Depends, Request, Form, HTTPException
 from fastapi.responses import RedirectResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
+from starlette.concurrency import run_in_threadpool
 from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN
 
-from app.db.session import get_db
+from app.db.session import get_db, SessionLocal
+from app.db.async_session import get_async_db
 from app.models.user import User
-from app.core.security import verify_password, hash_password, try_rehash_on_success
+from app.core.security import verify_password_async, hash_password, schedule_rehash
+from app.core.principal import Principal, principal_cache
+from app.core.session import set_if_changed
+from app.core.rate_limit import check_login_rate, reset_login_rate
+from app.core.metrics import LOGINS
 
 router = APIRouter()
 
 # Idle timeout: 1 giờ (đồng bộ với main.py)
 IDLE_TIMEOUT_SEC = 1 * 60 * 60
+# Chỉ ghi lại _last_seen khi đã lệch quá ngưỡng này (giây) -> cookie không bị ký lại mỗi request
+SESSION_TOUCH_SEC = int(os.getenv("SESSION_TOUCH_SEC", "60"))
 
-def get_current_user(request: Request, db: Session = Depends(get_db)) -> Optional[User]:
+def touch_last_seen(sess, now: int) -> None:
+    """Cập nhật mốc hoạt động cuối theo độ mịn SESSION_TOUCH_SEC."""
+    if getattr(sess, "server_side", False):
+        return  # session phía server: store tự giữ last_seen, sweeper lo hết hạn
+    last = int(sess.get("_last_seen") or 0)
+    if now - last >= SESSION_TOUCH_SEC:
+        sess["_last_seen"] = now
+
+def _session_uid(request: Request) -> Optional[int]:
+    """Kiểm tra idle timeout + cập nhật mốc hoạt động; trả uid trong session (nếu còn)."""
     sess = request.session
     now = int(time.time())
     last = int(sess.get("_last_seen") or 0)
@@ -26,13 +45,23 @@ def get_current_user(request: Request, db: Session = Depends(get_db)) -> Optiona
         sess.clear()
         return None
     # cập nhật mốc hoạt động cuối
-    sess["_last_seen"] = now
+    touch_last_seen(sess, now)
+    return sess.get("uid")
 
-    uid = sess.get("uid")
+def get_current_user(request: Request, db: Session = Depends(get_db)) -> Optional[User]:
+    uid = _session_uid(request)
     if not uid:
         return None
     return db.get(User, uid)
 
+async def get_current_principal(request: Request) -> Optional[Principal]:
+    """Như get_current_user nhưng lấy Principal từ cache (không load ORM User).
+    Async để route async không phải nhảy sang threadpool chỉ vì guard."""
+    uid = _session_uid(request)
+    if not uid:
+        return None
+    return await principal_cache.aget(uid)
+
 def require_user(user: Optional[User] = Depends(get_current_user)) -> User:
     if not user:
         raise HTTPException(HTTP_401_UNAUTHORIZED, "Phiên đăng nhập đã hết hạn, vui lòng đăng nhập lại!")
@@ -40,27 +69,31 @@ def require_user(user: Optional[User] = Depends(get_current_user)) -> User:
         raise HTTPException(HTTP_403_FORBIDDEN, "User disabled")
     return user
 
+async def require_principal(p: Optional[Principal] = Depends(get_current_principal)) -> Principal:
+    if not p:
+        raise HTTPException(HTTP_401_UNAUTHORIZED, "Phiên đăng nhập đã hết hạn, vui lòng đăng nhập lại!")
+    if not p.is_active:
+        raise HTTPException(HTTP_403_FORBIDDEN, "User disabled")
+    return p
+
 def require_roles(*roles: str):
-    def _dep(
+    """Guard theo role; trả Principal (id, role, tên...) — cần ORM User thì dùng require_user."""
+    async def _dep(
         request: Request,
-        user: User = Depends(require_user)
-    ) -> User:
+        user: Principal = Depends(require_principal)
+    ) -> Principal:
         if roles and user.role not in roles:
             raise HTTPException(HTTP_403_FORBIDDEN, "Forbidden")
 
         # Bơm đầy đủ thông tin vào session cho chắc
+        # (chỉ ghi khi khác giá trị đang có -> không làm bẩn session)
         s = request.session
-        s["uid"] = getattr(user, "id", s.get("uid"))
-        s["full_name"] = (
-            getattr(user, "full_name", None)
-            or getattr(user, "username", None)
-            or getattr(user, "email", None)
-            or s.get("full_name")
-        )
-        s["username"] = getattr(user, "username", s.get("username"))
-        s["email"]    = getattr(user, "email", s.get("email"))
-        s["role"]     = getattr(user, "role", s.get("role"))
-        s["must_change_password"] = bool(getattr(user, "must_change_password", False))
+        set_if_changed(s, "uid", user.id)
+        set_if_changed(s, "full_name", user.display_name or s.get("full_name"))
+        set_if_changed(s, "username", user.username if user.username is not None else s.get("username"))
+        set_if_changed(s, "email", user.email if user.email is not None else s.get("email"))
+        set_if_changed(s, "role", user.role)
+        set_if_changed(s, "must_change_password", user.must_change_password)
         return user
     return _dep
 
@@ -71,38 +104,68 @@ def login_page():
     # Trang HTML login tĩnh
     return RedirectResponse(url="/auth_login.html", status_code=302)
 
+def _find_login_user(db: Session, username: str) -> Optional[User]:
+    return (
+        db.query(User)
+        .filter(or_(User.username == username, User.email == username))
+        .first()
+    )
+
+def _mark_login(db: Session, user: User) -> None:
+    # Ghi nhận thời điểm đăng nhập
+    user.last_login_at = datetime.now(timezone.utc)
+    db.commit()
+    db.refresh(user)
+
+def _rehash_saver(uid: int, old_hash: str):
+    """Lưu hash mới (chạy nền, session riêng); hash đã bị đổi trong lúc đó thì thôi."""
+    def _save(new_hash: str) -> None:
+        db = SessionLocal()
+        try:
+            db.query(User).filter(User.id == uid, User.password_hash == old_hash).update(
+                {User.password_hash: new_hash}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+    return _save
+
 @router.post("/api/login")
 @router.post("/login")
-def login(
+async def login(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
     db: Session = Depends(get_db),
 ):
-    user = (
-        db.query(User)
-        .filter(or_(User.username == username, User.email == username))
-        .first()
-    )
+    # Chặn brute force trước mọi bước tốn CPU (429 + Retry-After)
+    try:
+        check_login_rate(request, username)
+    except HTTPException:
+        LOGINS.inc("rate_limited")
+        raise
+
+    # Truy vấn DB chạy ở threadpool; bcrypt chạy ở pool riêng (app.core.security)
+    user = await run_in_threadpool(_find_login_user, db, username)
     # Xác thực
-    if not user or not verify_password(password, user.password_hash):
+    if not user or not await verify_password_async(password, user.password_hash):
+        LOGINS.inc("invalid")
         raise HTTPException(HTTP_401_UNAUTHORIZED, "Invalid credentials")
     if not user.is_active:
+        LOGINS.inc("disabled")
         raise HTTPException(HTTP_403_FORBIDDEN, "User disabled")
+    reset_login_rate(username)
+    LOGINS.inc("ok")
 
-    # Nâng cấp hash nếu cần (đổi cost/scheme)
+    # Nâng cấp hash nếu cần (đổi cost/scheme) — chạy nền, không chặn response
     try:
-        new_hash = try_rehash_on_success(password, user.password_hash)
-        if new_hash:
-            user.password_hash = new_hash
+        schedule_rehash(password, user.password_hash, _rehash_saver(user.id, user.password_hash))
     except Exception:
         # không chặn đăng nhập nếu rehash lỗi
         pass
 
-    # Ghi nhận thời điểm đăng nhập
-    user.last_login_at = datetime.now(timezone.utc)
-    db.commit()
-    db.refresh(user)
+    await run_in_threadpool(_mark_login, db, user)
+    principal_cache.invalidate(user.id)
 
     # Lưu phiên + thông tin để audit dùng ngay
     request.session.clear()
@@ -158,7 +221,13 @@ def logout(request: Request):
 
 @router.get("/me")
 @router.get("/api/me")
-def me(user: User = Depends(require_user)):
+async def me(
+    p: Principal = Depends(require_principal),
+    db: AsyncSession = Depends(get_async_db),
+):
+    user = await db.get(User, p.id)
+    if not user:
+        raise HTTPException(HTTP_401_UNAUTHORIZED, "Phiên đăng nhập đã hết hạn, vui lòng đăng nhập lại!")
     return {
         "id": user.id,
         "username": user.username,
@@ -1,5 +1,5 @@
 # app/routers/batch.py
-from datetime import datetime, timedelta, date
+from datetime import datetime, date
 import io
 from fastapi import APIRouter, Depends, HTTPException, Query
 from starlette.responses import StreamingResponse
@@ -9,8 +9,12 @@ from sqlalchemy import func
 from app.db.session import get_db
 from app.models.applicant import Applicant, ApplicantDoc
 from app.models.checklist import ChecklistItem
-from app.services.pdf_service import render_batch_pdf
-from app.utils.soft_delete import exclude_deleted, ensure_not_deleted
+from app.services.pdf_service import render_batch_pdf, render_single_pdf
+from app.utils.soft_delete import exclude_deleted
+from app.utils.date_range import date_range_clause
+from app.services.export_cache import cached_artifact, source_fingerprint
+from app.services.zip_stream import iter_zip
+from app.core.timing import span
 
 router = APIRouter(prefix="/batch", tags=["Batch"])
 
@@ -59,15 +63,9 @@ def _docs_by_mssv(db: Session, mssv_list):
         out.setdefault(d.applicant_ma_so_hv, []).append(d)
     return out
 
-# Lọc cứng hồ sơ chưa xoá (không phụ thuộc utils)
-def _is_not_deleted(a: Applicant) -> bool:
-    if hasattr(a, "deleted_at") and getattr(a, "deleted_at", None):
-        return False
-    if hasattr(a, "is_deleted") and bool(getattr(a, "is_deleted")):
-        return False
-    if hasattr(a, "status") and getattr(a, "status") == "deleted":
-        return False
-    return True
+def _day_query(db: Session, d: date):
+    """Hồ sơ nhận trong ngày d (chưa lọc xoá mềm)."""
+    return db.query(Applicant).filter(date_range_clause(db, Applicant.ngay_nhan_hs, d))
 
 def _dedup_latest_by_mssv(apps):
     by = {}
@@ -91,38 +89,34 @@ def batch_print(
 
     d = _parse_day(raw)
 
-    # Bao phủ cả DATE lẫn DATETIME: [d, d+1)
-    d1 = datetime.combine(d, datetime.min.time())
-    d2 = d1 + timedelta(days=1)
+    # 1 range [d, d+1) đúng kiểu cột (DATE/DATETIME) -> 1 lần quét index
+    q = exclude_deleted(Applicant, _day_query(db, d))
+    fp = source_fingerprint(q)
+    if not fp.count:
+        raise HTTPException(status_code=404, detail=f"Không có hồ sơ nào trong ngày { _fmt_dmy(d) }")
 
-    # Truy vấn theo khoảng trước
-    q = db.query(Applicant).filter(Applicant.ngay_nhan_hs >= d1, Applicant.ngay_nhan_hs < d2)
-    q = exclude_deleted(Applicant, q)
-    apps = q.order_by(Applicant.created_at.asc(), Applicant.ma_so_hv.asc()).all()
+    def _render() -> bytes:
+        with span("load"):  # SQL + dựng ORM object
+            apps = q.order_by(Applicant.created_at.asc(), Applicant.ma_so_hv.asc()).all()
 
-    # Fallback nếu cột DB là DATE thuần (== d)
-    if not apps:
-        q = exclude_deleted(Applicant, db.query(Applicant).filter(Applicant.ngay_nhan_hs == d))
-        apps = q.order_by(Applicant.created_at.asc(), Applicant.ma_so_hv.asc()).all()
+            # Dedup theo MSSV, ưu tiên bản mới nhất
+            apps = _dedup_latest_by_mssv(apps)
 
-    # Lọc cứng lần cuối (3 kiểu soft-delete) + tránh phụ thuộc utils
-    apps = [a for a in apps if _is_not_deleted(a) and ensure_not_deleted(a, raise_http_exception=False)]
+            if not apps:
+                raise HTTPException(status_code=404, detail=f"Không có hồ sơ nào trong ngày { _fmt_dmy(d) }")
 
-    # Dedup theo MSSV, ưu tiên bản mới nhất
-    apps = _dedup_latest_by_mssv(apps)
+            version_ids = {a.checklist_version_id for a in apps if a.checklist_version_id is not None}
+            items_by_version = _load_items_by_version(db, version_ids)
 
-    if not apps:
-        raise HTTPException(status_code=404, detail=f"Không có hồ sơ nào trong ngày { _fmt_dmy(d) }")
+            valid_mssv = {a.ma_so_hv for a in apps}
+            docs_by_app = _docs_by_mssv(db, valid_mssv)
+            # khóa lại lần nữa chỉ theo MSHV hợp lệ
+            docs_by_app = {m: ds for (m, ds) in docs_by_app.items() if m in valid_mssv}
 
-    version_ids = {a.checklist_version_id for a in apps if a.checklist_version_id is not None}
-    items_by_version = _load_items_by_version(db, version_ids)
+        return render_batch_pdf(apps, items_by_version, docs_by_app)
 
-    valid_mssv = {a.ma_so_hv for a in apps}
-    docs_by_app = _docs_by_mssv(db, valid_mssv)
-    # khóa lại lần nữa chỉ theo MSHV hợp lệ
-    docs_by_app = {m: ds for (m, ds) in docs_by_app.items() if m in valid_mssv}
-
-    pdf_bytes = render_batch_pdf(apps, items_by_version, docs_by_app)
+    # Ngày cũ không đổi -> lấy file cache; trùng đồng thời -> chỉ render 1 lần
+    pdf_bytes = cached_artifact(("batch_print", d.isoformat(), "pdf"), fp, _render)
 
     filename = f"Batch_{d.strftime('%d-%m-%Y')}.pdf"
     return StreamingResponse(
@@ -152,23 +146,31 @@ def batch_print_dot(
         q = q.filter(Applicant.khoa.isnot(None)).filter(func.lower(func.trim(Applicant.khoa)) == k.lower())
 
     q = exclude_deleted(Applicant, q)
-    apps = q.order_by(Applicant.created_at.asc(), Applicant.ma_so_hv.asc()).all()
-
-    # Lọc cứng lần cuối + dedup
-    apps = [a for a in apps if _is_not_deleted(a) and ensure_not_deleted(a, raise_http_exception=False)]
-    apps = _dedup_latest_by_mssv(apps)
 
-    if not apps:
+    fp = source_fingerprint(q)
+    if not fp.count:
         raise HTTPException(status_code=404, detail="Không có hồ sơ nào thuộc đợt đã chọn.")
 
-    version_ids = {a.checklist_version_id for a in apps if a.checklist_version_id is not None}
-    items_by_version = _load_items_by_version(db, version_ids)
+    def _render() -> bytes:
+        with span("load"):
+            apps = q.order_by(Applicant.created_at.asc(), Applicant.ma_so_hv.asc()).all()
+
+            apps = _dedup_latest_by_mssv(apps)
 
-    valid_mssv = {a.ma_so_hv for a in apps}
-    docs_by_app = _docs_by_mssv(db, valid_mssv)
-    docs_by_app = {m: ds for (m, ds) in docs_by_app.items() if m in valid_mssv}
+            if not apps:
+                raise HTTPException(status_code=404, detail="Không có hồ sơ nào thuộc đợt đã chọn.")
 
-    pdf_bytes = render_batch_pdf(apps, items_by_version, docs_by_app)
+            version_ids = {a.checklist_version_id for a in apps if a.checklist_version_id is not None}
+            items_by_version = _load_items_by_version(db, version_ids)
+
+            valid_mssv = {a.ma_so_hv for a in apps}
+            docs_by_app = _docs_by_mssv(db, valid_mssv)
+            docs_by_app = {m: ds for (m, ds) in docs_by_app.items() if m in valid_mssv}
+
+        return render_batch_pdf(apps, items_by_version, docs_by_app)
+
+    khoa_key = (khoa or "").strip().lower()
+    pdf_bytes = cached_artifact(("batch_print_dot", dot_norm, khoa_key, "pdf"), fp, _render)
 
     safe_dot = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in dot_norm)
     safe_khoa = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in (khoa or ""))
@@ -180,10 +182,76 @@ def batch_print_dot(
         headers={"Content-Disposition": f'inline; filename=\"{filename}\"'},
     )
 
+# -------- ZIP: mỗi hồ sơ 1 file PDF (tên theo MSSV) --------
+def _safe_name(s: str) -> str:
+    return "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in (s or ""))
+
+@router.get("/print-zip")
+def batch_print_zip(
+    day: str | None = Query(None, description="YYYY-MM-DD (tùy chọn)"),
+    date_q: str | None = Query(None, alias="date", description="dd/MM/YYYY (khuyến nghị)"),
+    dot: str | None = Query(None, description="(Tuỳ chọn) Lọc theo đợt thay cho ngày"),
+    khoa: str | None = Query(None, description="(Tuỳ chọn) Lọc theo Khóa, dùng cùng 'dot'"),
+    db: Session = Depends(get_db),
+):
+    """
+    Trả file .zip, mỗi hồ sơ một PDF biên nhận A4 `<MSSV>.pdf`.
+    PDF được render và ghi vào zip lần lượt (ZIP_STORED) rồi stream ra ngay,
+    bộ nhớ chỉ giữ vài file một lúc dù có hàng nghìn hồ sơ.
+    """
+    dot_norm = (dot or "").strip()
+    raw = date_q or day
+    if dot_norm:
+        q = (
+            db.query(Applicant)
+            .filter(Applicant.dot.isnot(None))
+            .filter(Applicant.dot.ilike(f"%{dot_norm}%"))
+        )
+        if (khoa or "").strip():
+            q = q.filter(Applicant.khoa.isnot(None)).filter(func.lower(func.trim(Applicant.khoa)) == khoa.strip().lower())
+        suffix = f"Dot_{_safe_name(dot_norm)}" + (f"_Khoa_{_safe_name(khoa.strip())}" if (khoa or "").strip() else "")
+        not_found = "Không có hồ sơ nào thuộc đợt đã chọn."
+    elif raw:
+        d = _parse_day(raw)
+        q = _day_query(db, d)
+        suffix = d.strftime("%d-%m-%Y")
+        not_found = f"Không có hồ sơ nào trong ngày { _fmt_dmy(d) }"
+    else:
+        raise HTTPException(status_code=400, detail="Thiếu tham số 'date=dd/MM/YYYY' (hoặc 'day') hoặc 'dot'.")
+
+    q = exclude_deleted(Applicant, q)
+    with span("load"):
+        apps = q.order_by(Applicant.created_at.asc(), Applicant.ma_so_hv.asc()).all()
+        apps = _dedup_latest_by_mssv(apps)
+        if not apps:
+            raise HTTPException(status_code=404, detail=not_found)
+
+        # Nạp sẵn toàn bộ dữ liệu trước khi stream
+        version_ids = {a.checklist_version_id for a in apps if a.checklist_version_id is not None}
+        items_by_version = _load_items_by_version(db, version_ids)
+        docs_by_app = _docs_by_mssv(db, {a.ma_so_hv for a in apps})
+    # Session của request chỉ đóng khi gửi xong byte cuối: đóng ngay để trả
+    # connection về pool thay vì giữ suốt lúc render hàng nghìn PDF (object đã
+    # nạp vẫn đọc được sau khi detach)
+    db.close()
+
+    def _tasks():
+        for a in apps:
+            items = items_by_version.get(a.checklist_version_id, [])
+            docs = docs_by_app.get(a.ma_so_hv, [])
+            yield f"{_safe_name(a.ma_so_hv)}.pdf", (lambda a=a, items=items, docs=docs: render_single_pdf(a, items, docs))
+
+    filename = f"Batch_{suffix}.zip"
+    return StreamingResponse(
+        iter_zip(_tasks()),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename=\"{filename}\"'},
+    )
+
 # -------- Giữ route cũ để tương thích --------
 @router.get("/print-by-dot")
 def batch_print_by_dot_compat(
     dot: str = Query(..., description="Tên đợt cũ"),
     db: Session = Depends(get_db),
 ):
-    return batch_print_dot(dot=dot, db=db)
+    return batch_print_dot(dot=dot, khoa=None, db=db)
@@ -2,10 +2,12 @@
 from __future__ import annotations
 
 from fastapi import APIRouter, Depends, HTTPException, Body
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select
 
 from app.db.session import get_db
+from app.db.async_session import get_async_db
 from app.models.checklist import ChecklistItem, ChecklistVersion
 from app.routers.auth import require_roles
 
@@ -116,12 +118,38 @@ def _list_items(db: Session, version_id: int):
     q = q.order_by(order.asc() if order else ChecklistItem.id.asc())
     return q.all()
 
+
+async def _get_active_async(db: AsyncSession) -> ChecklistVersion:
+    if _has_active_flag():
+        v = await db.scalar(
+            select(ChecklistVersion)
+            .where(getattr(ChecklistVersion, _active_attr_name()).is_(True))
+            .limit(1)
+        )
+        if v:
+            return v
+    v = await db.scalar(select(ChecklistVersion).order_by(ChecklistVersion.id.desc()).limit(1))
+    if not v:
+        # hiếm (DB trống) -> dùng lại logic seed sync qua run_sync
+        v = await db.run_sync(_seed_if_empty)
+    return v
+
+
+async def _list_items_async(db: AsyncSession, version_id: int):
+    order = _order_col()
+    stmt = (
+        select(ChecklistItem)
+        .where(ChecklistItem.version_id == version_id)
+        .order_by(order.asc() if order else ChecklistItem.id.asc())
+    )
+    return (await db.scalars(stmt)).all()
+
 # ==================== APIs ====================
 
 @router.get("/active")
-def get_active_checklist(db: Session = Depends(get_db)):
-    v = _get_active(db)
-    items = _list_items(db, v.id)
+async def get_active_checklist(db: AsyncSession = Depends(get_async_db)):
+    v = await _get_active_async(db)
+    items = await _list_items_async(db, v.id)
     return {
         "version_id": v.id,
         "version_name": v.version_name,
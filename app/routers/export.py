@@ -1,9 +1,9 @@
 # app/routers/export.py
 from __future__ import annotations
 
-from datetime import datetime, timedelta, date
+from datetime import datetime, date
 import io
-from typing import List, Dict, Optional
+from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from starlette.responses import StreamingResponse
@@ -17,13 +17,13 @@ from app.models.checklist import ChecklistItem
 from app.services.pdf_service import (
     render_single_pdf,
     render_single_pdf_a5,
-    render_batch_pdf,  # (giữ import nếu dùng nơi khác)
 )
 
-from openpyxl import Workbook
-from openpyxl.utils import get_column_letter
-
+from app.services.export_service import build_export_bytes, EXPORT_FORMATS, MEDIA_TYPES, PROFILES
 from app.utils.soft_delete import exclude_deleted, ensure_not_deleted
+from app.utils.date_range import date_range_clause
+from app.services.export_cache import cached_artifact, source_fingerprint
+from app.core.timing import span
 
 router = APIRouter()  # không prefix; main sẽ mount /api
 
@@ -63,96 +63,20 @@ def _items_merged_by_versions(db: Session, version_ids: set) -> List[ChecklistIt
     return items
 
 
-def _docs_map_by_mssv(docs: List[ApplicantDoc]) -> Dict[str, Dict[str, int]]:
-    """
-    Nhóm theo MSSV:
-      -> { ma_so_hv: { code: so_luong, ... }, ... }
-    """
-    out: Dict[str, Dict[str, int]] = {}
-    for d in docs:
-        out.setdefault(d.applicant_ma_so_hv, {})[d.code] = int(d.so_luong or 0)
-    return out
-
-
-def _fmt_date_excel(v: Optional[object]) -> str:
-    """
-    Chuẩn hoá output Excel về dd/MM/YYYY.
-    """
-    if v is None or v == "":
-        return ""
-    if isinstance(v, datetime):
-        v = v.date()
-    if isinstance(v, date):
-        return v.strftime("%d/%m/%Y")
-    s = str(v).strip()
-    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
-        try:
-            return datetime.strptime(s[:10], fmt).strftime("%d/%m/%Y")
-        except Exception:
-            continue
-    return s
+def _export_response(data: bytes, filename_stem: str, fmt: str) -> StreamingResponse:
+    filename = f"{filename_stem}.{fmt}"
+    return StreamingResponse(
+        io.BytesIO(data),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename=\"{filename}\"'},
+    )
 
 
-def _build_excel_bytes(apps: List[Applicant], docs: List[ApplicantDoc], items_all: List[ChecklistItem]) -> bytes:
-    """
-    Xuất 1 sheet duy nhất 'Ho so' theo header cố định + các cột checklist.
-    Group tài liệu theo MSSV.
-    """
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Ho so"
-
-    # Header cố định (+ Dân tộc)
-    base_headers = [
-        "STT", "Mã hồ sơ", "Ngày nhận", "Email học viên", "Họ tên",
-        "MSHV", "Ngày sinh", "Số ĐT", "Ngành nhập học", "Đợt", "Khóa",
-        "Đã TN trước đó", "Ghi chú", "Người nhận (ký tên)",
-        "Dân tộc",  # ✅ thêm cột Dân tộc
-    ]
-    # Thêm cột checklist
-    item_headers = [getattr(it, "display_name", None) or it.code for it in items_all]
-    headers = base_headers + item_headers
-    ws.append(headers)
-
-    # Data
-    docs_by_mssv = _docs_map_by_mssv(docs)
-
-    for idx, a in enumerate(apps, start=1):
-        base_row = [
-            idx,
-            a.ma_ho_so or "",
-            _fmt_date_excel(getattr(a, "ngay_nhan_hs", None)),
-            a.email_hoc_vien or "",
-            a.ho_ten or "",
-            a.ma_so_hv or "",
-            _fmt_date_excel(getattr(a, "ngay_sinh", None)),
-            a.so_dt or "",
-            getattr(a, "nganh_nhap_hoc", None) or getattr(a, "nganh", None) or "",
-            a.dot or "",
-            getattr(a, "khoa", "") or "",
-            a.da_tn_truoc_do or "",
-            a.ghi_chu or "",
-            a.nguoi_nhan_ky_ten or "",
-            getattr(a, "dan_toc", None) or "",  # ✅ giá trị Dân tộc
-        ]
-        dm = docs_by_mssv.get(a.ma_so_hv, {})
-        doc_row = [int(dm.get(it.code, 0)) for it in items_all]
-        ws.append(base_row + doc_row)
-
-    # Freeze header & auto width
-    ws.freeze_panes = "A2"
-    for col in range(1, len(headers) + 1):
-        letter = get_column_letter(col)
-        max_len = 0
-        for cell in ws[letter]:
-            val = "" if cell.value is None else str(cell.value)
-            if len(val) > max_len:
-                max_len = len(val)
-        ws.column_dimensions[letter].width = min(max(10, max_len + 2), 40)
-
-    buf = io.BytesIO()
-    wb.save(buf)
-    return buf.getvalue()
+def _check_format_profile(fmt: str, profile: str):
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format phải là một trong: {', '.join(EXPORT_FORMATS)}")
+    if profile not in PROFILES:
+        raise HTTPException(status_code=400, detail=f"profile phải là một trong: {', '.join(PROFILES)}")
 
 
 def _get_app_by_mssv(db: Session, ma_so_hv: str) -> Applicant:
@@ -186,6 +110,8 @@ def _get_docs_for_mssv(db: Session, ma_so_hv: str):
 def export_excel(
     day: str | None = Query(None, description="YYYY-MM-DD"),
     date_q: str | None = Query(None, alias="date", description="dd/MM/YYYY"),
+    fmt: str = Query("xlsx", alias="format", description="xlsx | csv | jsonl"),
+    profile: str = Query("ho_so", description="Bố cục export: ho_so | tong_ngay | tong_hop"),
     db: Session = Depends(get_db),
     user=Depends(require_roles("Admin", "NhanVien")),
 ):
@@ -193,37 +119,32 @@ def export_excel(
     if not raw:
         raise HTTPException(status_code=400, detail="Thiếu tham số 'date=dd/MM/YYYY' hoặc 'day=YYYY-MM-DD'")
     d = _parse_day_any(raw)
+    _check_format_profile(fmt, profile)
 
-    d1 = datetime.combine(d, datetime.min.time())
-    d2 = d1 + timedelta(days=1)
-
-    # Lọc theo khoảng thời gian (datetime) trước
-    q = db.query(Applicant).filter(Applicant.ngay_nhan_hs >= d1, Applicant.ngay_nhan_hs < d2)
+    # 1 range [d, d+1) đúng kiểu cột (DATE/DATETIME) -> 1 lần quét index
+    q = db.query(Applicant).filter(date_range_clause(db, Applicant.ngay_nhan_hs, d))
     q = exclude_deleted(Applicant, q)
-    apps = q.order_by(Applicant.created_at.asc(), Applicant.ma_so_hv.asc()).all()
+    fp = source_fingerprint(q)
+    if not fp.count:
+        raise HTTPException(status_code=404, detail=f"Không có hồ sơ trong ngày {d.strftime('%d/%m/%Y')}")
 
-    # Fallback nếu cột trong DB là DATE (không có time)
-    if not apps:
-        q = exclude_deleted(Applicant, db.query(Applicant).filter(Applicant.ngay_nhan_hs == d))
-        apps = q.order_by(Applicant.created_at.asc(), Applicant.ma_so_hv.asc()).all()
+    def _render() -> bytes:
+        with span("load"):  # SQL + dựng ORM object
+            apps = q.order_by(Applicant.created_at.asc(), Applicant.ma_so_hv.asc()).all()
+            if not apps:
+                raise HTTPException(status_code=404, detail=f"Không có hồ sơ trong ngày {d.strftime('%d/%m/%Y')}")
 
-    apps = [a for a in apps if ensure_not_deleted(a, raise_http_exception=False)]
-    if not apps:
-        raise HTTPException(status_code=404, detail=f"Không có hồ sơ trong ngày {d.strftime('%d/%m/%Y')}")
+            mssv_list = [a.ma_so_hv for a in apps]
+            docs = db.query(ApplicantDoc).filter(ApplicantDoc.applicant_ma_so_hv.in_(mssv_list)).all()
 
-    mssv_list = [a.ma_so_hv for a in apps]
-    docs = db.query(ApplicantDoc).filter(ApplicantDoc.applicant_ma_so_hv.in_(mssv_list)).all()
+            version_ids = {a.checklist_version_id for a in apps if a.checklist_version_id}
+            items_all = _items_merged_by_versions(db, version_ids) if version_ids else []
 
-    version_ids = {a.checklist_version_id for a in apps if a.checklist_version_id}
-    items_all = _items_merged_by_versions(db, version_ids) if version_ids else []
+        return build_export_bytes(profile, apps, fmt, items=items_all, docs=docs)
 
-    xls_bytes = _build_excel_bytes(apps, docs, items_all)
-    filename = f"Export_{d.strftime('%d-%m-%Y')}.xlsx"
-    return StreamingResponse(
-        io.BytesIO(xls_bytes),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f'attachment; filename=\"{filename}\"'},
-    )
+    # Ngày cũ không đổi -> lấy file cache; trùng đồng thời -> chỉ render 1 lần
+    data = cached_artifact(("export_excel", d.isoformat(), fmt, profile), fp, _render)
+    return _export_response(data, f"Export_{d.strftime('%d-%m-%Y')}", fmt)
 
 
 # ================= EXPORT EXCEL THEO ĐỢT =================
@@ -231,9 +152,12 @@ def export_excel(
 def export_excel_dot(
     dot: str = Query(..., description="Ví dụ: 'Đợt 1/2025' hoặc '9'"),
     khoa: str | None = Query(None, description="(Tuỳ chọn) Lọc theo Khóa, ví dụ: '27'"),
+    fmt: str = Query("xlsx", alias="format", description="xlsx | csv | jsonl"),
+    profile: str = Query("ho_so", description="Bố cục export: ho_so | tong_ngay | tong_hop"),
     db: Session = Depends(get_db),
     user=Depends(require_roles("Admin", "NhanVien")),
 ):
+    _check_format_profile(fmt, profile)
     key = (dot or "").strip()
     if not key:
         raise HTTPException(status_code=400, detail="Thiếu tham số 'dot'")
@@ -249,35 +173,39 @@ def export_excel_dot(
 
     q = exclude_deleted(Applicant, q)
 
-    apps = q.order_by(Applicant.created_at.asc(), Applicant.ma_so_hv.asc()).all()
-    apps = [a for a in apps if ensure_not_deleted(a, raise_http_exception=False)]
-    if not apps:
+    fp = source_fingerprint(q)
+    if not fp.count:
         raise HTTPException(status_code=404, detail="Không có hồ sơ nào phù hợp")
 
-    mssv_list = [a.ma_so_hv for a in apps]
-    docs = db.query(ApplicantDoc).filter(ApplicantDoc.applicant_ma_so_hv.in_(mssv_list)).all()
+    def _render() -> bytes:
+        with span("load"):
+            apps = q.order_by(Applicant.created_at.asc(), Applicant.ma_so_hv.asc()).all()
+            if not apps:
+                raise HTTPException(status_code=404, detail="Không có hồ sơ nào phù hợp")
+
+            mssv_list = [a.ma_so_hv for a in apps]
+            docs = db.query(ApplicantDoc).filter(ApplicantDoc.applicant_ma_so_hv.in_(mssv_list)).all()
+
+            # Hợp nhất danh mục nhiều version
+            items_all = _items_merged_by_versions(db, {a.checklist_version_id for a in apps if a.checklist_version_id})
 
-    # Hợp nhất danh mục nhiều version
-    items_all = _items_merged_by_versions(db, {a.checklist_version_id for a in apps if a.checklist_version_id})
+        return build_export_bytes(profile, apps, fmt, items=items_all, docs=docs)
 
-    xls_bytes = _build_excel_bytes(apps, docs, items_all)
+    khoa_key = (khoa or "").strip().lower()
+    data = cached_artifact(("export_excel_dot", key, khoa_key, fmt, profile), fp, _render)
     safe_dot = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in key)
     safe_khoa = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in (khoa or ""))
     suffix = f"{safe_dot}" + (f"_Khoa_{safe_khoa}" if safe_khoa else "")
-    filename = f"Export_Dot_{suffix}.xlsx"
-    return StreamingResponse(
-        io.BytesIO(xls_bytes),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f'attachment; filename=\"{filename}\"'},
-    )
+    return _export_response(data, f"Export_Dot_{suffix}", fmt)
 
 
 # ================= PRINT 1 HỒ SƠ (theo MSSV) =================
 @router.get("/print/a5/{ma_so_hv}", summary="In 01 hồ sơ A5 (ngang) theo MSSV")
 def print_a5(ma_so_hv: str, db: Session = Depends(get_db)):
-    app = _get_app_by_mssv(db, ma_so_hv)  # đã chặn deleted
-    items = _get_items_for_app(db, app)
-    docs = _get_docs_for_mssv(db, ma_so_hv)
+    with span("load"):
+        app = _get_app_by_mssv(db, ma_so_hv)  # đã chặn deleted
+        items = _get_items_for_app(db, app)
+        docs = _get_docs_for_mssv(db, ma_so_hv)
     pdf_bytes = render_single_pdf_a5(app, items, docs)
     return Response(
         content=pdf_bytes,
@@ -288,9 +216,10 @@ def print_a5(ma_so_hv: str, db: Session = Depends(get_db)):
 
 @router.get("/print/a4/{ma_so_hv}", summary="In 01 hồ sơ A4 (dọc) theo MSSV")
 def print_a4(ma_so_hv: str, db: Session = Depends(get_db)):
-    app = _get_app_by_mssv(db, ma_so_hv)
-    items = _get_items_for_app(db, app)
-    docs = _get_docs_for_mssv(db, ma_so_hv)
+    with span("load"):
+        app = _get_app_by_mssv(db, ma_so_hv)
+        items = _get_items_for_app(db, app)
+        docs = _get_docs_for_mssv(db, ma_so_hv)
     pdf_bytes = render_single_pdf(app, items, docs)
     return Response(
         content=pdf_bytes,
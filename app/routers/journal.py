@@ -6,10 +6,12 @@ from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request, Body
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy import delete
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
+from app.db.async_session import get_async_db
 from app.routers.auth import require_roles
 
 from app.models.audit import AuditLog, DeletionRequest
@@ -25,8 +27,8 @@ RequireAdmin = Depends(require_roles("Admin", "NhanVien"))
 
 # ===================== LIST =====================
 @router.get("/", dependencies=[RequireAdmin])
-def list_logs(
-    db: Session = Depends(get_db),
+async def list_logs(
+    db: AsyncSession = Depends(get_async_db),
     # bộ lọc cũ (giữ tương thích)
     action: Optional[str] = Query(None),
     target_type: Optional[str] = Query(None),
@@ -41,20 +43,20 @@ def list_logs(
     page_size: int = Query(50, ge=1, le=500),
     sort: Optional[str] = Query(None, description="field:dir, vd occurred_at:desc"),
 ):
-    qset = db.query(AuditLog)
+    qset = select(AuditLog)
 
     # Lọc cũ
     if action:
-        qset = qset.filter(AuditLog.action == action)
+        qset = qset.where(AuditLog.action == action)
     if target_type:
-        qset = qset.filter(AuditLog.target_type == target_type)
+        qset = qset.where(AuditLog.target_type == target_type)
     if target_id:
-        qset = qset.filter(AuditLog.target_id == target_id)
+        qset = qset.where(AuditLog.target_id == target_id)
 
     # Keyword (nhiều cột)
     if q:
         like = f"%{q.strip()}%"
-        qset = qset.filter(
+        qset = qset.where(
             (AuditLog.actor_name.ilike(like)) |
             (AuditLog.path.ilike(like)) |
             (AuditLog.ip_address.ilike(like)) |
@@ -65,7 +67,7 @@ def list_logs(
 
     # Người thao tác
     if actor:
-        qset = qset.filter(AuditLog.actor_name.ilike(f"%{actor.strip()}%"))
+        qset = qset.where(AuditLog.actor_name.ilike(f"%{actor.strip()}%"))
 
     # Khoảng ngày theo occurred_at (ISO yyyy-mm-dd)
     from_dt = None
@@ -81,9 +83,9 @@ def list_logs(
     except Exception:
         pass
     if from_dt:
-        qset = qset.filter(AuditLog.occurred_at >= from_dt)
+        qset = qset.where(AuditLog.occurred_at >= from_dt)
     if to_dt:
-        qset = qset.filter(AuditLog.occurred_at < to_dt)
+        qset = qset.where(AuditLog.occurred_at < to_dt)
 
     # Sắp xếp
     order_col = AuditLog.occurred_at
@@ -106,13 +108,12 @@ def list_logs(
         except Exception:
             pass
 
-    total = qset.count()
+    total = await db.scalar(select(func.count()).select_from(qset.subquery()))
     qset = qset.order_by(order_col.asc() if order_dir == "asc" else order_col.desc())
-    items = (
+    items = (await db.scalars(
         qset.offset((page - 1) * page_size)
            .limit(page_size)
-           .all()
-    )
+    )).all()
 
     return {
         "total": total,
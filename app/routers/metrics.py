@@ -0,0 +1,100 @@
+# app/routers/metrics.py
+"""
+GET /metrics cho Prometheus (không prefix /api, không cần đăng nhập; đặt
+METRICS_TOKEN thì phải gửi `Authorization: Bearer <token>`).
+
+Các collector dưới đây đọc số liệu có sẵn của từng thành phần lúc scrape:
+pool DB, cache (export, principal, single-flight), pool bcrypt, job import.
+"""
+from __future__ import annotations
+
+import hmac
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.pool import QueuePool
+
+from app.core import metrics
+from app.core.metrics import REGISTRY, register_collector
+from app.core.principal import principal_cache
+from app.core.security import hash_pool_stats
+from app.db import async_session, session as db_session
+from app.db.pool_watch import pool_metrics
+from app.services.export_cache import export_cache
+from app.services.import_jobs import job_counts
+from app.services.single_flight import export_flight
+
+router = APIRouter()
+
+# ---------------- pool DB ----------------
+DB_POOL_SIZE = REGISTRY.gauge("db_pool_size", "Số connection cố định của pool", ("pool",))
+DB_POOL_CHECKED_OUT = REGISTRY.gauge("db_pool_checked_out", "Connection đang được dùng", ("pool",))
+DB_POOL_OVERFLOW = REGISTRY.gauge("db_pool_overflow", "Connection overflow đang mở", ("pool",))
+DB_POOL_CHECKOUTS = REGISTRY.counter("db_pool_checkouts_total", "Số lần lấy connection (pool sync)")
+DB_POOL_TIMEOUTS = REGISTRY.counter("db_pool_timeouts_total", "Số lần hết giờ chờ connection (pool sync)")
+DB_POOL_SLOW_WAITS = REGISTRY.counter("db_pool_slow_waits_total", "Số lần phải chờ connection >= DB_POOL_SLOW_WAIT_MS")
+DB_REPLICA_UP = REGISTRY.gauge("db_replica_up", "Replica đang khoẻ (1) hay bị loại (0)", agg="max")
+
+# ---------------- cache ----------------
+CACHE_REQUESTS = REGISTRY.counter("cache_requests_total", "Lượt tra cache theo kết quả", ("cache", "result"))
+CACHE_ENTRIES = REGISTRY.gauge("cache_entries", "Số mục đang có trong cache", ("cache",))
+EXPORT_CACHE_BYTES = REGISTRY.gauge("export_cache_bytes", "Dung lượng cache export trên đĩa", agg="max")
+
+# ---------------- hàng đợi ----------------
+BCRYPT_PENDING = REGISTRY.gauge("bcrypt_pending", "Việc bcrypt đang chạy + đang chờ")
+BCRYPT_QUEUED = REGISTRY.gauge("bcrypt_queued", "Việc bcrypt đang chờ worker")
+BCRYPT_REJECTED = REGISTRY.counter("bcrypt_rejected_total", "Số lần từ chối vì pool bcrypt đầy (503)")
+IMPORT_JOBS = REGISTRY.gauge("import_jobs", "Job import theo trạng thái", ("status",))
+
+
+def _pool_samples(name: str, pool):
+    if isinstance(pool, QueuePool):
+        yield DB_POOL_SIZE, (name,), pool.size()
+        yield DB_POOL_CHECKED_OUT, (name,), pool.checkedout()
+        yield DB_POOL_OVERFLOW, (name,), max(0, pool.overflow())
+
+
+@register_collector
+def _collect_db():
+    yield from _pool_samples("primary", db_session.engine.pool)
+    if db_session.replica_health is not None:
+        yield from _pool_samples("replica", db_session.replica_engine.pool)
+        yield DB_REPLICA_UP, (), 1 if db_session.replica_health.healthy else 0
+    if async_session._async_engine is not None:
+        yield from _pool_samples("async", async_session._async_engine.sync_engine.pool)
+    snap = pool_metrics.snapshot()
+    yield DB_POOL_CHECKOUTS, (), snap["checkouts"]
+    yield DB_POOL_TIMEOUTS, (), snap["timeouts"]
+    yield DB_POOL_SLOW_WAITS, (), snap["slow_waits"]
+
+
+@register_collector
+def _collect_caches():
+    for name, st in (
+        ("export", export_cache.stats()),
+        ("principal", principal_cache.stats()),
+        ("export_flight", export_flight.stats()),
+    ):
+        yield CACHE_REQUESTS, (name, "hit"), st["hits"]
+        yield CACHE_REQUESTS, (name, "miss"), st["misses"]
+        yield CACHE_ENTRIES, (name,), st.get("entries", st.get("cached", 0))
+    yield EXPORT_CACHE_BYTES, (), export_cache.stats()["bytes"]
+
+
+@register_collector
+def _collect_queues():
+    st = hash_pool_stats()
+    yield BCRYPT_PENDING, (), st["pending"]
+    yield BCRYPT_QUEUED, (), st["queued"]
+    yield BCRYPT_REJECTED, (), st["rejected"]
+    for status, n in job_counts().items():
+        yield IMPORT_JOBS, (status,), n
+
+
+@router.get("/metrics", include_in_schema=False)
+def prometheus_metrics(request: Request):
+    if metrics.METRICS_TOKEN:
+        auth = request.headers.get("authorization", "")
+        if not hmac.compare_digest(auth, f"Bearer {metrics.METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Sai hoặc thiếu token metrics")
+    return PlainTextResponse(metrics.generate_latest(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,103 @@
+# app/services/applicant_fields.py
+"""
+Quy tắc trường hồ sơ (Applicant) dùng chung cho POST /applicants,
+POST /applicants/bulk và kiểm tra thử file import: MSSV, ngày, giới tính,
+danh sách cột import (FIELD_DEFS — trang import lấy qua GET /applicants/import/fields).
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+DATE_DMY = re.compile(r"^(\d{1,2})[\/\-](\d{1,2})[\/\-](\d{4})$")
+DATE_YMD = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+MSSV_REGEX = re.compile(r"^\d{10}$")
+
+MSG_BAD_MSSV = "MSSV phải gồm đúng 10 chữ số."
+
+# Cột của file import: (trường, nhãn, alias tiêu đề cột). Ngày nhận HS chọn trên trang.
+FIELD_DEFS = [
+    ("ma_ho_so", "Mã hồ sơ", ["ma ho so", "ma_hs", "ma_hoso", "hoso", "code"]),
+    ("ho_ten", "Họ và Tên", ["ho va ten", "hovaten", "hoten", "ten_hv", "tenhv", "ten"]),
+    ("ma_so_hv", "Mã số HV", ["mshv", "ma so", "ma hoc vien", "ma_hv", "mahv"]),
+    ("gioi_tinh", "Giới tính", ["gioi tinh", "sex", "gender", "gt"]),
+    ("dan_toc", "Dân tộc", ["dan toc", "dantoc", "ethnicity", "dan-toc"]),
+    ("ngay_sinh", "Ngày sinh", ["dob", "date of birth", "ns"]),
+    ("so_dt", "Số ĐT", ["sdt", "so dien thoai", "dien thoai", "so lien he"]),
+    ("email_hoc_vien", "Email học viên", ["email", "email hoc vien", "mail", "gmail"]),
+    ("nganh_nhap_hoc", "Ngành nhập học", ["nganh", "nganh hoc"]),
+    ("dot", "Đợt", ["dot nhap hoc", "dot tuyen"]),
+    ("khoa", "Khóa", ["nien khoa", "khoa hoc", "nk"]),
+    ("da_tn_truoc_do", "Đối tượng TN", ["doi tuong", "doi tuong tn", "doi tuong tot nghiep", "da tn", "trinh do"]),
+    ("ghi_chu", "Ghi chú", ["note", "ghi chu"]),
+]
+REQUIRED_FIELDS = ("ho_ten", "ma_so_hv")
+
+
+def parse_date_flexible(v: Optional[object]) -> Optional[date]:
+    """dd/MM/YYYY, dd-MM-YYYY, YYYY-MM-DD, ISO datetime -> date; không hợp lệ -> None."""
+    if v in (None, ""):
+        return None
+    if isinstance(v, date) and not isinstance(v, datetime):
+        return v
+    if isinstance(v, datetime):
+        return v.date()
+    s = str(v).strip()
+    if not s:
+        return None
+    try:
+        m = DATE_DMY.match(s)
+        if m:
+            d, mth, y = map(int, m.groups())
+            return date(y, mth, d)
+        m = DATE_YMD.match(s)
+        if m:
+            y, mth, d = map(int, m.groups())
+            return date(y, mth, d)
+        return datetime.fromisoformat(s).date()
+    except ValueError:
+        return None
+
+
+def parse_ngay_sinh(v: Any) -> Optional[date]:
+    """Ngày sinh không bắt buộc, nhưng có giá trị mà không parse được -> ValueError."""
+    d = parse_date_flexible(v)
+    if d is None and str(v if v is not None else "").strip():
+        raise ValueError(f"Ngày sinh không hợp lệ: {v}")
+    return d
+
+
+def normalize_gender(v):
+    if v is None:
+        return None
+    s = str(v).strip().lower()
+    if s in {"nam", "m", "male", "1", "true"}:
+        return "Nam"
+    if s in {"nữ", "nu", "f", "female", "0", "false"}:
+        return "Nữ"
+    # nếu FE gửi "Nam"/"Nữ"/khác đúng ý thì giữ nguyên
+    return v or None
+
+
+def _norm_header(s: Any) -> str:
+    s = " ".join(str(s or "").lower().split())
+    s = unicodedata.normalize("NFD", s)
+    return "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
+
+
+def guess_mapping(headers: List[str]) -> Dict[str, str]:
+    """{trường: tiêu đề cột trong file} — khớp key/nhãn trước, rồi alias (như trang import)."""
+    normed = [_norm_header(h) for h in headers]
+    out: Dict[str, str] = {}
+    for key, label, aliases in FIELD_DEFS:
+        exact = [i for i, h in enumerate(normed) if h in (_norm_header(key), _norm_header(label))]
+        if exact:
+            out[key] = headers[exact[0]]
+            continue
+        al = {_norm_header(a) for a in aliases}
+        hit = [i for i, h in enumerate(normed) if h in al]
+        if hit:
+            out[key] = headers[hit[0]]
+    return out
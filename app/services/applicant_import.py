@@ -0,0 +1,465 @@
+# app/services/applicant_import.py
+"""
+Import hồ sơ (Applicant) hàng loạt.
+
+Thay cho việc trang import_students.html POST /applicants từng dòng
+(mỗi dòng: tra checklist version, SELECT tồn tại, flush, commit, query lại
+docs, ghi audit, commit lần 2). Ở đây một lô N dòng:
+  1) validate toàn bộ trong 1 vòng (regex MSSV, ngày, giới tính, trùng trong lô)
+  2) tra checklist version + MSSV đã có bằng câu IN (chia chunk)
+  3) INSERT executemany applicants + applicant_docs + audit_logs, 1 commit
+     (mode="upsert": INSERT ... ON DUPLICATE KEY / ON CONFLICT cho dòng mới
+      hoặc đã đổi theo row hash; audit chỉ ghi diff)
+
+Kết quả trả từng dòng đúng dạng trang import đang hiển thị:
+  {"type": "OK" | "ERR" | "SKIP", "idx": <số dòng>, "data": <payload>, "msg": "..."}
+"""
+from __future__ import annotations
+
+import os
+import re
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+from fastapi import Request
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.applicant import Applicant, ApplicantDoc
+from app.models.checklist import ChecklistVersion
+from app.services.applicant_fields import (
+    FIELD_DEFS,
+    MSG_BAD_MSSV,
+    MSSV_REGEX,
+    REQUIRED_FIELDS,
+    guess_mapping,
+    normalize_gender,
+    parse_date_flexible,
+    parse_ngay_sinh,
+)
+from app.services.audit import audit_context, write_audit_many
+from app.services.upsert import fetch_existing, norm_value, row_diff, row_hash, upsert_rows
+
+# Tối đa số dòng cho 1 lần gọi /applicants/bulk
+BULK_MAX_ROWS = int(os.getenv("APPLICANT_BULK_MAX_ROWS", "1000"))
+# Kích thước danh sách IN (tránh câu SQL quá dài)
+IN_CHUNK = 500
+# Job import: tối đa số dòng lỗi/bỏ qua giữ lại cho trang hiển thị (phần còn lại chỉ đếm)
+IMPORT_MAX_RESULT_ROWS = int(os.getenv("IMPORT_MAX_RESULT_ROWS", "5000"))
+
+MSG_MISSING = "Thiếu bắt buộc (Họ và tên hoặc Mã số HV)"
+MSG_MISSING_FIELD = {"ho_ten": "Thiếu Họ và tên", "ma_so_hv": "Thiếu Mã số HV"}
+MSG_BAD_NGAY_NHAN = "Thiếu trường bắt buộc: Ngày nhận hồ sơ (dd/MM/YYYY hoặc YYYY-MM-DD)"
+MSG_NO_VERSION = "Checklist version không tồn tại"
+MSG_EXISTS = "Mã số học viên đã tồn tại!"
+MSG_DELETED = "Hồ sơ đã bị xoá tạm."
+
+IMPORT_MODES = ("insert", "upsert")
+# Trường được cập nhật khi upsert (không đụng status/printed/người nhận/checklist version)
+UPSERT_FIELDS = [
+    "ma_ho_so", "ngay_nhan_hs", "ho_ten", "gioi_tinh", "dan_toc", "email_hoc_vien", "ngay_sinh",
+    "so_dt", "nganh_nhap_hoc", "dot", "khoa", "da_tn_truoc_do", "ghi_chu",
+]
+
+
+class RowError(Exception):
+    """Dòng không nhập được. `errors` = {trường: thông báo} (ma trận lỗi của dry-run)."""
+
+    def __init__(self, type_: str, msg: str, errors: Optional[Dict[str, str]] = None):
+        super().__init__(msg)
+        self.type = type_
+        self.msg = msg
+        self.errors = errors or {}
+
+
+# ================= Chuẩn hoá giá trị =================
+def _s(v: Any) -> Optional[str]:
+    if v is None:
+        return None
+    s = str(v).strip()
+    return s or None
+
+
+def _iso(v: Any) -> Optional[str]:
+    if isinstance(v, datetime):
+        return v.isoformat()
+    if isinstance(v, date):
+        return datetime.combine(v, datetime.min.time()).isoformat()
+    return v
+
+
+# ================= Truy vấn theo tập =================
+def chunked(seq: List[Any], size: int = IN_CHUNK) -> Iterable[List[Any]]:
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def existing_mssv(db: Session, mssv: Iterable[str]) -> Set[str]:
+    """MSSV đã có trong DB (kể cả hồ sơ xoá mềm) — 1 câu IN mỗi chunk."""
+    keys = sorted({m for m in mssv if m})
+    found: Set[str] = set()
+    for part in chunked(keys):
+        found.update(
+            r[0] for r in db.query(Applicant.ma_so_hv).filter(Applicant.ma_so_hv.in_(part)).all()
+        )
+    return found
+
+
+def version_ids_by_name(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    names = sorted({n for n in names if n})
+    if not names:
+        return {}
+    rows = db.query(ChecklistVersion.version_name, ChecklistVersion.id).filter(
+        ChecklistVersion.version_name.in_(names)
+    ).all()
+    return {n: vid for n, vid in rows}
+
+
+# ================= Dòng file -> payload =================
+SEQ4_RE = re.compile(r"(\d{4})$")
+IMPORT_FIELDS = [k for k, _, _ in FIELD_DEFS] + ["ngay_nhan_hs"]
+
+
+def payloads_from_frame(
+    df: pd.DataFrame,
+    mapping: Dict[str, str],
+    *,
+    ngay_nhan_hs: Optional[str] = None,
+    version_name: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Dựng payload /applicants/bulk từ 1 chunk DataFrame, giống makeApplicantPayload
+    của trang import: ô trống -> None, Mã HS chỉ lấy 4 số cuối, ngày nhận theo
+    cột (nếu map) hoặc ngày mặc định của trang.
+    """
+    n = len(df)
+
+    def col(field: str) -> List[str]:
+        c = mapping.get(field)
+        if c and c in df.columns:
+            return df[c].fillna("").astype(str).str.strip().tolist()
+        return [""] * n
+
+    data = {f: col(f) for f in IMPORT_FIELDS}
+    out = []
+    for i in range(n):
+        row: Dict[str, Any] = {f: data[f][i] or None for f in IMPORT_FIELDS}
+        row["ho_ten"] = data["ho_ten"][i]
+        row["ma_so_hv"] = data["ma_so_hv"][i]
+        row["ngay_nhan_hs"] = row["ngay_nhan_hs"] or ngay_nhan_hs
+        m = SEQ4_RE.search(data["ma_ho_so"][i])
+        row["ma_ho_so"] = m.group(1) if m else None
+        row["checklist_version_name"] = version_name
+        row["docs"] = []
+        out.append(row)
+    return out
+
+
+# ================= Validate 1 dòng =================
+def prepare_row(payload: Dict[str, Any], receiver: Optional[str]) -> Tuple[Dict[str, Any], List[Dict[str, Any]], str]:
+    """
+    Cùng quy tắc với POST /applicants. Trả (values cho INSERT, docs, tên checklist version)
+    hoặc raise RowError.
+    """
+    if not isinstance(payload, dict):
+        raise RowError("ERR", "Dòng dữ liệu không hợp lệ")
+
+    ma_so_hv = _s(payload.get("ma_so_hv")) or ""
+    ho_ten = _s(payload.get("ho_ten")) or ""
+    if not ho_ten or not ma_so_hv:
+        missing = {f: MSG_MISSING_FIELD[f] for f, v in (("ho_ten", ho_ten), ("ma_so_hv", ma_so_hv)) if not v}
+        raise RowError("SKIP", MSG_MISSING, missing)
+
+    # gom lỗi mọi trường (dry-run hiện đủ), thông báo của dòng = lỗi đầu tiên
+    errors: Dict[str, str] = {}
+    if not MSSV_REGEX.fullmatch(ma_so_hv):
+        errors["ma_so_hv"] = MSG_BAD_MSSV
+
+    ngay_nhan_hs = parse_date_flexible(payload.get("ngay_nhan_hs"))
+    if not ngay_nhan_hs:
+        errors["ngay_nhan_hs"] = MSG_BAD_NGAY_NHAN
+
+    ngay_sinh = None
+    try:
+        ngay_sinh = parse_ngay_sinh(payload.get("ngay_sinh"))
+    except ValueError as e:
+        errors["ngay_sinh"] = str(e)
+
+    docs = []
+    for d in payload.get("docs") or []:
+        code = d.get("code") if isinstance(d, dict) else getattr(d, "code", None)
+        sl = d.get("so_luong") if isinstance(d, dict) else getattr(d, "so_luong", None)
+        if sl in (None, ""):
+            continue
+        try:
+            docs.append({"applicant_ma_so_hv": ma_so_hv, "code": code, "so_luong": int(sl)})
+        except (TypeError, ValueError):
+            errors.setdefault("docs", f"Số lượng không hợp lệ cho mục {code}")
+
+    if errors:
+        raise RowError("ERR", next(iter(errors.values())), errors)
+
+    values = {
+        "ma_so_hv": ma_so_hv,
+        "ma_ho_so": _s(payload.get("ma_ho_so")),
+        "ngay_nhan_hs": ngay_nhan_hs,
+        "ho_ten": ho_ten,
+        "gioi_tinh": normalize_gender(payload.get("gioi_tinh")),
+        "dan_toc": payload.get("dan_toc"),
+        "email_hoc_vien": payload.get("email_hoc_vien"),
+        "ngay_sinh": ngay_sinh,
+        "so_dt": payload.get("so_dt"),
+        "nganh_nhap_hoc": payload.get("nganh_nhap_hoc") or payload.get("nganh") or None,
+        "dot": payload.get("dot"),
+        "khoa": payload.get("khoa"),
+        "da_tn_truoc_do": payload.get("da_tn_truoc_do"),
+        "ghi_chu": payload.get("ghi_chu"),
+        "nguoi_nhan_ky_ten": receiver,
+        "status": "saved",
+        "printed": False,
+    }
+
+    version_name = _s(payload.get("checklist_version_name")) or "v1"
+    return values, docs, version_name
+
+
+# ================= Bulk create =================
+def _create_audit(v: Dict[str, Any], docs: List[Dict[str, Any]], source: str) -> Dict[str, Any]:
+    return {
+        "action": "CREATE",
+        "target_type": "Applicant",
+        "target_id": v["ma_so_hv"],
+        "prev_values": {},
+        "new_values": {
+            **{k: _iso(x) for k, x in v.items()},
+            "docs_after": {d["code"]: d["so_luong"] for d in docs},
+            "source": source,
+        },
+    }
+
+
+def _insert_prepared(db: Session, prepared, vids: Dict[str, int], _res, ctx) -> None:
+    for attempt in range(2):
+        exists = existing_mssv(db, [p[1]["ma_so_hv"] for p in prepared])
+        batch = []
+        for i, values, docs, vname in prepared:
+            if vname not in vids:
+                _res(i, "ERR", MSG_NO_VERSION)
+            elif values["ma_so_hv"] in exists:
+                _res(i, "ERR", MSG_EXISTS)
+            else:
+                batch.append((i, {**values, "checklist_version_id": vids[vname]}, docs))
+
+        if not batch:
+            return
+
+        # INSERT hàng loạt + audit, 1 commit
+        try:
+            db.execute(insert(Applicant), [v for _, v, _ in batch])
+            all_docs = [d for _, _, ds in batch for d in ds]
+            if all_docs:
+                db.execute(insert(ApplicantDoc), all_docs)
+            write_audit_many(db, (_create_audit(v, ds, "bulk") for _, v, ds in batch), context=ctx)
+            db.commit()
+        except IntegrityError:
+            # Có người vừa tạo trùng MSSV giữa lúc kiểm tra và INSERT -> kiểm tra lại 1 lần
+            db.rollback()
+            if attempt == 0:
+                continue
+            for i, v, _ in batch:
+                _res(i, "ERR", MSG_EXISTS)
+            return
+
+        for i, v, _ in batch:
+            _res(i, "OK", f"Tạo thành công (MSSV: {v['ma_so_hv']})")
+        return
+
+
+def _upsert_prepared(db: Session, prepared, vids: Dict[str, int], _res, ctx) -> None:
+    """
+    1 câu IN lấy bản hiện có -> so row hash; chỉ dòng mới/đổi mới được upsert.
+    Ô trống trong file không xoá giá trị đang có. Docs chỉ ghi cho hồ sơ mới.
+    """
+    table = Applicant.__table__
+    old = fetch_existing(
+        db, table, "ma_so_hv", [p[1]["ma_so_hv"] for p in prepared],
+        UPSERT_FIELDS + ["status", "checklist_version_id"],
+    )
+    now = datetime.now()
+    rows_db, new_docs, audits, done = [], [], [], []
+    for i, values, docs, vname in prepared:
+        m = values["ma_so_hv"]
+        prev = old.get(m)
+        if prev is None:
+            if vname not in vids:
+                _res(i, "ERR", MSG_NO_VERSION)
+                continue
+            v = {**values, "checklist_version_id": vids[vname], "updated_at": now}
+            rows_db.append(v)
+            new_docs.extend(docs)
+            audits.append(_create_audit(values, docs, "bulk_upsert"))
+            done.append((i, f"Tạo thành công (MSSV: {m})"))
+            continue
+        if prev.get("status") == "deleted":
+            _res(i, "ERR", MSG_DELETED)
+            continue
+
+        merged = {c: values[c] if norm_value(values[c]) is not None else prev.get(c) for c in UPSERT_FIELDS}
+        if row_hash(prev, UPSERT_FIELDS) == row_hash(merged, UPSERT_FIELDS):
+            _res(i, "OK", f"Không thay đổi (MSSV: {m})")
+            continue
+        diff = row_diff(prev, merged, UPSERT_FIELDS)
+        rows_db.append({**values, **merged, "checklist_version_id": prev.get("checklist_version_id"), "updated_at": now})
+        audits.append({
+            "action": "UPDATE",
+            "target_type": "Applicant",
+            "target_id": m,
+            "prev_values": {c: d[0] for c, d in diff.items()},
+            "new_values": {**{c: d[1] for c, d in diff.items()}, "source": "bulk_upsert"},
+        })
+        done.append((i, f"Cập nhật {len(diff)} trường (MSSV: {m})"))
+
+    if not rows_db:
+        return
+    try:
+        upsert_rows(db, table, rows_db, ["ma_so_hv"], UPSERT_FIELDS + ["updated_at"])
+        if new_docs:
+            db.execute(insert(ApplicantDoc), new_docs)
+        write_audit_many(db, audits, context=ctx)
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        for i, _ in done:
+            _res(i, "ERR", f"Lỗi ghi dữ liệu: {e.orig}")
+        return
+    for i, msg in done:
+        _res(i, "OK", msg)
+
+
+def bulk_create_applicants(
+    db: Session,
+    rows: List[Dict[str, Any]],
+    *,
+    start_idx: int = 1,
+    receiver: Optional[str] = None,
+    request: Optional[Request] = None,
+    mode: str = "insert",
+    audit_ctx: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Tạo hồ sơ cho cả lô. Dòng lỗi không chặn các dòng khác.
+    mode="upsert": MSSV đã có thì cập nhật các trường có giá trị thay vì báo lỗi.
+    audit_ctx: audit_context() đã chụp sẵn (job nền) thay cho `request`.
+    Trả {"results": [...], "ok": n, "err": n, "skip": n}.
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"mode phải là một trong: {', '.join(IMPORT_MODES)}")
+    results: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+    prepared: List[Tuple[int, Dict[str, Any], List[Dict[str, Any]], str]] = []
+    first_seen: Dict[str, int] = {}
+
+    def _res(i: int, type_: str, msg: str):
+        results[i] = {"type": type_, "idx": start_idx + i, "data": rows[i], "msg": msg}
+
+    # 1) validate từng dòng trong 1 vòng + trùng MSSV trong lô
+    for i, payload in enumerate(rows):
+        try:
+            values, docs, vname = prepare_row(payload, receiver)
+        except RowError as e:
+            _res(i, e.type, e.msg)
+            continue
+        m = values["ma_so_hv"]
+        if m in first_seen:
+            _res(i, "ERR", f"Trùng Mã số HV trong file (dòng {start_idx + first_seen[m]})")
+            continue
+        first_seen[m] = i
+        prepared.append((i, values, docs, vname))
+
+    # 2) tra theo tập: checklist version + MSSV đã tồn tại
+    vids = version_ids_by_name(db, {p[3] for p in prepared})
+
+    ctx = audit_ctx if audit_ctx is not None else audit_context(request)
+    if mode == "upsert":
+        _upsert_prepared(db, prepared, vids, _res, ctx)
+    else:
+        _insert_prepared(db, prepared, vids, _res, ctx)
+
+    out = [r for r in results if r is not None]
+    return {
+        "results": out,
+        "ok": sum(1 for r in out if r["type"] == "OK"),
+        "err": sum(1 for r in out if r["type"] == "ERR"),
+        "skip": sum(1 for r in out if r["type"] == "SKIP"),
+    }
+
+
+# ================= Import cả file (job nền) =================
+class ApplicantImporter:
+    """
+    Importer cho import_jobs: mỗi chunk DataFrame -> payload như trang import
+    -> bulk_create_applicants (cùng quy tắc, cùng kết quả từng dòng với /applicants/bulk).
+    Chỉ giữ tối đa IMPORT_MAX_RESULT_ROWS dòng lỗi/bỏ qua để trang hiển thị.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        *,
+        mapping: Optional[Dict[str, str]] = None,
+        ngay_nhan_hs: Optional[str] = None,
+        version_name: Optional[str] = None,
+        receiver: Optional[str] = None,
+        mode: str = "insert",
+        audit_ctx: Optional[Dict[str, Any]] = None,
+    ):
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"mode phải là một trong: {', '.join(IMPORT_MODES)}")
+        self.db = db
+        self.mapping = dict(mapping or {})
+        self.ngay_nhan_hs = ngay_nhan_hs
+        self.version_name = version_name
+        self.receiver = receiver
+        self.mode = mode
+        self.audit_ctx = audit_ctx
+        self.total = self.ok = self.err = self.skip = 0
+        self.results: List[Dict[str, Any]] = []
+        self._mapped = False
+
+    def feed(self, df: pd.DataFrame) -> None:
+        if not self._mapped:
+            auto = guess_mapping([str(c) for c in df.columns])
+            self.mapping = {**auto, **{k: v for k, v in self.mapping.items() if v}}
+            missing = [f for f in REQUIRED_FIELDS if self.mapping.get(f) not in df.columns]
+            if missing:
+                raise ValueError(f"Thiếu map cột: {', '.join(missing)}")
+            self._mapped = True
+
+        rows = payloads_from_frame(df, self.mapping, ngay_nhan_hs=self.ngay_nhan_hs, version_name=self.version_name)
+        for part in chunked(rows, BULK_MAX_ROWS):
+            out = bulk_create_applicants(
+                self.db, part,
+                start_idx=self.total + 1,
+                receiver=self.receiver,
+                mode=self.mode,
+                audit_ctx=self.audit_ctx,
+            )
+            self.total += len(part)
+            self.ok += out["ok"]
+            self.err += out["err"]
+            self.skip += out["skip"]
+            room = IMPORT_MAX_RESULT_ROWS - len(self.results)
+            if room > 0:
+                self.results.extend([r for r in out["results"] if r["type"] != "OK"][:room])
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "total": self.total,
+            "ok": self.ok,
+            "err": self.err,
+            "skip": self.skip,
+            "results": self.results,
+            "truncated": self.err + self.skip > len(self.results),
+        }
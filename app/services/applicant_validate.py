@@ -0,0 +1,123 @@
+# app/services/applicant_validate.py
+"""
+Kiểm tra thử (dry-run) file import hồ sơ phía server, không ghi gì vào DB.
+
+Đọc file theo chunk (import_reader), dựng payload từng dòng đúng như lúc
+import (`payloads_from_frame`) rồi chạy chính `prepare_row` của
+/applicants/bulk — quy tắc MSSV / ngày / số lượng chỉ nằm một chỗ:
+  - lỗi từng trường của dòng (RowError.errors)
+  - MSSV trùng trong file, MSSV đã có trong DB (1 câu IN theo chunk ở cuối)
+  - checklist version tồn tại
+
+Kết quả là "ma trận lỗi": mỗi dòng lỗi -> {cột: thông báo}.
+"""
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.services.applicant_fields import FIELD_DEFS, REQUIRED_FIELDS, guess_mapping
+from app.services.applicant_import import (
+    MSG_EXISTS,
+    MSG_NO_VERSION,
+    RowError,
+    existing_mssv,
+    payloads_from_frame,
+    prepare_row,
+    version_ids_by_name,
+)
+from app.services.import_reader import ChunkedReader
+
+# Tối đa số dòng lỗi trả về (phần còn lại chỉ đếm)
+VALIDATE_MAX_ERROR_ROWS = int(os.getenv("VALIDATE_MAX_ERROR_ROWS", "5000"))
+
+# Thứ tự cột của ma trận lỗi
+_ERROR_COLUMNS = [k for k, _, _ in FIELD_DEFS] + ["ngay_nhan_hs", "docs"]
+
+
+class ApplicantFileValidator:
+    def __init__(
+        self,
+        db: Session,
+        mapping: Optional[Dict[str, str]] = None,
+        default_ngay_nhan: Optional[str] = None,
+        version_name: Optional[str] = None,
+        mode: str = "insert",
+    ):
+        self.db = db
+        self.mapping = dict(mapping or {})
+        self.default_ngay_nhan = default_ngay_nhan
+        self.version_name = (version_name or "").strip() or "v1"
+        self.mode = mode
+        self.total = 0
+        self.duplicates = 0
+        self.errors: Dict[int, Dict[str, str]] = {}
+        self.file_errors: List[str] = []
+        self._first_row: Dict[str, int] = {}   # MSSV -> dòng đầu tiên
+        self._mapped = False
+
+    def feed(self, df: pd.DataFrame) -> None:
+        if not self._mapped:
+            auto = guess_mapping([str(c) for c in df.columns])
+            self.mapping = {**auto, **{k: v for k, v in self.mapping.items() if v}}
+            missing = [f for f in REQUIRED_FIELDS if f not in self.mapping]
+            if missing:
+                self.file_errors.append(f"Thiếu map cột: {', '.join(missing)}")
+            self._mapped = True
+
+        payloads = payloads_from_frame(
+            df, self.mapping, ngay_nhan_hs=self.default_ngay_nhan, version_name=self.version_name
+        )
+        # số dòng theo file (1 = dòng dữ liệu đầu tiên, như cột # trên trang import)
+        start = self.total + 1
+        self.total += len(payloads)
+        for idx, payload in enumerate(payloads, start):
+            try:
+                values, _, _ = prepare_row(payload, None)
+            except RowError as e:
+                self.errors.setdefault(idx, {}).update(e.errors or {"ma_so_hv": e.msg})
+                continue
+            # trùng MSSV trong file (kể cả với chunk trước) — như bulk: chỉ tính dòng hợp lệ
+            m = values["ma_so_hv"]
+            first = self._first_row.setdefault(m, idx)
+            if first != idx:
+                self.duplicates += 1
+                self.errors.setdefault(idx, {})["ma_so_hv"] = f"Trùng Mã số HV trong file (dòng {first})"
+
+    def result(self) -> Dict[str, Any]:
+        # tra DB theo tập ở cuối: checklist version + MSSV đã có
+        if not version_ids_by_name(self.db, [self.version_name]):
+            self.file_errors.append(f"{MSG_NO_VERSION}: {self.version_name}")
+        exists = existing_mssv(self.db, self._first_row.keys())
+        if self.mode != "upsert":
+            for m in exists:
+                self.errors.setdefault(self._first_row[m], {})["ma_so_hv"] = MSG_EXISTS
+
+        rows = sorted(self.errors.items())
+        fields = [k for k in _ERROR_COLUMNS if any(k in e for _, e in rows)]
+        return {
+            "ok": not rows and not self.file_errors,
+            "mapping": self.mapping,
+            "file_errors": self.file_errors,
+            "summary": {
+                "total": self.total,
+                "valid": self.total - len(rows),
+                "invalid": len(rows),
+                "duplicates_in_file": self.duplicates,
+                "existing_in_db": len(exists),
+                "will_update": len(exists) if self.mode == "upsert" else 0,
+            },
+            "columns": fields,
+            "errors": [{"idx": r, "errors": e} for r, e in rows[:VALIDATE_MAX_ERROR_ROWS]],
+            "truncated": len(rows) > VALIDATE_MAX_ERROR_ROWS,
+        }
+
+
+def validate_file(db: Session, path: str, kind: str, **kw) -> Dict[str, Any]:
+    v = ApplicantFileValidator(db, **kw)
+    for df in ChunkedReader(path, kind):
+        v.feed(df)
+    return v.result()
@@ -5,12 +5,14 @@ import os
 import json
 import hmac
 import hashlib
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, Iterable
 
 from fastapi import Request
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 from app.models.audit import AuditLog
+from app.core.metrics import AUDIT_RECORDS
 
 # Bí mật ký HMAC cho audit (đặt biến môi trường ở production)
 AUDIT_HMAC_SECRET = os.getenv("AUDIT_HMAC_SECRET", "audit-dev")
@@ -63,22 +65,12 @@ def _build_hmac_hash(
     return hmac.new(AUDIT_HMAC_SECRET.encode("utf-8"), raw.encode("utf-8"), hashlib.sha256).hexdigest()
 
 
-def write_audit(
-    db: Session,
-    *,
-    action: str,
-    target_type: Optional[str] = None,
-    target_id: Optional[str] = None,
-    status: str = "SUCCESS",
-    prev_values: Optional[Dict[str, Any]] = None,
-    new_values: Optional[Dict[str, Any]] = None,
-    request: Optional[Request] = None,
-) -> AuditLog:
+def audit_context(request: Optional[Request]) -> Dict[str, Any]:
     """
-    Ghi 1 dòng audit. Không commit ở đây (để caller chủ động).
-    Bắt buộc set được hmac_hash để phù hợp DB NOT NULL.
+    Lấy actor / ip / path / correlation_id từ request (nếu có).
+    Job chạy nền chụp dict này TRƯỚC khi trả response rồi truyền `context=`,
+    không giữ object request sống lâu hơn request.
     """
-    # Lấy actor từ session (nếu có)
     actor_id = None
     actor_name = None
     if request is not None:
@@ -94,10 +86,26 @@ def write_audit(
         except Exception:
             pass
 
-    ip = request.client.host if (request and request.client) else None
-    path = request.url.path if request else None
-    cid = getattr(request.state, "correlation_id", None) if request else None
+    return {
+        "actor_id": str(actor_id) if actor_id is not None else None,
+        "actor_name": str(actor_name) if actor_name is not None else None,
+        "ip_address": request.client.host if (request and request.client) else None,
+        "path": request.url.path if request else None,
+        "correlation_id": getattr(request.state, "correlation_id", None) if request else None,
+    }
+
 
+def _audit_values(
+    ctx: Dict[str, Any],
+    *,
+    action: str,
+    target_type: Optional[str] = None,
+    target_id: Optional[str] = None,
+    status: str = "SUCCESS",
+    prev_values: Optional[Dict[str, Any]] = None,
+    new_values: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Dựng giá trị cột cho 1 dòng audit (đã chuẩn hoá JSON + ký hmac)."""
     # Chuẩn hoá JSON cho cột JSON của MySQL
     prev_j = _norm_json(prev_values)
     new_j = _norm_json(new_values)
@@ -108,24 +116,68 @@ def write_audit(
         status=status,
         target_type=target_type,
         target_id=target_id,
-        correlation_id=cid,
+        correlation_id=ctx["correlation_id"],
         prev_values=prev_j,
         new_values=new_j,
     )
 
-    row = AuditLog(
+    return dict(
         action=action,
         status=status,
         target_type=target_type,
         target_id=str(target_id) if target_id is not None else None,
         prev_values=prev_j,
         new_values=new_j,
-        actor_id=str(actor_id) if actor_id is not None else None,
-        actor_name=str(actor_name) if actor_name is not None else None,
-        ip_address=ip,
-        path=path,
-        correlation_id=cid,
         hmac_hash=h,  # 👈 quan trọng: set giá trị NOT NULL
+        **ctx,
     )
+
+
+def write_audit(
+    db: Session,
+    *,
+    action: str,
+    target_type: Optional[str] = None,
+    target_id: Optional[str] = None,
+    status: str = "SUCCESS",
+    prev_values: Optional[Dict[str, Any]] = None,
+    new_values: Optional[Dict[str, Any]] = None,
+    request: Optional[Request] = None,
+) -> AuditLog:
+    """
+    Ghi 1 dòng audit. Không commit ở đây (để caller chủ động).
+    Bắt buộc set được hmac_hash để phù hợp DB NOT NULL.
+    """
+    row = AuditLog(**_audit_values(
+        audit_context(request),
+        action=action,
+        target_type=target_type,
+        target_id=target_id,
+        status=status,
+        prev_values=prev_values,
+        new_values=new_values,
+    ))
     db.add(row)
+    AUDIT_RECORDS.inc(status)
     return row
+
+
+def write_audit_many(
+    db: Session,
+    entries: Iterable[Dict[str, Any]],
+    request: Optional[Request] = None,
+    context: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    Ghi nhiều dòng audit bằng 1 lệnh INSERT executemany (dùng cho import hàng loạt).
+    Mỗi entry là kwargs của write_audit (action, target_id, new_values, ...).
+    `context`: kết quả audit_context() đã chụp sẵn (job nền), ưu tiên hơn `request`.
+    Không commit ở đây.
+    """
+    ctx = context if context is not None else audit_context(request)
+    rows = [_audit_values(ctx, **e) for e in entries]
+    if rows:
+        db.execute(insert(AuditLog), rows)
+        for r in rows:
+            AUDIT_RECORDS.inc(r["status"])
+    return len(rows)
@@ -0,0 +1,286 @@
+# app/services/export_cache.py
+"""
+Cache file export (xlsx/pdf) trên đĩa, vô hiệu hoá theo "dấu vân tay" dữ liệu.
+
+- Key  : (loại export, bộ lọc đã chuẩn hoá, định dạng, tập checklist version)
+- Fingerprint: (số hồ sơ, max(updated_at), tổng CRC32 từng dòng hồ sơ, max/count
+  + tổng CRC32 của applicant_docs) — MỘT câu aggregate, cộng count/max(id)/tổng
+  CRC32 của checklist_items thuộc các version liên quan; dữ liệu ngày cũ hầu
+  như không đổi nên trả file có sẵn. Tài liệu và danh mục cần riêng vì PUT docs
+  hay sửa checklist không chạm dòng applicants (updated_at không đổi).
+- Evict: LRU theo tổng dung lượng trên đĩa (EXPORT_CACHE_MAX_MB).
+
+Kết hợp với single-flight: request trùng đồng thời chỉ render 1 lần.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional, Tuple
+
+from sqlalchemy import String, case, cast, distinct, func
+from sqlalchemy.orm import Query
+
+from app.models.applicant import Applicant, ApplicantDoc
+from app.models.checklist import ChecklistItem
+from app.core.timing import span
+from app.services.single_flight import export_flight
+
+log = logging.getLogger("export_cache")
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", os.path.join(BASE_DIR, ".cache", "exports"))
+EXPORT_CACHE_MAX_MB = float(os.getenv("EXPORT_CACHE_MAX_MB", "512"))
+EXPORT_CACHE_ENABLED = os.getenv("EXPORT_CACHE_ENABLED", "1") == "1"
+
+# Tăng khi đổi layout file export để bỏ toàn bộ cache cũ
+CACHE_LAYOUT_VERSION = 2
+
+
+class SourceFingerprint(NamedTuple):
+    count: int
+    max_updated_at: str
+    app_checksum: int   # sum(CRC32(dòng applicants)): sửa trong cùng 1 giây vẫn bắt được
+    max_doc_id: int
+    doc_count: int
+    doc_checksum: int   # sum(CRC32(dòng applicant_docs)): sửa số lượng / tên tại chỗ
+    item_count: int
+    max_item_id: int
+    item_checksum: int  # sum(CRC32(dòng checklist_items)) của các version liên quan
+    version_ids: Tuple[int, ...]
+
+    @property
+    def stamp(self) -> Tuple[int, ...]:
+        return tuple(self[:-1])
+
+
+def _row_crc(columns):
+    """CRC32 của cả dòng (các cột nối bằng '|', NULL -> ''); đổi bất kỳ cột nào là đổi."""
+    parts = [func.coalesce(cast(c, String), "") for c in columns]
+    text = parts[0]
+    for p in parts[1:]:
+        text = text.concat("|").concat(p)
+    return func.coalesce(func.crc32(text), 0)
+
+
+def source_fingerprint(q: Query) -> SourceFingerprint:
+    """
+    Một câu aggregate trên tập hồ sơ đã lọc (group theo checklist version):
+    đếm hồ sơ, max(updated_at), tổng CRC32 từng dòng hồ sơ và tài liệu kèm theo
+    (updated_at trên MySQL chỉ chính xác tới giây nên không dựa vào nó). Thêm
+    một câu nhỏ trên checklist_items của các version đó: sửa / đổi tên / sắp
+    lại danh mục làm đổi cột export dù hồ sơ không đổi.
+    """
+    rows = (
+        q.order_by(None)
+        .outerjoin(ApplicantDoc, ApplicantDoc.applicant_ma_so_hv == Applicant.ma_so_hv)
+        .with_entities(
+            Applicant.checklist_version_id,
+            func.count(distinct(Applicant.ma_so_hv)),
+            func.max(Applicant.updated_at),
+            # hồ sơ có k tài liệu bị join k lần -> CRC nhân k, vẫn đổi khi dòng đổi
+            func.sum(_row_crc(Applicant.__table__.columns)),
+            func.max(ApplicantDoc.id),
+            func.count(ApplicantDoc.id),
+            func.sum(case((ApplicantDoc.id.isnot(None), _row_crc(ApplicantDoc.__table__.columns)), else_=0)),
+        )
+        .group_by(Applicant.checklist_version_id)
+        .all()
+    )
+    count, last, app_checksum = 0, "", 0
+    max_doc, doc_count, doc_checksum = 0, 0, 0
+    version_ids = set()
+    for vid, n, upd, s_app, doc_id, n_docs, s_doc in rows:
+        count += int(n or 0)
+        app_checksum += int(s_app or 0)
+        doc_count += int(n_docs or 0)
+        doc_checksum += int(s_doc or 0)
+        if vid is not None:
+            version_ids.add(int(vid))
+        s = upd.isoformat() if hasattr(upd, "isoformat") else str(upd or "")
+        if s > last:
+            last = s
+        if doc_id and int(doc_id) > max_doc:
+            max_doc = int(doc_id)
+
+    item_count = max_item = item_checksum = 0
+    if version_ids:
+        n_items, m_item, s_item = (
+            q.session.query(
+                func.count(ChecklistItem.id),
+                func.max(ChecklistItem.id),
+                func.sum(_row_crc(ChecklistItem.__table__.columns)),
+            )
+            .filter(ChecklistItem.version_id.in_(version_ids))
+            .one()
+        )
+        item_count, max_item, item_checksum = int(n_items or 0), int(m_item or 0), int(s_item or 0)
+
+    return SourceFingerprint(
+        count, last, app_checksum,
+        max_doc, doc_count, doc_checksum,
+        item_count, max_item, item_checksum,
+        tuple(sorted(version_ids)),
+    )
+
+
+class ExportCache:
+    """
+    File lưu dạng <hash>.bin + <hash>.json (metadata: fingerprint, size).
+    Index LRU giữ trong RAM, dựng lại từ thư mục khi khởi động (theo mtime).
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, Tuple[int, list]]" = OrderedDict()  # hash -> (size, stamp)
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self._load_index()
+
+    # ---------- internal ----------
+    @staticmethod
+    def _hash_key(key) -> str:
+        raw = json.dumps([CACHE_LAYOUT_VERSION, key], ensure_ascii=False, default=str, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _paths(self, h: str) -> Tuple[str, str]:
+        return os.path.join(self.directory, h + ".bin"), os.path.join(self.directory, h + ".json")
+
+    def _load_index(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json"):
+                    continue
+                h = name[:-5]
+                bin_path, meta_path = self._paths(h)
+                try:
+                    with open(meta_path, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                    st = os.stat(bin_path)
+                except (OSError, ValueError):
+                    self._remove_files(h)
+                    continue
+                entries.append((st.st_mtime, h, st.st_size, meta.get("stamp")))
+            for _, h, size, stamp in sorted(entries):
+                self._index[h] = (size, stamp)
+                self._total += size
+            self._evict_locked()
+        except OSError as e:
+            log.warning("Export cache disabled (dir %s): %s", self.directory, e)
+
+    def _remove_files(self, h: str):
+        for p in self._paths(h):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    def _drop_locked(self, h: str):
+        size, _ = self._index.pop(h, (0, None))
+        self._total -= size
+        self._remove_files(h)
+
+    def _evict_locked(self):
+        while self._total > self.max_bytes and self._index:
+            h = next(iter(self._index))
+            self._drop_locked(h)
+
+    # ---------- API ----------
+    def get(self, key, stamp) -> Optional[bytes]:
+        h = self._hash_key(key)
+        stamp = list(stamp)
+        with self._lock:
+            entry = self._index.get(h)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] != stamp:
+                # dữ liệu nguồn đã đổi -> bỏ file cũ
+                self._drop_locked(h)
+                self.misses += 1
+                return None
+            self._index.move_to_end(h)
+        bin_path, _ = self._paths(h)
+        try:
+            with open(bin_path, "rb") as f:
+                data = f.read()
+            os.utime(bin_path, None)  # giữ thứ tự LRU qua các lần khởi động
+        except OSError:
+            with self._lock:
+                self._drop_locked(h)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, stamp, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        h = self._hash_key(key)
+        bin_path, meta_path = self._paths(h)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = f"{bin_path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, bin_path)
+            with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"stamp": list(stamp), "size": len(data), "created": time.time()}, f)
+            os.replace(meta_path + ".tmp", meta_path)
+        except OSError as e:
+            log.warning("Export cache write failed: %s", e)
+            return
+        with self._lock:
+            old = self._index.pop(h, None)
+            if old:
+                self._total -= old[0]
+            self._index[h] = (len(data), list(stamp))
+            self._total += len(data)
+            self._evict_locked()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._index),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+            }
+
+
+export_cache = ExportCache(EXPORT_CACHE_DIR, int(EXPORT_CACHE_MAX_MB * 1024 * 1024))
+
+
+def cached_artifact(key: tuple, fp: SourceFingerprint, render: Callable[[], bytes]) -> bytes:
+    """
+    Trả bytes của file export:
+      1) cache đĩa còn đúng fingerprint -> đọc file
+      2) không thì single-flight render 1 lần rồi lưu lại
+    `key` = (loại, bộ lọc, định dạng); tập checklist version được gắn thêm.
+    """
+    full_key = tuple(key) + (fp.version_ids,)
+    if EXPORT_CACHE_ENABLED:
+        with span("cache"):
+            data = export_cache.get(full_key, fp.stamp)
+        if data is not None:
+            return data
+
+    def _render_and_store() -> bytes:
+        data = render()
+        if EXPORT_CACHE_ENABLED:
+            export_cache.put(full_key, fp.stamp, data)
+        return data
+
+    return export_flight.do(full_key + (fp.stamp,), _render_and_store)
@@ -1,19 +1,44 @@
 # ================================
 # app/services/export_service.py
 # ================================
+"""
+Engine export dùng chung cho mọi file tổng hợp (xlsx / csv / jsonl).
+
+- COLUMNS : registry cột — mỗi cột có header, field nguồn và KIỂU dữ liệu.
+- PROFILES: các bố cục export có tên (ho_so, tong_ngay, tong_hop).
+- Extractor (attrgetter / dict.get / itemgetter theo index) và formatter theo
+  kiểu được biên dịch MỘT lần cho mỗi cột, sau đó mọi dòng chạy qua cùng một
+  pipeline; không còn getattr/parse ngày lặp lại theo từng ô hay vòng lặp
+  định dạng cột ngày sau khi ghi.
+"""
 from __future__ import annotations
-from typing import List, Dict, Iterable, Any, Optional
-from io import BytesIO
+from typing import List, Dict, Iterable, Any, Optional, Callable, NamedTuple, Sequence, Tuple
+from io import BytesIO, StringIO
 from datetime import date, datetime
+from operator import attrgetter, itemgetter
+import copy
+import csv
+import json
+import time
 
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import Alignment
 
 from ..models import Applicant, ApplicantDoc, ChecklistItem
+from ..core.timing import span
+from ..core.metrics import observe_render
 
 DOC_PREFIX = "doc_"
 
+EXPORT_FORMATS = ("xlsx", "csv", "jsonl")
+MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+}
+
 
 # ---------- Helper ----------
 def _parse_to_date(v: Optional[object]) -> Optional[date]:
@@ -26,7 +51,7 @@ def _parse_to_date(v: Optional[object]) -> Optional[date]:
     s = str(v).strip()
     for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
         try:
-            return datetime.strptime(s, fmt).date()
+            return datetime.strptime(s[:10], fmt).date()
         except ValueError:
             continue
     return None
@@ -46,123 +71,334 @@ def _norm_gender(v: Optional[object]) -> str:
         return "Nữ"
     if s in {"other", "khac", "khác"}:
         return "Khác"
-    # tiếng Việt có dấu/không dấu
-    if s == "nam":
-        return "Nam"
-    if s in {"nu", "nữ"}:
-        return "Nữ"
     return s.capitalize()  # fallback
 
-def _autosize(ws):
+
+# ---------- Registry cột ----------
+# kind:
+#   text  -> chuỗi ("" nếu None)
+#   date  -> ô ngày thật trong Excel (format dd/mm/yyyy), dd/MM/YYYY trong CSV
+#   dmy   -> chuỗi dd/MM/YYYY ở mọi định dạng (giữ bố cục export cũ)
+#   gender-> chuẩn hoá Nam/Nữ/Khác
+#   bool  -> True/False
+class Column(NamedTuple):
+    header: str
+    field: Optional[str]   # None = cột tính toán (STT)
+    kind: str = "text"
+
+
+COLUMNS: Dict[str, Column] = {
+    "stt":            Column("STT", None, "int"),
+    "ma_ho_so":       Column("Mã hồ sơ", "ma_ho_so"),
+    "ngay_nhan_hs":   Column("Ngày nhận HS", "ngay_nhan_hs", "date"),
+    "email_hoc_vien": Column("Email học viên", "email_hoc_vien"),
+    "ho_ten":         Column("Họ tên", "ho_ten"),
+    "ma_so_hv":       Column("Mã số HV", "ma_so_hv"),
+    "gioi_tinh":      Column("Giới tính", "gioi_tinh", "gender"),
+    "dan_toc":        Column("Dân tộc", "dan_toc"),
+    "ngay_sinh":      Column("Ngày sinh", "ngay_sinh", "date"),
+    "so_dt":          Column("Số ĐT", "so_dt"),
+    "nganh_nhap_hoc": Column("Ngành nhập học", "nganh_nhap_hoc"),
+    "dot":            Column("Đợt", "dot"),
+    "khoa":           Column("Khóa", "khoa"),
+    "da_tn_truoc_do": Column("Đã TN trước đó", "da_tn_truoc_do"),
+    "ghi_chu":        Column("Ghi chú", "ghi_chu"),
+    "nguoi_nhan":     Column("Người nhận (ký tên)", "nguoi_nhan_ky_ten"),
+    "printed":        Column("Printed", "printed", "bool"),
+}
+
+
+class Profile(NamedTuple):
+    sheet_title: str
+    columns: Tuple[Tuple[str, Optional[str], Optional[str]], ...]  # (key, header override, kind override)
+    # cột checklist: None = không có; "display" = tên hiển thị; "prefix" = doc_<code>
+    checklist_headers: Optional[str] = None
+    zero_as_blank: bool = False
+
+
+PROFILES: Dict[str, Profile] = {
+    # Export theo ngày/đợt của routers/export.py
+    "ho_so": Profile(
+        sheet_title="Ho so",
+        columns=(
+            ("stt", None, None),
+            ("ma_ho_so", None, None),
+            ("ngay_nhan_hs", "Ngày nhận", "dmy"),
+            ("email_hoc_vien", None, None),
+            ("ho_ten", None, None),
+            ("ma_so_hv", "MSHV", None),
+            ("ngay_sinh", None, "dmy"),
+            ("so_dt", None, None),
+            ("nganh_nhap_hoc", None, None),
+            ("dot", None, None),
+            ("khoa", None, None),
+            ("da_tn_truoc_do", None, None),
+            ("ghi_chu", None, None),
+            ("nguoi_nhan", None, None),
+            ("dan_toc", None, None),
+        ),
+        checklist_headers="display",
+    ),
+    # Bảng tổng hợp ngày có cột doc_<code>
+    "tong_ngay": Profile(
+        sheet_title="Data_TongNgay",
+        columns=(
+            ("ngay_nhan_hs", None, None),
+            ("khoa", "Niên Khóa", None),
+            ("ma_ho_so", None, None),
+            ("ma_so_hv", None, None),
+            ("ho_ten", None, None),
+            ("gioi_tinh", None, None),
+            ("dan_toc", None, None),
+            ("email_hoc_vien", None, None),
+            ("ngay_sinh", None, None),
+            ("so_dt", None, None),
+            ("nganh_nhap_hoc", None, None),
+            ("dot", None, None),
+            ("da_tn_truoc_do", "Đối tượng", None),
+            ("ghi_chu", None, None),
+            ("printed", None, None),
+        ),
+        checklist_headers="prefix",
+        zero_as_blank=True,
+    ),
+    # Bảng đơn giản (không có checklist)
+    "tong_hop": Profile(
+        sheet_title="TongHop",
+        columns=(
+            ("ma_ho_so", "Mã HS", None),
+            ("ho_ten", None, None),
+            ("ma_so_hv", "MSHV", None),
+            ("gioi_tinh", None, None),
+            ("dan_toc", None, None),
+            ("email_hoc_vien", None, None),
+            ("ngay_nhan_hs", None, None),
+            ("ngay_sinh", None, None),
+            ("nganh_nhap_hoc", "Ngành", None),
+            ("dot", None, None),
+            ("khoa", None, None),
+            ("nguoi_nhan", "Người nhận", None),
+            ("ghi_chu", None, None),
+        ),
+    ),
+}
+
+
+# ---------- Formatter theo kiểu (chọn 1 lần / cột) ----------
+def _fmt_text(v):
+    return "" if v is None else v
+
+def _fmt_dmy(v):
+    d = _parse_to_date(v)
+    return d.strftime("%d/%m/%Y") if d else ("" if v in (None, "") else str(v).strip())
+
+def _fmt_iso(v):
+    d = _parse_to_date(v)
+    return d.isoformat() if d else None
+
+def _fmt_bool(v):
+    return bool(v)
+
+def _fmt_int(v):
+    return v
+
+# (kind, format) -> formatter
+_FORMATTERS: Dict[Tuple[str, str], Callable[[Any], Any]] = {
+    ("text", "xlsx"): _fmt_text, ("text", "csv"): _fmt_text, ("text", "jsonl"): _fmt_text,
+    ("int", "xlsx"): _fmt_int, ("int", "csv"): _fmt_int, ("int", "jsonl"): _fmt_int,
+    ("date", "xlsx"): _parse_to_date, ("date", "csv"): _fmt_dmy, ("date", "jsonl"): _fmt_iso,
+    ("dmy", "xlsx"): _fmt_dmy, ("dmy", "csv"): _fmt_dmy, ("dmy", "jsonl"): _fmt_dmy,
+    ("gender", "xlsx"): _norm_gender, ("gender", "csv"): _norm_gender, ("gender", "jsonl"): _norm_gender,
+    ("bool", "xlsx"): _fmt_bool, ("bool", "csv"): lambda v: "1" if v else "0", ("bool", "jsonl"): _fmt_bool,
+}
+
+
+def _compile_getter(field: str, source: str, fields: Optional[Sequence[str]] = None) -> Callable[[Any], Any]:
+    """
+    Extractor biên dịch sẵn cho 1 cột:
+      - "obj"  : attrgetter (ORM/Applicant)
+      - "dict" : dict.get
+      - "tuple": itemgetter theo vị trí field trong `fields` (kết quả with_entities)
+    """
+    if source == "dict":
+        return lambda r, _f=field: r.get(_f)
+    if source == "tuple":
+        if fields and field in fields:
+            return itemgetter(list(fields).index(field))
+        return lambda r: None
+    try:
+        getter = attrgetter(field)
+    except Exception:
+        return lambda r: None
+    if hasattr(Applicant, field):
+        return getter
+    return lambda r, _f=field: getattr(r, _f, None)
+
+
+class CompiledProfile(NamedTuple):
+    headers: List[str]
+    kinds: List[str]
+    row_fn: Callable[[int, Any], list]
+    sheet_title: str
+
+
+def compile_profile(
+    profile: str,
+    fmt: str = "xlsx",
+    items: Optional[Sequence[ChecklistItem]] = None,
+    docs_by_mssv: Optional[Dict[str, Dict[str, int]]] = None,
+    source: str = "obj",
+    fields: Optional[Sequence[str]] = None,
+) -> CompiledProfile:
+    """Biên dịch profile thành headers + hàm dựng 1 dòng (extractor ∘ formatter)."""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown export profile: {profile}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    p = PROFILES[profile]
+
+    headers: List[str] = []
+    kinds: List[str] = []
+    cells: List[Optional[Tuple[Callable, Callable]]] = []  # None = STT
+    for key, header, kind in p.columns:
+        col = COLUMNS[key]
+        k = kind or col.kind
+        headers.append(header or col.header)
+        kinds.append(k)
+        if col.field is None:
+            cells.append(None)
+        else:
+            cells.append((_compile_getter(col.field, source, fields), _FORMATTERS[(k, fmt)]))
+
+    codes: List[str] = []
+    if p.checklist_headers and items:
+        for it in items:
+            codes.append(it.code)
+            if p.checklist_headers == "prefix":
+                headers.append(f"{DOC_PREFIX}{it.code}")
+            else:
+                headers.append(getattr(it, "display_name", None) or it.code)
+            kinds.append("int")
+
+    docs_by_mssv = docs_by_mssv or {}
+    get_mssv = _compile_getter("ma_so_hv", source, fields)
+    zero_blank = p.zero_as_blank
+    empty: Dict[str, int] = {}
+
+    def row_fn(idx: int, r) -> list:
+        out = [idx if cell is None else cell[1](cell[0](r)) for cell in cells]
+        if codes:
+            dm = docs_by_mssv.get(get_mssv(r), empty)
+            if zero_blank:
+                out.extend(dm.get(c, 0) or "" for c in codes)
+            else:
+                out.extend(int(dm.get(c, 0)) for c in codes)
+        return out
+
+    return CompiledProfile(headers, kinds, row_fn, p.sheet_title)
+
+
+def docs_map_by_mssv(docs: Iterable[ApplicantDoc]) -> Dict[str, Dict[str, int]]:
+    """{ ma_so_hv: { code: so_luong } }"""
+    out: Dict[str, Dict[str, int]] = {}
+    for d in docs or []:
+        out.setdefault(d.applicant_ma_so_hv, {})[d.code] = int(d.so_luong or 0)
+    return out
+
+
+# ---------- Writers ----------
+def _write_xlsx(cp: CompiledProfile, rows: Iterable[Any]) -> bytes:
+    data = [cp.row_fn(i, r) for i, r in enumerate(rows, start=1)]
+
+    # Độ rộng cột tính 1 lượt trên dữ liệu đã dựng (write-only phải đặt trước khi ghi)
+    ncol = len(cp.headers)
+    widths = [len(str(h)) for h in cp.headers]
+    for j in range(ncol):
+        if cp.kinds[j] == "date":
+            widths[j] = max(widths[j], 10)
+            continue
+        m = widths[j]
+        for row in data:
+            v = row[j]
+            if v is not None:
+                n = len(str(v))
+                if n > m:
+                    m = n
+        widths[j] = m
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(cp.sheet_title)
     ws.freeze_panes = "A2"
-    for col in ws.columns:
-        w = max(10, *(len(str(c.value)) if c.value else 0 for c in col)) + 2
-        ws.column_dimensions[col[0].column_letter].width = min(w, 40)
-
-
-# ---------- Export 1: có cột checklist ----------
-def build_excel_bytes_by_items(apps: List[Applicant], docs: List[ApplicantDoc], items: List[ChecklistItem]) -> bytes:
-    docs_by_mssv: Dict[str, Dict[str, int]] = {}
-    for d in docs:
-        docs_by_mssv.setdefault(d.applicant_ma_so_hv, {})[d.code] = int(d.so_luong or 0)
-
-    base_headers = [
-        "Ngày nhận HS", "Niên Khóa", "Mã hồ sơ", "Mã số HV", "Họ tên",
-        "Giới tính", "Dân tộc",               # 👈 THÊM "Dân tộc"
-        "Email học viên", "Ngày sinh", "Số ĐT", "Ngành nhập học",
-        "Đợt", "Đối tượng", "Ghi chú", "Printed"
-    ]
-    doc_headers = [f"{DOC_PREFIX}{it.code}" for it in items or []]
-    headers = base_headers + doc_headers
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Data_TongNgay"
-    ws.append(headers)
-
-    for a in apps:
-        dm = docs_by_mssv.get(a.ma_so_hv, {})
-        row = [
-            _parse_to_date(a.ngay_nhan_hs),
-            getattr(a, "khoa", ""),
-            a.ma_ho_so or "",
-            a.ma_so_hv or "",
-            a.ho_ten or "",
-            _norm_gender(getattr(a, "gioi_tinh", "")),
-            getattr(a, "dan_toc", "") or "",        # 👈 THÊM GIÁ TRỊ DÂN TỘC
-            getattr(a, "email_hoc_vien", "") or "",
-            _parse_to_date(getattr(a, "ngay_sinh", None)),
-            a.so_dt or "",
-            a.nganh_nhap_hoc or "",
-            a.dot or "",
-            a.da_tn_truoc_do or "",
-            a.ghi_chu or "",
-            bool(a.printed),
-        ]
-        for it in items or []:
-            qty = int(dm.get(it.code, 0))
-            row.append("" if qty == 0 else qty)
-        ws.append(row)
-
-    # format cột ngày
-    # Sau khi thêm "Dân tộc", "Ngày sinh" chuyển sang cột số 9
-    for col in (1, 9):  # 1: Ngày nhận HS, 9: Ngày sinh
-        for cell in ws.iter_cols(min_col=col, max_col=col, min_row=2):
-            for c in cell:
-                if isinstance(c.value, (date, datetime)):
-                    c.number_format = "dd/mm/yyyy"
-                    c.alignment = Alignment(horizontal="center")
-
-    _autosize(ws)
+    for j, w in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(j)].width = min(max(10, w + 2), 40)
+
+    ws.append(cp.headers)
+
+    date_cols = [j for j, k in enumerate(cp.kinds) if k == "date"]
+    if date_cols:
+        # style ngày dựng 1 lần rồi sao chép cho từng ô (rẻ hơn gán format/alignment mỗi ô)
+        proto = WriteOnlyCell(ws)
+        proto.number_format = "dd/mm/yyyy"
+        proto.alignment = Alignment(horizontal="center")
+        style = proto._style
+        for row in data:
+            for j in date_cols:
+                v = row[j]
+                if v is not None:
+                    c = WriteOnlyCell(ws, value=v)
+                    c._style = copy.copy(style)
+                    row[j] = c
+            ws.append(row)
+    else:
+        for row in data:
+            ws.append(row)
+
     out = BytesIO()
     wb.save(out)
-    out.seek(0)
     return out.getvalue()
 
 
-# ---------- Export 2: bảng đơn giản ----------
-def build_excel_bytes_simple(rows: Iterable[Any]) -> bytes:
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "TongHop"
+def _write_csv(cp: CompiledProfile, rows: Iterable[Any]) -> bytes:
+    buf = StringIO()
+    w = csv.writer(buf)
+    w.writerow(cp.headers)
+    row_fn = cp.row_fn
+    w.writerows(row_fn(i, r) for i, r in enumerate(rows, start=1))
+    # BOM để Excel mở đúng tiếng Việt
+    return ("\ufeff" + buf.getvalue()).encode("utf-8")
 
-    headers = [
-        "Mã HS", "Họ tên", "MSHV", "Giới tính", "Dân tộc",  # 👈 THÊM "Dân tộc"
-        "Email học viên",
-        "Ngày nhận HS", "Ngày sinh", "Ngành", "Đợt",
-        "Khóa", "Người nhận", "Ghi chú"
+
+def _write_jsonl(cp: CompiledProfile, rows: Iterable[Any]) -> bytes:
+    headers = cp.headers
+    row_fn = cp.row_fn
+    dumps = json.dumps
+    lines = [
+        dumps(dict(zip(headers, row_fn(i, r))), ensure_ascii=False, default=str)
+        for i, r in enumerate(rows, start=1)
     ]
-    ws.append(headers)
-
-    for a in rows:
-        get = a.get if isinstance(a, dict) else lambda k, d=None: getattr(a, k, d)
-        ws.append([
-            get("ma_ho_so"),
-            get("ho_ten"),
-            get("ma_so_hv"),
-            _norm_gender(get("gioi_tinh", "")),
-            get("dan_toc", "") or "",                  # 👈 GIÁ TRỊ DÂN TỘC
-            get("email_hoc_vien", ""),
-            _parse_to_date(get("ngay_nhan_hs")),
-            _parse_to_date(get("ngay_sinh")),
-            get("nganh_nhap_hoc"),
-            get("dot"),
-            get("khoa"),
-            get("nguoi_nhan_ky_ten"),
-            get("ghi_chu"),
-        ])
-
-    # format cột ngày
-    # Với cột mới "Dân tộc", "Ngày nhận HS" & "Ngày sinh" là cột 7 và 8
-    for col in (7, 8):
-        for cell in ws.iter_cols(min_col=col, max_col=col, min_row=2):
-            for c in cell:
-                if isinstance(c.value, (date, datetime)):
-                    c.number_format = "dd/mm/yyyy"
-                    c.alignment = Alignment(horizontal="center")
-
-    _autosize(ws)
-    out = BytesIO()
-    wb.save(out)
-    out.seek(0)
-    return out.getvalue()
+    return ("\n".join(lines) + ("\n" if lines else "")).encode("utf-8")
+
+
+_WRITERS = {"xlsx": _write_xlsx, "csv": _write_csv, "jsonl": _write_jsonl}
+
+
+def build_export_bytes(
+    profile: str,
+    rows: Iterable[Any],
+    fmt: str = "xlsx",
+    items: Optional[Sequence[ChecklistItem]] = None,
+    docs: Optional[Iterable[ApplicantDoc]] = None,
+    source: str = "obj",
+    fields: Optional[Sequence[str]] = None,
+) -> bytes:
+    """
+    Điểm vào chung: profile + định dạng -> bytes.
+    rows: Applicant (source="obj"), dict (source="dict") hoặc tuple theo `fields`.
+    """
+    cp = compile_profile(profile, fmt, items, docs_map_by_mssv(docs or []), source, fields)
+    t0 = time.perf_counter()
+    with span(fmt):  # Server-Timing: xlsx / csv / jsonl
+        data = _WRITERS[fmt](cp, rows)
+    observe_render(fmt, time.perf_counter() - t0, data)
+    return data
+
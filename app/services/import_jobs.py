@@ -0,0 +1,169 @@
+# app/services/import_jobs.py
+"""
+Job import chạy nền + tiến độ cho trang import poll.
+
+Upload chỉ lưu file ra thư mục tạm rồi trả job_id ngay; một worker đọc file
+theo chunk (import_reader.ChunkedReader) và đẩy từng chunk qua importer
+(validate + insert theo lô). Trạng thái job giữ trong RAM của process, job
+xong được giữ lại IMPORT_JOB_TTL_SEC để client lấy kết quả.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, Optional
+
+from app.db.session import SessionLocal
+from app.services.import_reader import ChunkedReader, file_kind
+
+log = logging.getLogger("import_jobs")
+
+IMPORT_JOB_WORKERS = int(os.getenv("IMPORT_JOB_WORKERS", "2"))
+IMPORT_JOB_TTL_SEC = int(os.getenv("IMPORT_JOB_TTL_SEC", "3600"))
+IMPORT_TMP_DIR = os.getenv("IMPORT_TMP_DIR") or None  # None -> thư mục tạm hệ thống
+
+_executor = ThreadPoolExecutor(max_workers=max(1, IMPORT_JOB_WORKERS), thread_name_prefix="import-job")
+_lock = threading.Lock()
+_jobs: Dict[str, "ImportJob"] = {}
+
+
+class ImportJob:
+    def __init__(self, kind: str, filename: str, owner_id: Optional[int]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.filename = filename
+        self.owner_id = owner_id
+        self.status = "queued"          # queued | running | done | failed | cancelled
+        self.cancel_requested = False
+        self.progress = 0.0
+        self.rows_read = 0
+        self.chunks = 0
+        self.report: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "filename": self.filename,
+            "status": self.status,
+            "progress": round(self.progress * 100, 1),
+            "rows_read": self.rows_read,
+            "chunks": self.chunks,
+            "report": dict(self.report),
+            "error": self.error,
+            "elapsed_sec": round((self.finished_at or time.time()) - self.created_at, 2),
+        }
+
+
+def _gc_locked():
+    now = time.time()
+    for jid in [j.id for j in _jobs.values() if j.finished_at and now - j.finished_at > IMPORT_JOB_TTL_SEC]:
+        _jobs.pop(jid, None)
+
+
+def save_upload(src: BinaryIO, filename: str) -> str:
+    """Chép file upload ra file tạm theo block (không đọc hết vào RAM)."""
+    suffix = os.path.splitext(filename or "")[1].lower()
+    fd, path = tempfile.mkstemp(prefix="import_", suffix=suffix, dir=IMPORT_TMP_DIR)
+    with os.fdopen(fd, "wb") as out:
+        shutil.copyfileobj(src, out, 1 << 20)
+    return path
+
+
+def job_counts() -> Dict[str, int]:
+    """Số job theo trạng thái (queued = đang chờ worker)."""
+    out = {"queued": 0, "running": 0, "done": 0, "failed": 0, "cancelled": 0}
+    with _lock:
+        for j in _jobs.values():
+            out[j.status] = out.get(j.status, 0) + 1
+    return out
+
+
+def get_job(job_id: str) -> Optional[ImportJob]:
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def cancel_job(job_id: str) -> Optional[ImportJob]:
+    """Yêu cầu dừng: worker dừng sau chunk đang chạy (các chunk trước đã commit)."""
+    with _lock:
+        job = _jobs.get(job_id)
+    if job is not None and job.finished_at is None:
+        job.cancel_requested = True
+    return job
+
+
+def start_import_job(
+    path: str,
+    filename: str,
+    owner_id: Optional[int],
+    make_importer: Callable[[Any], Any],
+    kind: str = "students",
+    validate_columns: Optional[Callable[[list], list]] = None,
+) -> ImportJob:
+    """
+    `make_importer(db)` trả object có .feed(DataFrame) và .report().
+    `validate_columns(columns)` trả danh sách cột bắt buộc còn thiếu (rỗng = ok).
+    File tạm `path` bị xoá khi job kết thúc.
+    """
+    ftype = file_kind(filename)
+    if ftype is None:
+        os.remove(path)
+        raise ValueError("Định dạng file không hỗ trợ. Hãy dùng .csv hoặc .xlsx")
+
+    job = ImportJob(kind, filename, owner_id)
+    with _lock:
+        _gc_locked()
+        _jobs[job.id] = job
+
+    def _run():
+        job.status = "running"
+        db = SessionLocal()
+        try:
+            reader = ChunkedReader(path, ftype)
+            importer = make_importer(db)
+            for df in reader:
+                if job.cancel_requested:
+                    break
+                if job.chunks == 0 and validate_columns is not None:
+                    missing = validate_columns(list(df.columns))
+                    if missing:
+                        raise ValueError(f"Thiếu cột bắt buộc: {', '.join(missing)}")
+                importer.feed(df)
+                job.chunks += 1
+                job.rows_read = reader.rows_read
+                job.progress = reader.progress
+                job.report = importer.report()
+            job.report = importer.report()
+            if job.cancel_requested:
+                job.status = "cancelled"
+            else:
+                job.progress = 1.0
+                job.status = "done"
+        except Exception as e:
+            db.rollback()
+            if isinstance(e, ValueError):  # lỗi dữ liệu/định dạng file
+                log.warning("Import job %s failed: %s", job.id, e)
+            else:
+                log.exception("Import job %s failed", job.id)
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            db.close()
+            job.finished_at = time.time()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    _executor.submit(_run)
+    return job
@@ -0,0 +1,135 @@
+# app/services/import_reader.py
+"""
+Đọc file import (CSV/XLSX) theo từng chunk DataFrame — bộ nhớ không phụ
+thuộc kích thước file.
+
+- CSV : pandas.read_csv(chunksize=...) trên file handle có đếm byte đã đọc
+- XLSX: openpyxl read_only + iter_rows(values_only=True), gom đủ chunk thì
+        dựng DataFrame (mọi giá trị là str, ô trống -> "")
+
+`ChunkedReader.progress` trả tỉ lệ 0..1 để báo tiến độ cho job.
+"""
+from __future__ import annotations
+
+import io
+import os
+from typing import Iterator, List, Optional
+from zipfile import BadZipFile
+
+import pandas as pd
+
+# Số dòng mỗi chunk
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "2000"))
+
+SUPPORTED_EXTS = (".csv", ".xlsx", ".xlsm")
+
+# Lỗi do nội dung file (CSV hỏng / sai encoding, XLSX không phải zip) — không phải lỗi code
+FILE_READ_ERRORS = (ValueError, UnicodeDecodeError, pd.errors.ParserError, BadZipFile)
+
+
+class _CountingFile(io.RawIOBase):
+    """Bọc file nhị phân, đếm số byte đã đọc để tính tiến độ."""
+
+    def __init__(self, f):
+        self._f = f
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = self._f.readinto(b)
+        self.bytes_read += n or 0
+        return n
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+
+def file_kind(filename: str) -> Optional[str]:
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".xlsx", ".xlsm")):
+        return "xlsx"
+    return None
+
+
+def _cell_str(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+
+class ChunkedReader:
+    def __init__(self, path: str, kind: str, chunksize: int = IMPORT_CHUNK_ROWS):
+        if kind not in ("csv", "xlsx"):
+            raise ValueError("Định dạng file không hỗ trợ. Hãy dùng .csv hoặc .xlsx")
+        self.path = path
+        self.kind = kind
+        self.chunksize = max(1, chunksize)
+        self.rows_read = 0
+        self.rows_total: Optional[int] = None
+        self.columns: List[str] = []
+        self._size = os.path.getsize(path) or 1
+        self._counter: Optional[_CountingFile] = None
+
+    @property
+    def progress(self) -> float:
+        if self.kind == "csv" and self._counter is not None:
+            return min(1.0, self._counter.bytes_read / self._size)
+        if self.rows_total:
+            return min(1.0, self.rows_read / self.rows_total)
+        return 0.0
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        return self._iter_csv() if self.kind == "csv" else self._iter_xlsx()
+
+    def _iter_csv(self) -> Iterator[pd.DataFrame]:
+        raw = _CountingFile(open(self.path, "rb"))
+        self._counter = raw
+        try:
+            buf = io.BufferedReader(raw, buffer_size=1 << 16)
+            for df in pd.read_csv(
+                buf, dtype=str, keep_default_na=False, chunksize=self.chunksize, encoding="utf-8-sig"
+            ):
+                if not self.columns:
+                    self.columns = [str(c) for c in df.columns]
+                self.rows_read += len(df)
+                yield df
+        finally:
+            raw.close()
+
+    def _iter_xlsx(self) -> Iterator[pd.DataFrame]:
+        from openpyxl import load_workbook
+
+        wb = load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            ws = wb.worksheets[0]
+            if ws.max_row:
+                self.rows_total = max(0, ws.max_row - 1)
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            self.columns = [_cell_str(h).strip() for h in header]
+            width = len(self.columns)
+            batch: List[list] = []
+            for r in rows:
+                vals = [_cell_str(v) for v in r[:width]]
+                if not any(vals):
+                    continue
+                vals += [""] * (width - len(vals))
+                batch.append(vals)
+                if len(batch) >= self.chunksize:
+                    self.rows_read += len(batch)
+                    yield pd.DataFrame(batch, columns=self.columns, dtype=str)
+                    batch = []
+            if batch:
+                self.rows_read += len(batch)
+                yield pd.DataFrame(batch, columns=self.columns, dtype=str)
+        finally:
+            wb.close()
@@ -13,6 +13,8 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfbase.pdfmetrics import stringWidth
 
 from ..core.config import settings
+from ..core.timing import timed
+from ..core.metrics import observed_render
 from ..models.applicant import Applicant, ApplicantDoc
 from ..models.checklist import ChecklistItem
 
@@ -295,6 +297,8 @@ def _onpage_footer_a5(canvas, doc, a: Applicant, location: str = "TP.HCM"):
 
 
 # ================== A4: 1 hồ sơ ==================
+@timed("pdf")
+@observed_render("pdf")
 def render_single_pdf(a: Applicant, items: List[ChecklistItem], docs: List[ApplicantDoc]) -> bytes:
     _register_font_times()
     buf = io.BytesIO()
@@ -364,6 +368,8 @@ def render_single_pdf(a: Applicant, items: List[ChecklistItem], docs: List[Appli
 
 
 # ================== A4: in gộp ==================
+@timed("pdf")
+@observed_render("pdf")
 def render_batch_pdf(
     apps: List[Applicant],
     items_by_version: Dict[int, List[ChecklistItem]],
@@ -458,6 +464,8 @@ def _build_rows_nonzero(items: List[ChecklistItem], docs: List[ApplicantDoc]):
 # =======================================================
 
 
+@timed("pdf")
+@observed_render("pdf")
 def render_single_pdf_a5(a: Applicant, items: List[ChecklistItem], docs: List[ApplicantDoc]) -> bytes:
     """
     A5 ngang, lề sát, intro sát tiêu đề để kéo toàn trang lên trên.
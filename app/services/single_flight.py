@@ -0,0 +1,112 @@
+# app/services/single_flight.py
+"""
+Single-flight cho các request sinh file nặng (export Excel, in PDF gộp).
+
+Nhiều người bấm cùng một export/in cho cùng một ngày gần như đồng thời:
+request đầu tiên (leader) tính toán, các request trùng key đứng chờ và dùng
+chung kết quả. Kết quả được giữ thêm một thời gian ngắn (TTL) để các lần
+bấm lại ngay sau đó không phải render lại.
+
+Key nên gồm: tên endpoint + tham số đã chuẩn hoá + "data version" của tập dữ
+liệu (xem `export_cache.source_fingerprint`) để dữ liệu đổi là key đổi theo.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+# Có thể chỉnh qua ENV; TTL=0 -> chỉ gộp request đồng thời, không cache
+SINGLE_FLIGHT_TTL_SEC = float(os.getenv("SINGLE_FLIGHT_TTL_SEC", "30"))
+SINGLE_FLIGHT_MAX_ENTRIES = int(os.getenv("SINGLE_FLIGHT_MAX_ENTRIES", "32"))
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Gộp các lời gọi trùng key. Route sync chạy trong threadpool nên dùng
+    threading (không dùng asyncio) để chờ.
+    """
+
+    def __init__(self, ttl_sec: float = SINGLE_FLIGHT_TTL_SEC, max_entries: int = SINGLE_FLIGHT_MAX_ENTRIES):
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._cache: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        # đếm để theo dõi hiệu quả
+        self.hits = 0      # lấy từ cache ngắn hạn
+        self.shared = 0    # chờ và dùng chung kết quả của leader
+        self.misses = 0    # phải tính mới
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                expires, value = hit
+                if expires > now:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._cache[key]
+
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.misses += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            # lỗi chỉ chia sẻ cho các request đang chờ, không cache
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                if call.error is None and self.ttl_sec > 0:
+                    self._cache[key] = (time.monotonic() + self.ttl_sec, call.result)
+                    self._cache.move_to_end(key)
+                    while len(self._cache) > self.max_entries:
+                        self._cache.popitem(last=False)
+            call.done.set()
+        return call.result
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "shared": self.shared,
+                "misses": self.misses,
+                "in_flight": len(self._calls),
+                "cached": len(self._cache),
+            }
+
+
+# Dùng chung cho export/batch
+export_flight = SingleFlight()
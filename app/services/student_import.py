@@ -0,0 +1,215 @@
+# app/services/student_import.py
+"""
+Import học viên (bảng students) từ CSV/XLSX theo kiểu vector hoá.
+
+Thay vòng `iterrows()` + 1 câu SELECT mỗi dòng bằng pipeline theo lô:
+  1) chuẩn hoá tên cột + trim trên cả cột DataFrame
+  2) dòng thiếu mã/họ tên -> invalid; trùng mã trong file -> pandas duplicated()
+  3) mã đã có trong DB -> 1 câu IN mỗi chunk
+  4) INSERT executemany theo chunk, commit mỗi chunk
+
+`StudentImporter.feed(df)` nhận từng DataFrame (cả file hoặc từng chunk),
+giữ tập mã đã gặp giữa các lần gọi để phát hiện trùng xuyên chunk.
+
+mode="upsert": mã đã có thì cập nhật thay vì bỏ qua — so row hash với bản
+trong DB, chỉ upsert dòng mới/đổi và ghi audit diff cho dòng đổi. Ô trống
+không ghi đè giá trị đang có.
+"""
+from __future__ import annotations
+
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+import pandas as pd
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import Student
+from app.services.audit import write_audit_many
+from app.services.upsert import fetch_existing, norm_value, row_diff, row_hash, upsert_rows
+
+# Số dòng mỗi lần INSERT + commit
+STUDENT_IMPORT_CHUNK = int(os.getenv("STUDENT_IMPORT_CHUNK", "1000"))
+# Kích thước danh sách IN khi kiểm tra tồn tại
+IN_CHUNK = 500
+
+STUDENT_COLUMNS = [
+    "student_code", "full_name", "dob", "gender", "phone", "email",
+    "id_number", "address", "dan_toc", "note",
+]
+REQUIRED_COLUMNS = {"student_code", "full_name"}
+# Cột được ghi đè khi upsert (không đụng student_code / người tạo)
+UPDATE_COLUMNS = [c for c in STUDENT_COLUMNS if c != "student_code"]
+IMPORT_MODES = ("insert", "upsert")
+# Tên cột thay thế trong file -> tên chuẩn
+COLUMN_ALIASES = {"Dân tộc": "dan_toc"}
+
+
+def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Trim tên cột, đổi alias, bổ sung cột thiếu, trim giá trị (theo cột)."""
+    df = df.rename(columns=lambda c: str(c).strip())
+    for alias, name in COLUMN_ALIASES.items():
+        if alias in df.columns:
+            if name in df.columns:
+                # giữ giá trị cột chuẩn, thiếu thì lấy từ alias
+                std = df[name].fillna("").astype(str).str.strip()
+                df[name] = std.where(std != "", df[alias])
+            else:
+                df = df.rename(columns={alias: name})
+    out = pd.DataFrame(index=df.index)
+    for col in STUDENT_COLUMNS:
+        if col in df.columns:
+            out[col] = df[col].fillna("").astype(str).str.strip()
+        else:
+            out[col] = ""
+    return out
+
+
+def missing_required(columns) -> List[str]:
+    cols = {str(c).strip() for c in columns}
+    return sorted(REQUIRED_COLUMNS - cols)
+
+
+class StudentImporter:
+    def __init__(
+        self,
+        db: Session,
+        created_by_user_id: Optional[int],
+        chunk_size: int = STUDENT_IMPORT_CHUNK,
+        mode: str = "insert",
+        request=None,
+    ):
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"mode phải là một trong: {', '.join(IMPORT_MODES)}")
+        self.db = db
+        self.created_by_user_id = created_by_user_id
+        self.chunk_size = max(1, chunk_size)
+        self.mode = mode
+        self.request = request
+        self._seen: Set[str] = set()
+        self.total = 0
+        self.created = 0
+        self.updated = 0      # upsert: có thay đổi
+        self.unchanged = 0    # upsert: trùng hash, bỏ qua
+        self.skipped = 0      # insert: đã tồn tại trong DB
+        self.duplicated = 0   # trùng mã trong file
+        self.invalid = 0      # thiếu mã / họ tên
+
+    # ---------- internal ----------
+    def _existing(self, codes: List[str]) -> Set[str]:
+        found: Set[str] = set()
+        for i in range(0, len(codes), IN_CHUNK):
+            part = codes[i:i + IN_CHUNK]
+            found.update(
+                r[0] for r in self.db.query(Student.student_code).filter(Student.student_code.in_(part)).all()
+            )
+        return found
+
+    def _insert_chunk(self, records: List[Dict[str, str]]) -> int:
+        """INSERT 1 chunk + commit; đụng unique (import song song) thì lọc lại 1 lần."""
+        for attempt in range(2):
+            if not records:
+                return 0
+            try:
+                self.db.execute(insert(Student), records)
+                self.db.commit()
+                return len(records)
+            except IntegrityError:
+                self.db.rollback()
+                if attempt:
+                    raise
+                exists = self._existing([r["student_code"] for r in records])
+                self.skipped += sum(1 for r in records if r["student_code"] in exists)
+                records = [r for r in records if r["student_code"] not in exists]
+        return 0
+
+    # ---------- API ----------
+    def feed(self, raw: pd.DataFrame) -> None:
+        df = normalize_columns(raw)
+        self.total += len(df)
+
+        valid = (df["student_code"] != "") & (df["full_name"] != "")
+        self.invalid += int((~valid).sum())
+        df = df[valid]
+
+        # trùng trong file (kể cả với chunk trước)
+        dup = df.duplicated("student_code", keep="first") | df["student_code"].isin(self._seen)
+        self.duplicated += int(dup.sum())
+        df = df[~dup]
+        self._seen.update(df["student_code"].tolist())
+
+        if df.empty:
+            return
+        if self.mode == "upsert":
+            self._feed_upsert(df)
+            return
+
+        exists = self._existing(df["student_code"].tolist())
+        if exists:
+            is_old = df["student_code"].isin(exists)
+            self.skipped += int(is_old.sum())
+            df = df[~is_old]
+
+        df = df.assign(created_by_user_id=self.created_by_user_id)
+        records = df.to_dict("records")
+        for i in range(0, len(records), self.chunk_size):
+            self.created += self._insert_chunk(records[i:i + self.chunk_size])
+
+    def _feed_upsert(self, df: pd.DataFrame) -> None:
+        table = Student.__table__
+        now = datetime.now()
+        records = df.to_dict("records")
+        for i in range(0, len(records), self.chunk_size):
+            part = records[i:i + self.chunk_size]
+            old = fetch_existing(self.db, table, "student_code", [r["student_code"] for r in part], UPDATE_COLUMNS)
+            rows, audits = [], []
+            created = 0
+            for r in part:
+                prev = old.get(r["student_code"])
+                if prev is not None:
+                    # ô trống / cột không có trong file -> giữ giá trị cũ
+                    r = {**r, **{c: prev.get(c) for c in UPDATE_COLUMNS if norm_value(r[c]) is None}}
+                    if row_hash(prev, UPDATE_COLUMNS) == row_hash(r, UPDATE_COLUMNS):
+                        self.unchanged += 1
+                        continue
+                rows.append({**r, "created_by_user_id": self.created_by_user_id, "updated_at": now})
+                if prev is None:
+                    created += 1
+                    continue
+                diff = row_diff(prev, r, UPDATE_COLUMNS)
+                audits.append({
+                    "action": "UPDATE",
+                    "target_type": "Student",
+                    "target_id": r["student_code"],
+                    "prev_values": {c: v[0] for c, v in diff.items()},
+                    "new_values": {**{c: v[1] for c, v in diff.items()}, "source": "import_upsert"},
+                })
+            if not rows:
+                continue
+            upsert_rows(self.db, table, rows, ["student_code"], UPDATE_COLUMNS + ["updated_at"])
+            write_audit_many(self.db, audits, request=self.request)
+            self.db.commit()
+            self.created += created
+            self.updated += len(audits)
+
+    def report(self) -> Dict[str, int]:
+        return {
+            "mode": self.mode,
+            "total": self.total,
+            "created": self.created,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "skipped": self.skipped,
+            "duplicated": self.duplicated,
+            "invalid": self.invalid,
+        }
+
+
+def report_message(r: Dict[str, int]) -> str:
+    if r.get("mode") == "upsert":
+        head = f"Tạo {r['created']} học viên mới, cập nhật {r['updated']}, {r['unchanged']} không đổi, "
+    else:
+        head = f"Tạo {r['created']} học viên mới, bỏ qua {r['skipped']} (đã tồn tại), "
+    return head + f"{r['duplicated']} dòng trùng mã trong file, {r['invalid']} dòng thiếu mã/họ tên."
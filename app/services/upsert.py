@@ -0,0 +1,110 @@
+# app/services/upsert.py
+"""
+Upsert hàng loạt dùng cú pháp riêng của từng DB + phát hiện thay đổi bằng row hash.
+
+- MySQL : INSERT ... ON DUPLICATE KEY UPDATE col = VALUES(col)
+- SQLite: INSERT ... ON CONFLICT (key) DO UPDATE SET col = excluded.col
+
+Import lại file đã sửa: chỉ dòng mới hoặc có hash khác bản trong DB mới
+được gửi xuống DB, dòng y hệt bỏ qua; audit chỉ ghi diff các cột đổi.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Sequence
+
+from sqlalchemy import Table
+from sqlalchemy.orm import Session
+
+# Số dòng mỗi câu upsert
+UPSERT_BATCH = int(os.getenv("UPSERT_BATCH", "1000"))
+
+
+def norm_value(v: Any) -> Any:
+    """Chuẩn hoá giá trị trước khi so/ băm: '' -> None, date -> ISO, trim chuỗi."""
+    if v is None:
+        return None
+    if isinstance(v, datetime):
+        return v.date().isoformat() if v.time() == datetime.min.time() else v.isoformat()
+    if isinstance(v, date):
+        return v.isoformat()
+    if isinstance(v, str):
+        s = v.strip()
+        return s or None
+    return v
+
+
+def row_hash(values: Dict[str, Any], cols: Sequence[str]) -> str:
+    raw = json.dumps([norm_value(values.get(c)) for c in cols], ensure_ascii=False, default=str, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def row_diff(old: Dict[str, Any], new: Dict[str, Any], cols: Sequence[str]) -> Dict[str, List[Any]]:
+    """Diff gọn {cột: [cũ, mới]} chỉ cho cột đã đổi."""
+    out = {}
+    for c in cols:
+        a, b = norm_value(old.get(c)), norm_value(new.get(c))
+        if a != b:
+            out[c] = [a, b]
+    return out
+
+
+def upsert_rows(
+    db: Session,
+    table: Table,
+    rows: List[Dict[str, Any]],
+    key_cols: Sequence[str],
+    update_cols: Sequence[str],
+    batch_size: int = UPSERT_BATCH,
+) -> int:
+    """
+    INSERT các dòng; trùng khoá (`key_cols` là PK/UNIQUE) thì UPDATE `update_cols`.
+    Mọi dict trong `rows` phải có cùng tập key. Không commit.
+    """
+    if not rows:
+        return 0
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        raise NotImplementedError(f"Upsert chưa hỗ trợ DB '{dialect}'")
+
+    stmt = dialect_insert(table)
+    if dialect == "mysql":
+        stmt = stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update_cols})
+    else:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key_cols),
+            set_={c: stmt.excluded[c] for c in update_cols},
+        )
+
+    for i in range(0, len(rows), batch_size):
+        db.execute(stmt, rows[i:i + batch_size])
+    return len(rows)
+
+
+def fetch_existing(
+    db: Session,
+    table: Table,
+    key_col: str,
+    keys: Iterable[Any],
+    cols: Sequence[str],
+    chunk: int = 500,
+) -> Dict[Any, Dict[str, Any]]:
+    """{khoá: {cột: giá trị}} cho các khoá đã có — 1 câu IN mỗi chunk."""
+    keys = sorted({k for k in keys if k is not None})
+    key = table.c[key_col]
+    select_cols = [key] + [table.c[c] for c in cols if c != key_col]
+    out: Dict[Any, Dict[str, Any]] = {}
+    for i in range(0, len(keys), chunk):
+        part = keys[i:i + chunk]
+        for r in db.execute(table.select().with_only_columns(*select_cols).where(key.in_(part))).mappings():
+            out[r[key_col]] = dict(r)
+    return out
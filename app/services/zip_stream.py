@@ -0,0 +1,85 @@
+# app/services/zip_stream.py
+"""
+Ghi file .zip dạng stream: mỗi entry ghi xong là đẩy bytes ra client ngay,
+không giữ cả file zip trong RAM.
+
+- zipfile hỗ trợ ghi vào stream không seek được (dùng data descriptor).
+- PDF vốn đã nén -> mặc định ZIP_STORED, không tốn CPU nén lại.
+- Render song song (tuỳ chọn) với cửa sổ giới hạn: chỉ giữ tối đa
+  `workers * 2` file đang chờ ghi trong bộ nhớ.
+"""
+from __future__ import annotations
+
+import os
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Tuple
+
+# Số worker render cho zip; 1 = render tuần tự ngay trong generator
+ZIP_RENDER_WORKERS = max(1, int(os.getenv("ZIP_RENDER_WORKERS", "1")))
+
+
+class _ChunkSink:
+    """File-like chỉ có write(): gom bytes để generator lấy ra sau mỗi entry."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _iter_rendered(tasks: Iterable[Tuple[str, Callable[[], bytes]]], workers: int) -> Iterator[Tuple[str, bytes]]:
+    """Giữ nguyên thứ tự; với workers > 1 chỉ submit trước tối đa workers*2 task."""
+    if workers <= 1:
+        for name, fn in tasks:
+            yield name, fn()
+        return
+
+    window = workers * 2
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="zip-render") as pool:
+        pending: deque = deque()
+        for name, fn in tasks:
+            pending.append((name, pool.submit(fn)))
+            if len(pending) >= window:
+                n, fut = pending.popleft()
+                yield n, fut.result()
+        while pending:
+            n, fut = pending.popleft()
+            yield n, fut.result()
+
+
+def iter_zip(
+    tasks: Iterable[Tuple[str, Callable[[], bytes]]],
+    compression: int = zipfile.ZIP_STORED,
+    workers: int = ZIP_RENDER_WORKERS,
+) -> Iterator[bytes]:
+    """
+    `tasks`: (tên file trong zip, hàm render trả bytes).
+    Yield từng đoạn bytes của file zip theo thứ tự entry.
+    """
+    sink = _ChunkSink()
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(sink, mode="w", compression=compression, allowZip64=True) as zf:
+        for name, data in _iter_rendered(tasks, workers):
+            info = zipfile.ZipInfo(name, date_time=date_time)
+            info.compress_type = compression
+            zf.writestr(info, data)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    # central directory
+    tail = sink.drain()
+    if tail:
+        yield tail
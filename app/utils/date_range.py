@@ -0,0 +1,83 @@
+# app/utils/date_range.py
+"""
+Bộ lọc theo ngày dựa trên kiểu thật của cột (DATE hay DATETIME).
+
+Trước đây export/batch thử query theo khoảng datetime, rỗng thì query lại
+bằng `== d` -> ngày không có hồ sơ tốn 2 lần quét. Ở đây đọc kiểu cột trong
+DB (inspect 1 lần/engine, không được thì dùng kiểu khai báo trong model)
+rồi sinh đúng MỘT điều kiện khoảng dùng được index:
+  - DATE     : col >= d_from AND col < d_to   (tham số kiểu date)
+  - DATETIME : col >= d_from 00:00 AND col < d_to 00:00
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import Date, DateTime, and_, inspect, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+log = logging.getLogger("date_range")
+
+_lock = threading.Lock()
+# (id(engine), table, column) -> True nếu DATETIME/TIMESTAMP
+_is_datetime_cache: Dict[Tuple[int, str, str], bool] = {}
+
+
+def _declared_is_datetime(column) -> bool:
+    t = column.type
+    if isinstance(t, DateTime):
+        return True
+    if isinstance(t, Date):
+        return False
+    return "TIME" in str(t).upper()
+
+
+def column_is_datetime(bind: Optional[Engine], column) -> bool:
+    """
+    True nếu cột trong DB lưu cả giờ (DATETIME/TIMESTAMP).
+    `column`: thuộc tính model (Applicant.ngay_nhan_hs) hoặc Column.
+    """
+    col = getattr(column, "property", None)
+    col = col.columns[0] if col is not None else column
+    table = col.table.name
+    if bind is None:
+        return _declared_is_datetime(col)
+
+    key = (id(bind), table, col.name)
+    hit = _is_datetime_cache.get(key)
+    if hit is not None:
+        return hit
+
+    result = _declared_is_datetime(col)
+    try:
+        for c in inspect(bind).get_columns(table):
+            if c["name"] == col.name:
+                tname = str(c["type"]).upper()
+                result = "TIME" in tname  # DATETIME / TIMESTAMP
+                break
+    except Exception as e:  # DB chưa có bảng / không inspect được -> theo model
+        log.warning("Cannot inspect %s.%s, using model type: %s", table, col.name, e)
+    with _lock:
+        _is_datetime_cache[key] = result
+    return result
+
+
+def date_range_clause(db: Session, column, d_from: date, d_to: Optional[date] = None):
+    """
+    Điều kiện [d_from, d_to) theo ngày (d_to mặc định = d_from + 1 ngày).
+    Luôn là 1 range đơn -> MySQL dùng được index (ngay_nhan_hs, ...).
+    """
+    if d_to is None:
+        d_to = d_from + timedelta(days=1)
+    # get_bind() không kèm câu lệnh bị RoutingSession coi là ghi -> dính primary
+    # cả request; hỏi bind cho 1 SELECT để request đọc vẫn đi replica được.
+    if column_is_datetime(db.get_bind(clause=select(column)), column):
+        lo = datetime.combine(d_from, datetime.min.time())
+        hi = datetime.combine(d_to, datetime.min.time())
+    else:
+        lo, hi = d_from, d_to
+    return and_(column >= lo, column < hi)
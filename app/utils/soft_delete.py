@@ -4,7 +4,7 @@ from __future__ import annotations
 from typing import Any, Optional
 from fastapi import HTTPException
 from sqlalchemy.orm import Query
-from sqlalchemy.sql import and_
+from sqlalchemy.sql import Select, and_
 
 def _soft_delete_conds(model) -> list:
     """
@@ -30,6 +30,7 @@ def exclude_deleted(model_or_query: Any, maybe_query: Optional[Query] = None) ->
     """
     Dùng chuẩn:  exclude_deleted(Applicant, query)
     (Giữ tương thích cũ: exclude_deleted(query) nếu trước đây anh từng gọi vậy.)
+    Với select() (đường async) thì bắt buộc truyền model: exclude_deleted(Applicant, stmt).
 
     Trả về query đã thêm filter loại bỏ bản ghi đã xoá mềm.
     Không có cột nào liên quan -> trả nguyên query (không crash).
@@ -42,6 +43,9 @@ def exclude_deleted(model_or_query: Any, maybe_query: Optional[Query] = None) ->
         model = model_or_query
         q = maybe_query
 
+    if isinstance(q, Select):
+        conds = _soft_delete_conds(model) if model is not None else []
+        return q.where(and_(*conds)) if conds else q
     if not isinstance(q, Query):
         raise TypeError("exclude_deleted expects SQLAlchemy Query")
 
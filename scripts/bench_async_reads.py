@@ -0,0 +1,185 @@
+# scripts/bench_async_reads.py
+"""
+Load test đường đọc sync vs async cho truy vấn của GET /applicants/search.
+
+  sync : def + Session (db.query ... count/offset/limit) — chạy trong threadpool
+         của anyio (mặc định 40 thread), như route cũ
+  async: async def + AsyncSession (select ... ) — chạy trên event loop, như route mới
+
+Seed N hồ sơ vào 1 file SQLite tạm rồi bắn --requests request với --concurrency
+request đồng thời (gọi thẳng ASGI, không socket). In req/s, p50/p95.
+
+SQLite nằm cùng máy nên cả hai đều nghẽn ở CPU/file DB, chênh lệch nhỏ; lợi ích
+thật là khi DB ở xa (chờ mạng không giữ thread). --rtt-ms giả lập độ trễ mạng
+mỗi câu SQL: sync ngủ chặn thread (như PyMySQL chờ socket), async await
+(như aiomysql). Hoặc trỏ --db-url sang MySQL test để đo thật.
+
+    python -m scripts.bench_async_reads --rows 200 --requests 2000 --concurrency 200 --rtt-ms 100 --pool-size 100
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import date, datetime
+
+from fastapi import Depends, FastAPI, Query
+from sqlalchemy import create_engine, func, or_, select
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.db.async_session import async_url
+from app.db.base import Base
+from app.models.applicant import Applicant, ApplicantDoc
+from app.models.checklist import ChecklistItem, ChecklistVersion
+from app.utils.soft_delete import exclude_deleted
+
+
+def _seed(url: str, rows: int) -> None:
+    eng = create_engine(url)
+    if eng.dialect.name == "sqlite":
+        # DEFAULT ... ON UPDATE chỉ MySQL hiểu
+        Applicant.__table__.c.updated_at.server_default = None
+    # chỉ các bảng bench cần (applicants có FK sang checklist_versions)
+    Base.metadata.create_all(eng, tables=[
+        ChecklistVersion.__table__, ChecklistItem.__table__, Applicant.__table__, ApplicantDoc.__table__,
+    ])
+    with Session(eng) as db:
+        if db.scalar(select(func.count()).select_from(Applicant)) != rows:
+            db.query(Applicant).delete()
+            db.add_all([
+                Applicant(
+                    ma_so_hv=f"23{i:08d}", ma_ho_so=f"HS{i:05d}", ho_ten=f"Nguyễn Văn {i}",
+                    ngay_nhan_hs=date(2025, 9, 1), dot="9", khoa="27",
+                    created_at=datetime(2025, 9, 1, 8, i // 60 % 60, i % 60),
+                    updated_at=datetime(2025, 9, 1, 8, 0, 0),
+                )
+                for i in range(rows)
+            ])
+            db.commit()
+    eng.dispose()
+
+
+def _payload(rows, total, page, size):
+    return {
+        "items": [{"ma_so_hv": a.ma_so_hv, "ma_ho_so": a.ma_ho_so, "ho_ten": a.ho_ten} for a in rows],
+        "page": page, "size": size, "total": total,
+    }
+
+
+def build_app(url: str, rtt_ms: float = 0.0, pool_size: int = 30) -> FastAPI:
+    asgi_app = FastAPI()
+    rtt = rtt_ms / 1000.0
+
+    SyncLocal = sessionmaker(bind=create_engine(url, pool_size=pool_size, max_overflow=0), autoflush=False)
+    AsyncLocal = async_sessionmaker(
+        create_async_engine(async_url(make_url(url)), pool_size=pool_size, max_overflow=0),
+        expire_on_commit=False,
+    )
+
+    def get_db():
+        db = SyncLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_adb():
+        async with AsyncLocal() as db:
+            yield db
+
+    @asgi_app.get("/sync/search")
+    def sync_search(q: str = Query(""), page: int = 1, size: int = 20, db: Session = Depends(get_db)):
+        query = exclude_deleted(Applicant, db.query(Applicant))
+        if q:
+            like = f"%{q}%"
+            query = query.filter(or_(Applicant.ho_ten.ilike(like), Applicant.ma_ho_so.ilike(like)))
+        if rtt:
+            time.sleep(rtt)
+        total = query.count()
+        if rtt:
+            time.sleep(rtt)
+        rows = query.order_by(Applicant.created_at.desc()).offset((page - 1) * size).limit(size).all()
+        return _payload(rows, total, page, size)
+
+    @asgi_app.get("/async/search")
+    async def async_search(q: str = Query(""), page: int = 1, size: int = 20, db: AsyncSession = Depends(get_adb)):
+        stmt = exclude_deleted(Applicant, select(Applicant))
+        if q:
+            like = f"%{q}%"
+            stmt = stmt.where(or_(Applicant.ho_ten.ilike(like), Applicant.ma_ho_so.ilike(like)))
+        if rtt:
+            await asyncio.sleep(rtt)
+        total = await db.scalar(select(func.count()).select_from(stmt.subquery()))
+        if rtt:
+            await asyncio.sleep(rtt)
+        rows = (await db.scalars(
+            stmt.order_by(Applicant.created_at.desc()).offset((page - 1) * size).limit(size)
+        )).all()
+        return _payload(rows, total, page, size)
+
+    return asgi_app
+
+
+async def _run(asgi_app, path: str, n: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    lat = []
+    status = []
+
+    async def one(i: int):
+        qs = f"q=V%C4%83n%20{i % 50}&page={1 + i % 3}".encode()
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+            "query_string": qs, "headers": [(b"host", b"bench")],
+            "server": ("bench", 80), "client": ("127.0.0.1", 5000),
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+
+        async with sem:
+            t0 = time.perf_counter()
+            await asgi_app(scope, receive, send)
+            lat.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    dt = time.perf_counter() - t0
+    assert set(status) == {200}, set(status)
+    lat.sort()
+    return n / dt, statistics.median(lat), lat[int(len(lat) * 0.95) - 1]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db-url", default=None, help="mặc định: SQLite tạm")
+    ap.add_argument("--rows", type=int, default=2000)
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=100)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--pool-size", type=int, default=30, help="cùng pool cho cả hai (mặc định = 10 + 20 overflow)")
+    ap.add_argument("--rtt-ms", type=float, default=0.0, help="giả lập độ trễ mạng mỗi câu SQL")
+    args = ap.parse_args()
+
+    url = args.db_url or "sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_async_reads.db")
+    _seed(url, args.rows)
+    asgi_app = build_app(url, args.rtt_ms, args.pool_size)
+
+    for name, path in (("sync  (def + threadpool)", "/sync/search"), ("async (async def + AsyncSession)", "/async/search")):
+        async def bench():
+            await _run(asgi_app, path, 100, args.concurrency)  # warm-up
+            return [await _run(asgi_app, path, args.requests, args.concurrency) for _ in range(args.repeat)]
+
+        rps, p50, p95 = max(asyncio.run(bench()))
+        print(f"{name:34s} {rps:8.0f} req/s   p50 {p50:7.1f} ms   p95 {p95:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
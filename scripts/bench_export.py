@@ -0,0 +1,114 @@
+# scripts/bench_export.py
+"""
+Benchmark engine export (app/services/export_service.py).
+
+So sánh builder cũ (Workbook thường, getattr + parse ngày từng ô, vòng lặp
+định dạng cột ngày và auto-width đọc lại toàn bộ sheet) với pipeline theo
+column-spec cho xlsx/csv/jsonl. Không cần DB: dùng Applicant transient.
+
+    python -m scripts.bench_export --rows 5000 --repeat 3
+"""
+import argparse
+import io
+import time
+from datetime import date, datetime
+
+from openpyxl import Workbook
+from openpyxl.styles import Alignment
+from openpyxl.utils import get_column_letter
+
+from app.models.applicant import Applicant, ApplicantDoc
+from app.models.checklist import ChecklistItem
+from app.services.checklist_service import DEFAULT_ITEMS
+from app.services.export_service import build_export_bytes, _parse_to_date, _norm_gender, DOC_PREFIX
+
+
+def _fake_data(n: int):
+    items = [ChecklistItem(code=code, display_name=name, order_no=i) for i, (code, name, _) in enumerate(DEFAULT_ITEMS, 1)]
+    apps, docs = [], []
+    for i in range(n):
+        mssv = f"23{i:08d}"
+        apps.append(Applicant(
+            ma_so_hv=mssv, ma_ho_so=f"HS{i:04d}", ngay_nhan_hs=date(2025, 9, 1),
+            ho_ten=f"Nguyễn Văn {i}", gioi_tinh="nam" if i % 2 else "nu", dan_toc="Kinh",
+            email_hoc_vien=f"hv{i}@example.com", ngay_sinh=date(2000, 1, 1 + i % 28),
+            so_dt="0900000000", nganh_nhap_hoc="Công nghệ thông tin", dot="9", khoa="27",
+            da_tn_truoc_do="THPT", ghi_chu="", nguoi_nhan_ky_ten="Cán bộ", printed=False,
+        ))
+        for it in items[: 5 + i % 5]:
+            docs.append(ApplicantDoc(applicant_ma_so_hv=mssv, code=it.code, so_luong=1))
+    return apps, docs, items
+
+
+def _legacy_tong_ngay(apps, docs, items) -> bytes:
+    """Bản sao builder cũ build_excel_bytes_by_items — chỉ để so sánh."""
+    docs_by_mssv = {}
+    for d in docs:
+        docs_by_mssv.setdefault(d.applicant_ma_so_hv, {})[d.code] = int(d.so_luong or 0)
+    wb = Workbook()
+    ws = wb.active
+    ws.append([
+        "Ngày nhận HS", "Niên Khóa", "Mã hồ sơ", "Mã số HV", "Họ tên", "Giới tính", "Dân tộc",
+        "Email học viên", "Ngày sinh", "Số ĐT", "Ngành nhập học", "Đợt", "Đối tượng", "Ghi chú", "Printed",
+    ] + [f"{DOC_PREFIX}{it.code}" for it in items])
+    for a in apps:
+        dm = docs_by_mssv.get(a.ma_so_hv, {})
+        row = [
+            _parse_to_date(a.ngay_nhan_hs), getattr(a, "khoa", ""), a.ma_ho_so or "", a.ma_so_hv or "",
+            a.ho_ten or "", _norm_gender(getattr(a, "gioi_tinh", "")), getattr(a, "dan_toc", "") or "",
+            getattr(a, "email_hoc_vien", "") or "", _parse_to_date(getattr(a, "ngay_sinh", None)),
+            a.so_dt or "", a.nganh_nhap_hoc or "", a.dot or "", a.da_tn_truoc_do or "", a.ghi_chu or "",
+            bool(a.printed),
+        ]
+        for it in items:
+            qty = int(dm.get(it.code, 0))
+            row.append("" if qty == 0 else qty)
+        ws.append(row)
+    for col in (1, 9):
+        for cell in ws.iter_cols(min_col=col, max_col=col, min_row=2):
+            for c in cell:
+                if isinstance(c.value, (date, datetime)):
+                    c.number_format = "dd/mm/yyyy"
+                    c.alignment = Alignment(horizontal="center")
+    ws.freeze_panes = "A2"
+    for col in ws.columns:
+        w = max(10, *(len(str(c.value)) if c.value else 0 for c in col)) + 2
+        ws.column_dimensions[get_column_letter(col[0].column)].width = min(w, 40)
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def _timeit(fn, repeat: int):
+    best = None
+    size = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        size = len(fn())
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, size
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=5000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    apps, docs, items = _fake_data(args.rows)
+    cases = [
+        ("legacy tong_ngay xlsx", lambda: _legacy_tong_ngay(apps, docs, items)),
+        ("engine tong_ngay xlsx", lambda: build_export_bytes("tong_ngay", apps, "xlsx", items=items, docs=docs)),
+        ("engine ho_so     xlsx", lambda: build_export_bytes("ho_so", apps, "xlsx", items=items, docs=docs)),
+        ("engine ho_so     csv ", lambda: build_export_bytes("ho_so", apps, "csv", items=items, docs=docs)),
+        ("engine ho_so     jsonl", lambda: build_export_bytes("ho_so", apps, "jsonl", items=items, docs=docs)),
+    ]
+    print(f"rows={args.rows} repeat={args.repeat} (best of)")
+    for name, fn in cases:
+        sec, size = _timeit(fn, args.repeat)
+        print(f"  {name:24s} {sec * 1000:9.1f} ms  {args.rows / sec:9.0f} rows/s  {size / 1024:8.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
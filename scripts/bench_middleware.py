@@ -0,0 +1,159 @@
+# scripts/bench_middleware.py
+"""
+Benchmark chuỗi middleware cho 1 route API tầm thường (GET /api/ping).
+
+  before: SessionMiddleware của Starlette + 3 @app.middleware("http")
+          (correlation id, idle timeout, ép đổi mật khẩu) như main.py cũ
+  after : DirtySessionMiddleware + RequestPolicyMiddleware (ASGI thuần)
+
+Gọi thẳng ASGI trong 1 event loop (không socket) nên đo đúng phần overhead
+của middleware; request mang cookie session của user đã đăng nhập.
+
+    python -m scripts.bench_middleware --requests 5000 --repeat 3
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from base64 import b64encode
+from time import time as _now
+
+import itsdangerous
+from fastapi import FastAPI, Request
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import JSONResponse, RedirectResponse
+
+from app.core.request_policy import RequestPolicyMiddleware
+from app.core.session import DirtySessionMiddleware
+
+SECRET = "bench-secret"
+IDLE = 3600
+WHITELIST_PREFIXES = (
+    "/compilation.html", "/ams_home.html", "/login", "/api/login", "/logout", "/api/logout",
+    "/health", "/api/health", "/auth_login.html", "/hutech.png", "/favicon", "/static", "/assets",
+    "/journal.html", "/account", "/account/change-password",
+)
+STATIC_EXTS = (".css", ".js", ".png", ".jpg", ".jpeg", ".svg", ".ico", ".map", ".woff", ".woff2", ".ttf", ".html")
+ENFORCE_CHANGE_WHITELIST = (
+    "/account", "/account/change-password", "/api/account/change-password", "/login", "/api/login",
+    "/logout", "/api/logout", "/health", "/api/health", "/auth_login.html", "/hutech.png", "/favicon",
+    "/static", "/assets", "/journal.html",
+)
+
+
+def _ping_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+def build_before() -> FastAPI:
+    app = _ping_app()
+    app.add_middleware(SessionMiddleware, secret_key=SECRET, max_age=7 * 86400, same_site="lax")
+
+    @app.middleware("http")
+    async def add_correlation_id(request: Request, call_next):
+        cid = request.headers.get("X-Correlation-ID") or str(uuid.uuid4())
+        request.state.correlation_id = cid
+        resp = await call_next(request)
+        resp.headers["X-Correlation-ID"] = cid
+        return resp
+
+    @app.middleware("http")
+    async def idle_timeout_middleware(request: Request, call_next):
+        path = request.url.path
+        if path.startswith(WHITELIST_PREFIXES) or path.lower().endswith(STATIC_EXTS):
+            return await call_next(request)
+        if "session" not in request.scope:
+            return await call_next(request)
+        sess = request.session
+        if sess.get("uid"):
+            now = int(_now())
+            last = int(sess.get("_last_seen") or 0)
+            if last and now - last > IDLE:
+                sess.clear()
+                return JSONResponse({"detail": "expired"}, status_code=401)
+            sess["_last_seen"] = now
+        return await call_next(request)
+
+    @app.middleware("http")
+    async def enforce_first_change_password(request: Request, call_next):
+        path = request.url.path
+        if path.startswith(ENFORCE_CHANGE_WHITELIST) or path.lower().endswith(STATIC_EXTS):
+            return await call_next(request)
+        sess = request.session if "session" in request.scope else None
+        if sess and sess.get("uid") and sess.get("must_change_password"):
+            return RedirectResponse(url="/account?first=1", status_code=302)
+        return await call_next(request)
+
+    return app
+
+
+def build_after() -> FastAPI:
+    from app.routers.auth import touch_last_seen
+
+    app = _ping_app()
+    app.add_middleware(
+        RequestPolicyMiddleware,
+        idle_timeout=IDLE,
+        idle_whitelist=WHITELIST_PREFIXES,
+        change_whitelist=ENFORCE_CHANGE_WHITELIST,
+        static_exts=STATIC_EXTS,
+        touch_last_seen=touch_last_seen,
+    )
+    app.add_middleware(DirtySessionMiddleware, secret_key=SECRET, max_age=7 * 86400, same_site="lax")
+    return app
+
+
+def _cookie() -> bytes:
+    data = {"uid": 1, "_last_seen": int(time.time()), "role": "Admin", "full_name": "Bench",
+            "username": "bench", "email": None, "must_change_password": False}
+    signed = itsdangerous.TimestampSigner(SECRET).sign(b64encode(json.dumps(data).encode("utf-8")))
+    return b"session=" + signed
+
+
+async def _run(app, n: int, cookie: bytes) -> float:
+    scope_base = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/api/ping", "raw_path": b"/api/ping", "root_path": "",
+        "query_string": b"", "server": ("bench", 80), "client": ("127.0.0.1", 5000),
+    }
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    t0 = time.perf_counter()
+    for _ in range(n):
+        scope = dict(scope_base, headers=[(b"host", b"bench"), (b"cookie", cookie)])
+        await app(scope, receive, send)
+    dt = time.perf_counter() - t0
+    assert set(status) == {200}, set(status)
+    return n / dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=5000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    cookie = _cookie()
+    cases = [("before (3x BaseHTTPMiddleware)", build_before()), ("after  (RequestPolicyMiddleware)", build_after())]
+    for name, app in cases:
+        asyncio.run(_run(app, 200, cookie))  # warm-up
+        best = max(asyncio.run(_run(app, args.requests, cookie)) for _ in range(args.repeat))
+        print(f"{name:36s} {best:10.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()